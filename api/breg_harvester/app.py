@@ -10,7 +10,10 @@ from werkzeug.exceptions import HTTPException, NotFound
 import breg_harvester.browser
 import breg_harvester.harvest
 import breg_harvester.jobs_queue
+import breg_harvester.parsers
 import breg_harvester.scheduler
+import breg_harvester.sessions
+import breg_harvester.vocabs
 from breg_harvester.config import AppConfig, app_config_from_env
 
 STATIC_FOLDER = "spa"
@@ -19,6 +22,7 @@ BIND_HOST = "0.0.0.0"
 PREFIX_HARVEST = "/api/harvest"
 PREFIX_SCHEDULER = "/api/scheduler"
 PREFIX_BROWSER = "/api/browser"
+PREFIX_VOCABULARY = "/api/vocabulary"
 
 _logger = logging.getLogger(__name__)
 
@@ -87,6 +91,9 @@ def create_app(test_config=None, with_scheduler=True):
     except OSError:
         pass
 
+    breg_harvester.sessions.init_sessions(app.config)
+    breg_harvester.parsers.init_parser_pool(app.config)
+
     if with_scheduler:
         breg_harvester.scheduler.init_scheduler(app)
 
@@ -102,6 +109,10 @@ def create_app(test_config=None, with_scheduler=True):
         breg_harvester.browser.blueprint,
         url_prefix=PREFIX_BROWSER)
 
+    app.register_blueprint(
+        breg_harvester.vocabs.blueprint,
+        url_prefix=PREFIX_VOCABULARY)
+
     breg_harvester.jobs_queue.init_app_redis(app)
 
     app.add_url_rule("/", view_func=catch_all, defaults={"path": ""})
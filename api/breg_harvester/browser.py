@@ -1,16 +1,23 @@
-import collections
-import enum
+import concurrent.futures
 import logging
 import pprint
-import urllib.request
+import time
+from concurrent.futures.process import BrokenProcessPool
 
-import timeout_decorator
+import redis
 from flask import Blueprint, current_app, jsonify, request
-from rdflib import Graph, Literal, URIRef
-from rdflib.namespace import DCAT, DCTERMS, SKOS
-from rdflib.plugin import PluginException
-
+from rdflib import Literal, URIRef
+from werkzeug.exceptions import BadRequest, ServiceUnavailable
+
+import breg_harvester.cache
+import breg_harvester.facets
+import breg_harvester.fulltext
+import breg_harvester.labels
+import breg_harvester.parsers
+import breg_harvester.sessions
 import breg_harvester.store
+import breg_harvester.utils
+from breg_harvester.facets import FilterKeys, get_datasets
 from breg_harvester.jobs_queue import get_redis
 
 _logger = logging.getLogger(__name__)
@@ -18,128 +25,276 @@ _logger = logging.getLogger(__name__)
 BLUEPRINT_NAME = "browser"
 blueprint = Blueprint(BLUEPRINT_NAME, __name__)
 
-_FORMAT_SERIALIZE = "turtle"
-_TIMEOUT_URLOPEN = 10
-_TIMEOUT_PARSE = 4
-_KEY_FAILED = "breg:harvester:term:failed"
-_PARSE_TRY_FORMATS = ["xml", "turtle", "json-ld", "nt"]
+_TIMEOUT_DEREF = 10
+_MAX_DEREF_BYTES = 16 * 1024 * 1024
+_CHUNK_SIZE = 64 * 1024
+_SNIFF_BYTES = 1024
 
-LoadGraphResult = collections.namedtuple(
-    "LoadGraphResult",
-    ["graph", "cache_hit", "parsed"])
+_ACCEPT_RDF = ", ".join([
+    "text/turtle",
+    "application/rdf+xml;q=0.9",
+    "application/ld+json;q=0.8",
+    "application/n-triples;q=0.7",
+    "*/*;q=0.1"
+])
 
+_CONTENT_TYPE_FORMATS = {
+    "text/turtle": "turtle",
+    "application/x-turtle": "turtle",
+    "text/n3": "n3",
+    "application/n-triples": "nt",
+    "application/rdf+xml": "xml",
+    "application/xml": "xml",
+    "text/xml": "xml",
+    "application/ld+json": "json-ld",
+    "application/json": "json-ld"
+}
+_DEFAULT_DEREF_CONCURRENCY = 8
+_DEFAULT_DEREF_DEADLINE = 5
+_LOCAL_FAILED_TTL = 60
+_NOT_CACHED = object()
 
-@timeout_decorator.timeout(_TIMEOUT_PARSE, use_signals=False)
-def _parse_with_timeout(data, frmt):
-    graph = Graph()
-    graph.parse(data=data, format=frmt)
-    return graph.serialize(destination=None, format=_FORMAT_SERIALIZE)
+# Terms are dereferenced in a process-wide pool so that the
+# terms that miss the deadline of a request keep being resolved
+# in the background and are available in the cache for the next request.
 
+_deref_lock = breg_harvester.utils.ProcessLock()
+_deref_executor = None
+_deref_futures = {}
+_deref_clients = {}
 
-def _parse_graph(graph, term):
-    url = str(term)
 
-    _logger.debug("Opening URL '%s'", url)
+def _format_from_content_type(content_type):
+    mime = (content_type or "").split(";")[0].strip().lower()
+    return _CONTENT_TYPE_FORMATS.get(mime)
 
-    with urllib.request.urlopen(url, timeout=_TIMEOUT_URLOPEN) as fh:
-        url_data = fh.read().decode("utf-8")
 
-    for frmt in _PARSE_TRY_FORMATS:
-        try:
-            _logger.debug("Parsing URL '%s' as %s", url, frmt)
-            parsed_data = _parse_with_timeout(data=url_data, frmt=frmt)
-            _logger.debug("URL '%s' contains %s", url, frmt)
-            graph.parse(data=parsed_data, format=_FORMAT_SERIALIZE)
-            return
-        except:
-            _logger.warning(
-                "Error parsing '%s' as '%s'",
-                url, frmt, exc_info=True)
+def _sniff_format(data):
+    """Guesses the RDF format from the first bytes of the document.
+    Returns None for documents that do not look like RDF (e.g. HTML pages)."""
 
-    raise Exception("Could not parse %s", term)
+    head = data[:_SNIFF_BYTES].lstrip(b"\xef\xbb\xbf \t\r\n")
+    head_lower = head.lower()
 
+    if head.startswith((b"{", b"[")):
+        return "json-ld"
 
-def _build_cache_key(term):
-    return f"breg:harvester:cache:{term.n3()}"
+    if head_lower.startswith((b"<!doctype html", b"<html")):
+        return None
 
+    if head.startswith(b"<?xml") or b"<rdf:rdf" in head_lower:
+        return "xml"
 
-def _set_graph_redis(graph, term, redis):
-    data = graph.serialize(destination=None, format=_FORMAT_SERIALIZE)
-    name = _build_cache_key(term=term)
-    _logger.debug("SET %s", name)
-    redis.set(name=name, value=data)
+    if head.startswith((b"@prefix", b"@base", b"<", b"_:", b"#")) \
+            or head_lower.startswith((b"prefix", b"base")):
+        return "turtle"
 
+    return None
 
-def _get_graph_redis(graph, term, redis):
-    name = _build_cache_key(term=term)
-    _logger.debug("GET %s", name)
-    data = redis.get(name=name)
-    assert data, f"Undefined key: {name}"
-    graph.parse(data=data, format=_FORMAT_SERIALIZE)
 
+def _download_term(url, deadline):
+    """Downloads the document of a term with content negotiation.
+    The download is aborted if it exceeds the deadline or the maximum size."""
 
-def _flag_parse_failed(term, redis):
-    val = term.n3()
-    _logger.debug("SADD :: %s :: %s", _KEY_FAILED, val)
-    redis.sadd(_KEY_FAILED, val)
+    started = time.time()
+    chunks = []
+    size = 0
 
+    _logger.debug("GET %s", url)
 
-def _parse_has_failed_before(term, redis):
-    val = term.n3()
-    res = redis.sismember(_KEY_FAILED, val)
-    _logger.debug("SISMEMBER :: %s :: %s = %s", _KEY_FAILED, val, res)
-    return res
+    session = breg_harvester.sessions.get_session(breg_harvester.sessions.SESSION_DEREF)
 
+    with session.get(url, headers={"Accept": _ACCEPT_RDF}, stream=True, timeout=deadline) as res:
+        res.raise_for_status()
 
-def _load_graph(term, redis, write_cache=True):
-    graph = Graph()
-    cache_hit = False
-    parsed = False
+        for chunk in res.iter_content(chunk_size=_CHUNK_SIZE):
+            size += len(chunk)
 
-    try:
-        _get_graph_redis(graph=graph, term=term, redis=redis)
-        cache_hit = True
-    except Exception as ex:
-        _logger.debug("Error loading term (%s) from Redis: %s", term, ex)
+            if size > _MAX_DEREF_BYTES:
+                raise Exception(f"Document of {url} exceeds {_MAX_DEREF_BYTES} bytes")
+
+            if time.time() - started > deadline:
+                raise TimeoutError(f"Timeout downloading {url}")
+
+            chunks.append(chunk)
+
+        return res.url, res.headers.get("Content-Type"), b"".join(chunks)
+
+
+def _parse_labels(term, deadline=_TIMEOUT_DEREF):
+    """Dereferences the term and parses its document once in the parser pool.
+    The format is taken from the Content-Type of the response or,
+    when missing or generic, sniffed from the first bytes of the document."""
+
+    started = time.time()
+    url, content_type, data = _download_term(str(term), deadline=deadline)
+    frmt = _format_from_content_type(content_type) or _sniff_format(data)
+
+    if not frmt:
+        raise Exception(f"Unknown RDF format for {term} (Content-Type: {content_type})")
+
+    for attempt in range(2):
+        remaining = deadline - (time.time() - started)
+
+        if remaining <= 0:
+            raise TimeoutError(f"Timeout dereferencing {term}")
 
-    if not cache_hit and not _parse_has_failed_before(term=term, redis=redis):
         try:
-            _parse_graph(graph=graph, term=term)
-            parsed = True
-        except:
-            _flag_parse_failed(term=term, redis=redis)
-            _logger.debug("Error parsing term (%s)", term, exc_info=True)
+            return breg_harvester.parsers.run_parser(
+                breg_harvester.parsers.parse_labels,
+                data, frmt, url, str(term),
+                deadline=remaining)
+        except BrokenProcessPool:
+            # The parse may have been lost with a process of the pool
+            # that died while parsing other documents: retry once in a new pool
+
+            if attempt > 0:
+                raise
+
+            _logger.warning("Parser pool broken, retrying: %s", term)
+
+
+def _get_deref_redis(redis_url):
+    with _deref_lock:
+        if redis_url not in _deref_clients:
+            _deref_clients[redis_url] = redis.from_url(redis_url)
+
+        return _deref_clients[redis_url]
+
+
+def _get_deref_executor(max_workers):
+    global _deref_executor
+
+    with _deref_lock:
+        if _deref_executor is None:
+            _deref_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, int(max_workers)),
+                thread_name_prefix="deref")
+
+        return _deref_executor
+
+
+def _dereference_term(term, redis_url, index_settings):
+    """Dereferences the term and indexes its labels (or flags it as failed).
+    Returns the labels or None if the term could not be parsed."""
+
+    index = breg_harvester.labels.LabelIndex(
+        _get_deref_redis(redis_url), **index_settings)
+
+    try:
+        labels = _parse_labels(term=term)
+    except BrokenProcessPool:
+        # The term itself may be fine: it is not flagged so that it is retried later
+        _logger.warning("Error parsing term (%s): parser pool broken", term)
+        return None
+    except:
+        index.flag_failed(term)
+        _logger.debug("Error parsing term (%s)", term, exc_info=True)
+        return None
+
+    index.save(term, labels)
+
+    return labels
+
+
+def _submit_dereference(term, redis_url, index_settings, max_workers):
+    """Schedules the dereference of a term unless it is already in flight."""
+
+    executor = _get_deref_executor(max_workers)
+
+    with _deref_lock:
+        future = _deref_futures.get(term)
+
+        if future is None:
+            future = executor.submit(_dereference_term, term, redis_url, index_settings)
+            _deref_futures[term] = future
+            future.add_done_callback(lambda _: _deref_futures.pop(term, None))
+
+    return future
+
+
+def _load_labels(terms, deadline=None):
+    """Returns a dict of term to labels for the given terms.
+    Index and failure lookups are batched; the missing terms are dereferenced
+    concurrently until the deadline (seconds) expires."""
+
+    app_config = current_app.config
 
-    if write_cache and not cache_hit and parsed:
-        _set_graph_redis(graph=graph, term=term, redis=redis)
+    deadline = deadline if deadline is not None else \
+        app_config.get("DEREF_DEADLINE", _DEFAULT_DEREF_DEADLINE)
 
-    if not cache_hit and not parsed:
-        graph = None
+    started = time.time()
+    local_cache = breg_harvester.cache.labels_cache
+    labels = {}
+    terms_remote = []
 
-    res = LoadGraphResult(graph=graph, cache_hit=cache_hit, parsed=parsed)
+    # Failed terms are also kept in the local cache (with a shorter TTL)
 
-    _logger.debug("Load result for term %s: %s", term, res)
+    for term in terms:
+        if term.__class__ is not URIRef:
+            continue
 
-    return res
+        cached = local_cache.get(term, _NOT_CACHED)
 
+        if cached is _NOT_CACHED:
+            terms_remote.append(term)
+        elif cached is not None:
+            labels[term] = cached
 
-def _term_to_dict(term, redis, extended=True, label_lang="en"):
+    if not terms_remote:
+        return labels
+
+    terms = terms_remote
+    index = breg_harvester.labels.get_label_index()
+    labels_remote = index.get(terms)
+    misses = [term for term in terms if term not in labels_remote]
+    failed = index.get_failed(misses)
+
+    for term in failed:
+        local_cache.set(term, None, ttl=_LOCAL_FAILED_TTL)
+
+    futures = {
+        term: _submit_dereference(
+            term,
+            redis_url=app_config.get("REDIS_URL"),
+            index_settings=index.settings,
+            max_workers=app_config.get("DEREF_CONCURRENCY", _DEFAULT_DEREF_CONCURRENCY))
+        for term in misses if term not in failed
+    }
+
+    timeout = max(0, deadline - (time.time() - started))
+    done, not_done = concurrent.futures.wait(futures.values(), timeout=timeout)
+
+    if not_done:
+        breg_harvester.cache.mark_response_incomplete()
+
+    for term, future in futures.items():
+        if future in done and not future.exception() and future.result():
+            labels_remote[term] = future.result()
+
+    for term, item in labels_remote.items():
+        local_cache.set(term, item)
+
+    labels.update(labels_remote)
+
+    _logger.debug(
+        "Loaded %s/%s remote terms (indexed=%s failed=%s background=%s) in %.3f s",
+        len(labels_remote), len(terms), len(terms) - len(misses),
+        len(failed), len(not_done), time.time() - started)
+
+    return labels
+
+
+def _term_to_dict(term, labels=None, label_lang="en"):
     ret = {
         "n3": term.n3(),
         "cls": term.__class__.__name__
     }
 
-    if not extended or term.__class__ is not URIRef:
+    if labels is None:
         return ret
 
-    load_res = _load_graph(term=term, redis=redis, write_cache=True)
-
-    if not load_res.graph:
-        return ret
-
-    labels = load_res.graph.preferredLabel(subject=term, lang=label_lang)
-    label = labels[0][1] if len(labels) > 0 else None
-    label_prop = labels[0][0] if len(labels) > 0 else None
+    label_prop, label = breg_harvester.labels.select_label(labels, lang=label_lang)
 
     ret.update({
         "label": label,
@@ -149,22 +304,54 @@ def _term_to_dict(term, redis, extended=True, label_lang="en"):
     return ret
 
 
-def _query_to_dicts(graph_query, idx):
-    store = breg_harvester.store.get_sparql_store()
+def _query_terms(graph_query, idx):
     identifier = current_app.config.get("GRAPH_URI")
-    graph = Graph(store, identifier=identifier)
+    key = (identifier, graph_query, idx)
+    terms = breg_harvester.cache.query_cache.get(key)
+
+    if terms is not None:
+        return terms
+
+    graph = breg_harvester.store.get_read_graph(identifier)
     qres = graph.query(graph_query)
-    terms = set(item[idx] for item in qres)
+    terms = list(set(item[idx] for item in qres))
+    breg_harvester.cache.query_cache.set(key, terms)
+
+    return terms
+
+
+def _query_to_dicts(graph_query, idx):
+    terms = _query_terms(graph_query, idx)
     extended = bool(request.args.get("ext", False))
-    redis = get_redis()
+    labels = _load_labels(terms) if extended else {}
 
     return [
-        _term_to_dict(term, redis=redis, extended=extended)
+        _term_to_dict(term, labels=labels.get(term))
         for term in terms
     ]
 
 
+@blueprint.before_request
+def init_local_caches():
+    breg_harvester.cache.init_local_caches(current_app.config)
+
+
+@blueprint.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    stats = breg_harvester.labels.get_label_index().stats()
+    stats["local"] = breg_harvester.cache.local_caches_stats()
+    return jsonify(stats)
+
+
+@blueprint.route("/http/stats", methods=["GET"])
+def get_http_stats():
+    """Connection pools of the API process that serves the request."""
+
+    return jsonify(breg_harvester.sessions.sessions_stats())
+
+
 @blueprint.route("/catalog/taxonomy", methods=["GET"])
+@breg_harvester.cache.versioned_response
 def get_catalog_taxonomies():
     graph_query = """
         PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -180,6 +367,7 @@ def get_catalog_taxonomies():
 
 
 @blueprint.route("/catalog/location", methods=["GET"])
+@breg_harvester.cache.versioned_response
 def get_catalog_locations():
     graph_query = """
         PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -196,6 +384,7 @@ def get_catalog_locations():
 
 
 @blueprint.route("/catalog/language", methods=["GET"])
+@breg_harvester.cache.versioned_response
 def get_catalog_languages():
     graph_query = """
         PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -212,6 +401,7 @@ def get_catalog_languages():
 
 
 @blueprint.route("/dataset/theme", methods=["GET"])
+@breg_harvester.cache.versioned_response
 def get_dataset_themes():
     graph_query = """
         PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -227,6 +417,7 @@ def get_dataset_themes():
 
 
 @blueprint.route("/catalog/publisher/type", methods=["GET"])
+@breg_harvester.cache.versioned_response
 def get_catalog_publisher_types():
     graph_query = """
         PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -244,108 +435,17 @@ def get_catalog_publisher_types():
     return jsonify(_query_to_dicts(graph_query, idx=2))
 
 
-class FilterKeys(enum.Enum):
-    CATALOG = "catalog"
-    DATASET = "dataset"
-    THEME_TAXONOMY = "themeTaxonomy"
-    LANGUAGE = "language"
-    THEME = "theme"
-    PUBLISHER = "publisher"
-    PUBLISHER_TYPE = "publisherType"
-    LOCATION = "location"
+_SEARCH_PREFIXES = """
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX dcat: <http://www.w3.org/ns/dcat#>
+    PREFIX dct: <http://purl.org/dc/terms/>
+    """
 
 
-def _get_datasets(graph, uris):
-    if len(uris) == 0:
-        return []
-
-    graph_query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX dcat: <http://www.w3.org/ns/dcat#>
-        PREFIX foaf: <http://xmlns.com/foaf/0.1/>
-        PREFIX dct: <http://purl.org/dc/terms/>
-        SELECT 
-            ?catalog 
-            ?dataset 
-            ?description 
-            ?identifier 
-            ?title 
-            ?distribution 
-            ?distributionURL 
-            ?distributionType 
-            ?datasetSpatial 
-            ?theme 
-            ?language
-            ?distributionDescription 
-        WHERE {{
-            ?catalog rdf:type dcat:Catalog .
-            ?dataset rdf:type dcat:Dataset . 
-            ?catalog dcat:dataset ?dataset .
-            ?dataset dct:description ?description .
-            ?dataset dct:identifier ?identifier .
-            ?dataset dct:title ?title .
-            ?dataset dcat:distribution ?distribution . 
-            ?distribution dcat:accessURL ?distributionURL .
-            ?distribution dcat:mediaType ?distributionType . 
-            ?dataset dct:spatial ?datasetSpatial . 
-            ?dataset dcat:theme ?theme . 
-            ?catalog dct:LinguisticSystem ?language .
-            OPTIONAL {{ ?distribution dct:description ?distributionDescription }} . 
-            FILTER (?dataset IN ({}))
-        }}
-        """.format(", ".join(uris))
-
-    qres = graph.query(graph_query)
-
-    datasets = {}
-
-    for item in qres:
-        dset_uri = item[1].n3()
-        dset = datasets.get(dset_uri, {})
-        dset["catalog"] = item[0].n3()
-        dset["description"] = dset.get("description", []) + [item[2]]
-        dset["identifier"] = dset.get("identifier", []) + [item[3]]
-        dset["title"] = dset.get("title", []) + [item[4]]
-        dset["location"] = dset.get("location", []) + [item[8].n3()]
-        dset["theme"] = dset.get("theme", []) + [item[9].n3()]
-        dset["language"] = dset.get("language", []) + [item[10].n3()]
-
-        distr_dict = dset.get("distribution", {})
-        distr_uri = item[5].n3()
-        distr_item = distr_dict.get(distr_uri, {})
-        distr_item["url"] = item[6].n3()
-        distr_item["type"] = item[7].n3()
-
-        if item[11]:
-            distr_item_descr = distr_item.get("description", [])
-            distr_item_descr.append(item[11].n3())
-            distr_item["description"] = list(set(distr_item_descr))
-
-        distr_dict[distr_uri] = distr_item
-        dset["distribution"] = distr_dict
-
-        datasets[dset_uri] = dset
-
-    for dset in datasets.values():
-        for key, val in dset.items():
-            if isinstance(val, list):
-                dset[key] = list(set(val))
-
-    return datasets
-
-
-@blueprint.route("/dataset/search", methods=["POST"])
-def search_datasets():
-    body = request.get_json()
-    limit = int(body.get("limit", 200))
-    filter_keys = list(FilterKeys)
-
-    select = " ".join([f"?{item.value}" for item in filter_keys])
-
-    filter_args = {
-        key: val for key, val in body.get("filters", {}).items()
-        if key in (item.value for item in filter_keys)
-    }
+def _search_where(filter_keys, filter_args):
+    """Returns the graph patterns of the datasets that match the filters.
+    Only datasets that can be hydrated are matched (see facets.HYDRATABLE_FILTER),
+    so that the total number of matches is the number of datasets returned."""
 
     filter_items = [
         "?{} IN ({})".format(filter_key, ", \n".join(values))
@@ -368,38 +468,183 @@ def search_datasets():
     ]
 
     graph_patterns = [f"{item} ." for item in graph_patterns]
-    where = "\n".join(graph_patterns)
 
-    search_query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX dcat: <http://www.w3.org/ns/dcat#>
-        PREFIX dct: <http://purl.org/dc/terms/>
-        SELECT {select}
+    return "\n".join(graph_patterns + [
+        breg_harvester.facets.HYDRATABLE_FILTER,
+        query_filter
+    ])
+
+
+def _decode_search_cursor(cursor):
+    """Returns the dataset URI that the cursor points to.
+    Raises ValueError if the cursor is not valid."""
+
+    sort_key = breg_harvester.facets.decode_cursor(cursor)
+
+    if len(sort_key) != 1 or not isinstance(sort_key[0], str):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    return sort_key[0]
+
+
+def _search_page_query(where, limit, after=None):
+    """Returns the query of the datasets of a page sorted by URI.
+    One more dataset than the limit is requested to know if there is a next page."""
+
+    after_filter = f"FILTER (STR(?{FilterKeys.DATASET.value}) > {Literal(after).n3()})" \
+        if after else ""
+
+    return """
+        {prefixes}
+        SELECT DISTINCT ?{dataset}
         WHERE {{
             {where}
-            {filter}
-        }} 
+            {after_filter}
+        }}
+        ORDER BY STR(?{dataset})
         LIMIT {limit}
         """.format(
-        select=select,
+        prefixes=_SEARCH_PREFIXES,
+        dataset=FilterKeys.DATASET.value,
         where=where,
-        limit=limit,
-        filter=query_filter)
+        after_filter=after_filter,
+        limit=int(limit) + 1)
+
+
+def _search_counts_query(where, filter_keys):
+    """Returns the query of the number of matching datasets for each
+    value of each facet. The total number of matches is returned
+    in the row of the dataset key, which has no value."""
+
+    def subquery(filter_key):
+        value = "" if filter_key is FilterKeys.DATASET else f"(?{filter_key.value} AS ?value)"
+        group = "" if filter_key is FilterKeys.DATASET else f"GROUP BY ?{filter_key.value}"
+
+        return """
+            {{
+                SELECT ("{key}" AS ?key) {value} (COUNT(DISTINCT ?{dataset}) AS ?count)
+                WHERE {{
+                    {where}
+                }}
+                {group}
+            }}
+            """.format(
+            key=filter_key.value,
+            value=value,
+            dataset=FilterKeys.DATASET.value,
+            where=where,
+            group=group)
+
+    return """
+        {prefixes}
+        SELECT ?key ?value ?count
+        WHERE {{
+            {subqueries}
+        }}
+        """.format(
+        prefixes=_SEARCH_PREFIXES,
+        subqueries=" UNION ".join(subquery(item) for item in filter_keys))
 
-    _logger.debug("SPARQL query (search):\n%s", search_query)
 
-    store = breg_harvester.store.get_sparql_store()
-    identifier = current_app.config.get("GRAPH_URI")
-    graph = Graph(store, identifier=identifier)
-    search_res = graph.query(search_query)
+@blueprint.route("/dataset/search", methods=["POST"])
+@breg_harvester.cache.versioned_response
+def search_datasets():
+    """Returns a page of the datasets that match the filters, the number of
+    matches for each facet value and the cursor to request the next page.
+    Keyword searches (q) are ranked and only available in the facet index."""
+
+    body = request.get_json()
+    limit = body.get("limit", breg_harvester.facets.DEFAULT_PAGE_SIZE)
+
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise BadRequest(f"Invalid limit: {limit}")
+
+    limit = min(limit, breg_harvester.facets.MAX_PAGE_SIZE)
+    cursor = body.get("cursor")
+    filter_keys = list(FilterKeys)
+
+    filter_args = {
+        key: val for key, val in body.get("filters", {}).items()
+        if key in (item.value for item in filter_keys)
+    }
+
+    query = body.get("q")
+    lang = body.get("lang")
+
+    if query is not None and not isinstance(query, str):
+        raise BadRequest(f"Invalid query: {query}")
 
-    idx_dataset = next(
-        idx for idx, val in enumerate(filter_keys)
-        if val is FilterKeys.DATASET)
+    redis_client = get_redis()
+    index_id = breg_harvester.facets.get_current_index(redis_client)
+    has_keywords = bool(query) and bool(breg_harvester.fulltext.tokenize(query, lang=lang))
 
-    uris = list(set(item[idx_dataset].n3() for item in search_res))
-    dset_dicts = _get_datasets(graph, uris) if len(uris) > 0 else []
+    if has_keywords and not index_id:
+        raise ServiceUnavailable("Keyword search is not available until the first harvest")
 
-    _logger.debug("Search results:\n%s", pprint.pformat(uris))
+    if index_id:
+        try:
+            res = breg_harvester.facets.search_facet_index(
+                redis_client,
+                index_id=index_id,
+                filters=filter_args,
+                limit=limit,
+                cursor=cursor,
+                query=query,
+                lang=lang)
+        except ValueError as ex:
+            raise BadRequest(str(ex))
+
+        _logger.debug("Search results (facet index %s):\n%s", index_id, pprint.pformat(list(res["datasets"])))
+
+        return jsonify(res)
+
+    # Without the facet index, the page of datasets and the facet counts
+    # are resolved with separate queries so that no query returns more
+    # rows than the page size or the number of distinct facet values
+
+    where = _search_where(filter_keys, filter_args)
+
+    try:
+        after = _decode_search_cursor(cursor) if cursor else None
+    except ValueError as ex:
+        raise BadRequest(str(ex))
+
+    graph = breg_harvester.store.get_read_graph()
+    page_query = _search_page_query(where, limit=limit, after=after)
+    counts_query = _search_counts_query(where, filter_keys)
+
+    _logger.debug("SPARQL query (search page):\n%s", page_query)
+    _logger.debug("SPARQL query (search counts):\n%s", counts_query)
 
-    return jsonify(dset_dicts)
+    page = [row[0] for row in graph.query(page_query)]
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    next_cursor = breg_harvester.facets.encode_cursor((str(page[-1]),)) \
+        if page and has_next else None
+
+    counts = {
+        item.value: {} for item in filter_keys
+        if item is not FilterKeys.DATASET
+    }
+
+    total = 0
+
+    for key, value, count in graph.query(counts_query):
+        if str(key) == FilterKeys.DATASET.value:
+            total = int(count)
+        else:
+            counts[str(key)][value.n3()] = int(count)
+
+    page = [uri.n3() for uri in page]
+    dset_dicts = get_datasets(graph, page) if len(page) > 0 else {}
+
+    _logger.debug("Search results:\n%s", pprint.pformat(page))
+
+    return jsonify({
+        "datasets": dset_dicts,
+        "order": [uri for uri in page if uri in dset_dicts],
+        "counts": counts,
+        "total": total,
+        "cursor": next_cursor
+    })
@@ -0,0 +1,280 @@
+"""Caches that sit in front of Redis and the triple store.
+
+Each API worker process keeps its own bounded LRU caches with TTL.
+The caches are cleared in every process when the graph is updated:
+harvest jobs increment a graph version counter and publish the new version
+in a Redis channel that is consumed by a listener thread started
+on demand in each process. The graph version is also part of the keys
+of the browser responses that are shared by all processes in Redis."""
+
+import collections
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import redis
+from flask import current_app, g, make_response, request
+
+from breg_harvester.jobs_queue import get_redis
+from breg_harvester.utils import ProcessLock
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITEMS = 10000
+DEFAULT_TTL = 300
+DEFAULT_RESPONSE_TTL = 24 * 3600
+
+CHANNEL_GRAPH_UPDATED = "breg:harvester:graph:updated"
+_KEY_GRAPH_VERSION = "breg:harvester:graph:version"
+_KEY_RESPONSE_PREFIX = "breg:harvester:responses"
+_RECONNECT_SECONDS = 5
+
+_MISSING = object()
+
+
+class LocalCache:
+    """Thread-safe LRU cache with a TTL per entry."""
+
+    def __init__(self, max_items=DEFAULT_MAX_ITEMS, ttl=DEFAULT_TTL):
+        self.max_items = int(max_items)
+        self.ttl = int(ttl)
+        self._items = collections.OrderedDict()
+        self._lock = ProcessLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.time()
+
+        with self._lock:
+            item = self._items.get(key, _MISSING)
+
+            if item is _MISSING or item[0] < now:
+                self._items.pop(key, None)
+                self.misses += 1
+                return default
+
+            self._items.move_to_end(key)
+            self.hits += 1
+
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._items[key] = (expires, value)
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "items": len(self._items),
+                "max_items": self.max_items,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions
+            }
+
+
+labels_cache = LocalCache()
+query_cache = LocalCache()
+response_cache = LocalCache()
+
+_listener_lock = ProcessLock()
+_version_lock = ProcessLock()
+_listener_pid = None
+_graph_version = None
+
+
+def clear_local_caches():
+    global _graph_version
+
+    with _version_lock:
+        _graph_version = None
+
+    for cache in [labels_cache, query_cache, response_cache]:
+        cache.clear()
+
+
+def local_caches_stats():
+    return {
+        "labels": labels_cache.stats(),
+        "queries": query_cache.stats(),
+        "responses": response_cache.stats()
+    }
+
+
+def _update_graph_version(version):
+    """Versions only increase: a version read from Redis by a request
+    must not overwrite a newer version that has been set by the listener."""
+
+    global _graph_version
+
+    with _version_lock:
+        if _graph_version is None or version > _graph_version:
+            _graph_version = version
+
+        return _graph_version
+
+
+def get_graph_version(redis_client):
+    """Returns the current graph version. The version is only read from Redis
+    when it is not known yet by the invalidation listener of this process."""
+
+    version = _graph_version
+
+    if version is None:
+        version = _update_graph_version(
+            int(redis_client.get(_KEY_GRAPH_VERSION) or 0))
+
+    return version
+
+
+def _listen_graph_updates(redis_url):
+    while True:
+        try:
+            client = redis.from_url(redis_url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL_GRAPH_UPDATED)
+
+            # Updates may have been missed while disconnected
+
+            clear_local_caches()
+
+            for message in pubsub.listen():
+                _logger.debug("Graph updated (version %s): Clearing local caches", message.get("data"))
+                clear_local_caches()
+                _update_graph_version(int(message.get("data")))
+        except Exception:
+            _logger.warning("Error listening to graph updates", exc_info=True)
+            time.sleep(_RECONNECT_SECONDS)
+
+
+def init_local_caches(app_config):
+    """Applies the configuration to the local caches and starts the
+    invalidation listener of the current process if it is not running yet.
+    The process ID is checked given that threads do not survive a fork."""
+
+    global _listener_pid
+
+    pid = os.getpid()
+
+    if _listener_pid == pid:
+        return
+
+    with _listener_lock:
+        if _listener_pid == pid:
+            return
+
+        max_items = app_config.get("LOCAL_CACHE_SIZE") or DEFAULT_MAX_ITEMS
+        ttl = app_config.get("LOCAL_CACHE_TTL") or DEFAULT_TTL
+
+        for cache in [labels_cache, query_cache, response_cache]:
+            cache.max_items = int(max_items)
+            cache.ttl = int(ttl)
+
+        clear_local_caches()
+
+        thread = threading.Thread(
+            target=_listen_graph_updates,
+            args=(app_config.get("REDIS_URL"),),
+            name="graph-updates",
+            daemon=True)
+
+        thread.start()
+
+        _listener_pid = pid
+
+
+def notify_graph_updated(redis_client, origin):
+    """Increments the graph version and notifies all API processes.
+    The origin (e.g. the URI of the harvested graph) is only logged."""
+
+    version = redis_client.incr(_KEY_GRAPH_VERSION)
+    _logger.debug("PUBLISH %s :: %s (%s)", CHANNEL_GRAPH_UPDATED, version, origin)
+    redis_client.publish(CHANNEL_GRAPH_UPDATED, version)
+
+    return version
+
+
+def mark_response_incomplete():
+    """Flags the response of the current request so that it is not cached
+    (e.g. some terms are still being dereferenced in the background)."""
+
+    g.response_incomplete = True
+
+
+def _request_key():
+    args = json.dumps(sorted(request.args.items(multi=True)))
+    body = request.get_data() if request.method == "POST" else b""
+    body_hash = hashlib.sha1(body).hexdigest()
+    return f"{request.method}:{request.path}:{args}:{body_hash}"
+
+
+def _build_response(body, etag):
+    response = make_response(body)
+    response.mimetype = "application/json"
+
+    if etag:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+
+    return response
+
+
+def versioned_response(view):
+    """Caches the JSON responses of a view until the graph version changes.
+    Responses are kept in Redis (shared by all processes) and in the local cache.
+    GET responses carry an ETag derived from the graph version and the request,
+    so that conditional requests are answered with 304 without running the view."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        redis_client = get_redis()
+        version = get_graph_version(redis_client)
+        key = _request_key()
+        key_hash = hashlib.sha1(f"{version}:{key}".encode("utf-8")).hexdigest()
+        etag = key_hash if request.method == "GET" else None
+
+        if etag and request.if_none_match.contains(etag):
+            return _build_response(b"", etag), 304
+
+        body = response_cache.get(key_hash)
+
+        if body is None:
+            name = f"{_KEY_RESPONSE_PREFIX}:{key_hash}"
+            body = redis_client.get(name)
+
+            if body is None:
+                response = make_response(view(*args, **kwargs))
+
+                if response.status_code != 200 or g.get("response_incomplete"):
+                    return response
+
+                body = response.get_data()
+                ttl = current_app.config.get("RESPONSE_CACHE_TTL") or DEFAULT_RESPONSE_TTL
+                redis_client.set(name, body, ex=int(ttl))
+
+            response_cache.set(key_hash, body)
+
+        return _build_response(body, etag)
+
+    return wrapper
@@ -18,6 +18,27 @@ class EnvConfig(enum.Enum):
     VALIDATOR_DISABLED = "HARVESTER_VALIDATOR_DISABLED"
     RESULT_TTL = "HARVESTER_RESULT_TTL"
     SCHEDULER_JOB_ID = "HARVESTER_SCHEDULER_JOB_ID"
+    LOAD_METHOD = "HARVESTER_LOAD_METHOD"
+    LOAD_BATCH_SIZE = "HARVESTER_LOAD_BATCH_SIZE"
+    GSP_ENDPOINT = "HARVESTER_GSP_ENDPOINT"
+    STAGING_ENABLED = "HARVESTER_STAGING_ENABLED"
+    DELTA_ENABLED = "HARVESTER_DELTA_ENABLED"
+    CONCURRENCY = "HARVESTER_CONCURRENCY"
+    SOURCE_TIMEOUT = "HARVESTER_SOURCE_TIMEOUT"
+    FANOUT_ENABLED = "HARVESTER_FANOUT_ENABLED"
+    VALIDATOR_TYPE = "HARVESTER_VALIDATOR_TYPE"
+    VALIDATION_CACHE_TTL = "HARVESTER_VALIDATION_CACHE_TTL"
+    DEREF_CONCURRENCY = "HARVESTER_DEREF_CONCURRENCY"
+    DEREF_DEADLINE = "HARVESTER_DEREF_DEADLINE"
+    VOCABULARIES_INTERVAL = "HARVESTER_VOCABULARIES_INTERVAL"
+    LABELS_TTL = "HARVESTER_LABELS_TTL"
+    LABELS_NEGATIVE_TTL = "HARVESTER_LABELS_NEGATIVE_TTL"
+    LABELS_MAX_TERMS = "HARVESTER_LABELS_MAX_TERMS"
+    LOCAL_CACHE_SIZE = "HARVESTER_LOCAL_CACHE_SIZE"
+    LOCAL_CACHE_TTL = "HARVESTER_LOCAL_CACHE_TTL"
+    RESPONSE_CACHE_TTL = "HARVESTER_RESPONSE_CACHE_TTL"
+    HTTP_POOL_SIZE = "HARVESTER_HTTP_POOL_SIZE"
+    PARSER_WORKERS = "HARVESTER_PARSER_WORKERS"
 
 
 DEFAULT_ENV_CONFIG = {
@@ -32,7 +53,28 @@ DEFAULT_ENV_CONFIG = {
     EnvConfig.SPAWN: 5,
     EnvConfig.VALIDATOR_DISABLED: False,
     EnvConfig.RESULT_TTL: 3600 * 24 * 30,
-    EnvConfig.SCHEDULER_JOB_ID: "harvester-scheduled-job"
+    EnvConfig.SCHEDULER_JOB_ID: "harvester-scheduled-job",
+    EnvConfig.LOAD_METHOD: "store",
+    EnvConfig.LOAD_BATCH_SIZE: 5000,
+    EnvConfig.GSP_ENDPOINT: "http://virtuoso:8890/sparql-graph-crud-auth",
+    EnvConfig.STAGING_ENABLED: False,
+    EnvConfig.DELTA_ENABLED: False,
+    EnvConfig.CONCURRENCY: 4,
+    EnvConfig.SOURCE_TIMEOUT: 300,
+    EnvConfig.FANOUT_ENABLED: False,
+    EnvConfig.VALIDATOR_TYPE: "breg",
+    EnvConfig.VALIDATION_CACHE_TTL: 3600 * 24 * 7,
+    EnvConfig.DEREF_CONCURRENCY: 8,
+    EnvConfig.DEREF_DEADLINE: 5,
+    EnvConfig.VOCABULARIES_INTERVAL: 3600 * 24 * 7,
+    EnvConfig.LABELS_TTL: 3600 * 24 * 30,
+    EnvConfig.LABELS_NEGATIVE_TTL: 3600,
+    EnvConfig.LABELS_MAX_TERMS: 50000,
+    EnvConfig.LOCAL_CACHE_SIZE: 10000,
+    EnvConfig.LOCAL_CACHE_TTL: 300,
+    EnvConfig.RESPONSE_CACHE_TTL: 3600 * 24,
+    EnvConfig.HTTP_POOL_SIZE: 10,
+    EnvConfig.PARSER_WORKERS: 2
 }
 
 
@@ -47,6 +89,27 @@ class AppConfig(enum.Enum):
     VALIDATOR_DISABLED = "VALIDATOR_DISABLED"
     RESULT_TTL = "RESULT_TTL"
     SCHEDULER_JOB_ID = "SCHEDULER_JOB_ID"
+    LOAD_METHOD = "LOAD_METHOD"
+    LOAD_BATCH_SIZE = "LOAD_BATCH_SIZE"
+    GSP_ENDPOINT = "GSP_ENDPOINT"
+    STAGING_ENABLED = "STAGING_ENABLED"
+    DELTA_ENABLED = "DELTA_ENABLED"
+    CONCURRENCY = "CONCURRENCY"
+    SOURCE_TIMEOUT = "SOURCE_TIMEOUT"
+    FANOUT_ENABLED = "FANOUT_ENABLED"
+    VALIDATOR_TYPE = "VALIDATOR_TYPE"
+    VALIDATION_CACHE_TTL = "VALIDATION_CACHE_TTL"
+    DEREF_CONCURRENCY = "DEREF_CONCURRENCY"
+    DEREF_DEADLINE = "DEREF_DEADLINE"
+    VOCABULARIES_INTERVAL = "VOCABULARIES_INTERVAL"
+    LABELS_TTL = "LABELS_TTL"
+    LABELS_NEGATIVE_TTL = "LABELS_NEGATIVE_TTL"
+    LABELS_MAX_TERMS = "LABELS_MAX_TERMS"
+    LOCAL_CACHE_SIZE = "LOCAL_CACHE_SIZE"
+    LOCAL_CACHE_TTL = "LOCAL_CACHE_TTL"
+    RESPONSE_CACHE_TTL = "RESPONSE_CACHE_TTL"
+    HTTP_POOL_SIZE = "HTTP_POOL_SIZE"
+    PARSER_WORKERS = "PARSER_WORKERS"
 
 
 def app_config_from_env():
@@ -95,6 +158,90 @@ def app_config_from_env():
         EnvConfig.SCHEDULER_JOB_ID.value,
         DEFAULT_ENV_CONFIG[EnvConfig.SCHEDULER_JOB_ID])
 
+    load_method = os.getenv(
+        EnvConfig.LOAD_METHOD.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.LOAD_METHOD])
+
+    load_batch_size = int(os.getenv(
+        EnvConfig.LOAD_BATCH_SIZE.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.LOAD_BATCH_SIZE]))
+
+    gsp_endpoint = os.getenv(
+        EnvConfig.GSP_ENDPOINT.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.GSP_ENDPOINT])
+
+    staging_enabled = bool(os.getenv(
+        EnvConfig.STAGING_ENABLED.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.STAGING_ENABLED]))
+
+    delta_enabled = bool(os.getenv(
+        EnvConfig.DELTA_ENABLED.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.DELTA_ENABLED]))
+
+    concurrency = int(os.getenv(
+        EnvConfig.CONCURRENCY.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.CONCURRENCY]))
+
+    source_timeout = int(os.getenv(
+        EnvConfig.SOURCE_TIMEOUT.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.SOURCE_TIMEOUT]))
+
+    fanout_enabled = bool(os.getenv(
+        EnvConfig.FANOUT_ENABLED.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.FANOUT_ENABLED]))
+
+    validator_type = os.getenv(
+        EnvConfig.VALIDATOR_TYPE.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.VALIDATOR_TYPE])
+
+    validation_cache_ttl = int(os.getenv(
+        EnvConfig.VALIDATION_CACHE_TTL.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.VALIDATION_CACHE_TTL]))
+
+    deref_concurrency = int(os.getenv(
+        EnvConfig.DEREF_CONCURRENCY.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.DEREF_CONCURRENCY]))
+
+    deref_deadline = int(os.getenv(
+        EnvConfig.DEREF_DEADLINE.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.DEREF_DEADLINE]))
+
+    vocabularies_interval = int(os.getenv(
+        EnvConfig.VOCABULARIES_INTERVAL.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.VOCABULARIES_INTERVAL]))
+
+    labels_ttl = int(os.getenv(
+        EnvConfig.LABELS_TTL.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.LABELS_TTL]))
+
+    labels_negative_ttl = int(os.getenv(
+        EnvConfig.LABELS_NEGATIVE_TTL.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.LABELS_NEGATIVE_TTL]))
+
+    labels_max_terms = int(os.getenv(
+        EnvConfig.LABELS_MAX_TERMS.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.LABELS_MAX_TERMS]))
+
+    local_cache_size = int(os.getenv(
+        EnvConfig.LOCAL_CACHE_SIZE.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.LOCAL_CACHE_SIZE]))
+
+    local_cache_ttl = int(os.getenv(
+        EnvConfig.LOCAL_CACHE_TTL.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.LOCAL_CACHE_TTL]))
+
+    response_cache_ttl = int(os.getenv(
+        EnvConfig.RESPONSE_CACHE_TTL.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.RESPONSE_CACHE_TTL]))
+
+    http_pool_size = int(os.getenv(
+        EnvConfig.HTTP_POOL_SIZE.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.HTTP_POOL_SIZE]))
+
+    parser_workers = int(os.getenv(
+        EnvConfig.PARSER_WORKERS.value,
+        DEFAULT_ENV_CONFIG[EnvConfig.PARSER_WORKERS]))
+
     return {
         AppConfig.SECRET_KEY.value: secret_key,
         AppConfig.REDIS_URL.value: redis_url,
@@ -105,5 +252,26 @@ def app_config_from_env():
         AppConfig.SPARQL_PASS.value: sparql_pass,
         AppConfig.VALIDATOR_DISABLED.value: validator_disabled,
         AppConfig.RESULT_TTL.value: result_ttl,
-        AppConfig.SCHEDULER_JOB_ID.value: scheduler_job_id
+        AppConfig.SCHEDULER_JOB_ID.value: scheduler_job_id,
+        AppConfig.LOAD_METHOD.value: load_method,
+        AppConfig.LOAD_BATCH_SIZE.value: load_batch_size,
+        AppConfig.GSP_ENDPOINT.value: gsp_endpoint,
+        AppConfig.STAGING_ENABLED.value: staging_enabled,
+        AppConfig.DELTA_ENABLED.value: delta_enabled,
+        AppConfig.CONCURRENCY.value: concurrency,
+        AppConfig.SOURCE_TIMEOUT.value: source_timeout,
+        AppConfig.FANOUT_ENABLED.value: fanout_enabled,
+        AppConfig.VALIDATOR_TYPE.value: validator_type,
+        AppConfig.VALIDATION_CACHE_TTL.value: validation_cache_ttl,
+        AppConfig.DEREF_CONCURRENCY.value: deref_concurrency,
+        AppConfig.DEREF_DEADLINE.value: deref_deadline,
+        AppConfig.VOCABULARIES_INTERVAL.value: vocabularies_interval,
+        AppConfig.LABELS_TTL.value: labels_ttl,
+        AppConfig.LABELS_NEGATIVE_TTL.value: labels_negative_ttl,
+        AppConfig.LABELS_MAX_TERMS.value: labels_max_terms,
+        AppConfig.LOCAL_CACHE_SIZE.value: local_cache_size,
+        AppConfig.LOCAL_CACHE_TTL.value: local_cache_ttl,
+        AppConfig.RESPONSE_CACHE_TTL.value: response_cache_ttl,
+        AppConfig.HTTP_POOL_SIZE.value: http_pool_size,
+        AppConfig.PARSER_WORKERS.value: parser_workers
     }
@@ -0,0 +1,191 @@
+"""Per-source state that enables incremental (delta) harvests.
+
+For each source the following is kept in Redis:
+the HTTP validators (ETag and Last-Modified), a hash of the raw contents,
+a hash of the canonicalized graph and the snapshot of the triples
+(as N-Triples lines) that were loaded in the last successful harvest."""
+
+import datetime
+import hashlib
+import logging
+import uuid
+
+from rdflib import Graph
+from rdflib.compare import to_canonical_graph
+
+_logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "breg:harvester:delta"
+_FORMAT_SNAPSHOT = "nt"
+_STATE_FIELDS = ["etag", "last_modified", "content_hash", "graph_hash"]
+_SKOLEM_BASEPATH = "/.well-known/genid/breg/"
+
+
+def _digest(val):
+    return hashlib.sha1(val.encode("utf-8")).hexdigest()
+
+
+def _sources_key(graph_uri):
+    return f"{_KEY_PREFIX}:{_digest(graph_uri)}:sources"
+
+
+def _state_key(graph_uri, uri):
+    return f"{_KEY_PREFIX}:{_digest(graph_uri)}:{_digest(uri)}:state"
+
+
+def snapshot_key(graph_uri, uri):
+    return f"{_KEY_PREFIX}:{_digest(graph_uri)}:{_digest(uri)}:triples"
+
+
+def _removed_key(graph_uri):
+    return f"{_KEY_PREFIX}:{_digest(graph_uri)}:removed"
+
+
+def pending_namespace(graph_uri, job_id):
+    """Returns the namespace (used in place of the graph URI)
+    where the state of a harvest split across multiple jobs is kept
+    until it is committed by the final job."""
+
+    return f"{graph_uri}#pending-{job_id}"
+
+
+def _decode(val):
+    return val.decode("utf-8") if isinstance(val, bytes) else val
+
+
+def canonical_lines(graph, scope):
+    """Returns the set of N-Triples lines of the canonical form of the graph.
+    Blank nodes are relabelled deterministically and skolemized,
+    so that the same data always produces the same lines.
+    Canonical labels are only unique within a graph: the skolem IRIs
+    include a hash of the scope (the source URI) so that the blank nodes
+    of different sources are not merged in the triple store."""
+
+    basepath = f"{_SKOLEM_BASEPATH}{_digest(scope)}/"
+    canonical = to_canonical_graph(graph).skolemize(basepath=basepath)
+    data = canonical.serialize(destination=None, format=_FORMAT_SNAPSHOT)
+    data = _decode(data)
+    return set(line for line in data.splitlines() if line.strip())
+
+
+def hash_lines(lines):
+    hasher = hashlib.sha256()
+
+    for line in sorted(lines):
+        hasher.update(line.encode("utf-8"))
+        hasher.update(b"\n")
+
+    return hasher.hexdigest()
+
+
+def lines_to_graph(lines):
+    graph = Graph()
+
+    if lines:
+        graph.parse(data="\n".join(lines), format=_FORMAT_SNAPSHOT)
+
+    return graph
+
+
+def get_known_sources(redis, graph_uri):
+    return set(_decode(item) for item in redis.smembers(_sources_key(graph_uri)))
+
+
+def get_source_state(redis, graph_uri, uri):
+    state = redis.hgetall(_state_key(graph_uri, uri))
+    return {_decode(key): _decode(val) for key, val in state.items()}
+
+
+def has_snapshot(redis, graph_uri, uri):
+    return bool(redis.exists(snapshot_key(graph_uri, uri)))
+
+
+def get_snapshot(redis, graph_uri, uri):
+    return set(_decode(item) for item in redis.smembers(snapshot_key(graph_uri, uri)))
+
+
+def filter_shared_lines(redis, lines, keys):
+    """Returns the lines that are not contained in any of the given snapshot keys.
+    The set difference is computed in Redis using a temporary key."""
+
+    if not lines or not keys:
+        return set(lines)
+
+    tmp_key = f"{_KEY_PREFIX}:tmp:{uuid.uuid4().hex}"
+
+    pipe = redis.pipeline()
+    pipe.sadd(tmp_key, *lines)
+    pipe.sdiff(tmp_key, *keys)
+    pipe.delete(tmp_key)
+    res = pipe.execute()
+
+    return set(_decode(item) for item in res[1])
+
+
+def save_source_state(redis, graph_uri, uri, state, lines=None):
+    """Persists the state of the source.
+    The snapshot of triples is replaced only if new lines are given."""
+
+    state_key = _state_key(graph_uri, uri)
+    triples_key = snapshot_key(graph_uri, uri)
+
+    mapping = {
+        key: val for key, val in state.items()
+        if key in _STATE_FIELDS and val is not None
+    }
+
+    mapping["updated_at"] = datetime.datetime.utcnow().isoformat()
+
+    pipe = redis.pipeline()
+    pipe.delete(state_key)
+    pipe.hset(state_key, mapping=mapping)
+    pipe.sadd(_sources_key(graph_uri), uri)
+
+    if lines is not None:
+        pipe.delete(triples_key)
+
+        if lines:
+            pipe.sadd(triples_key, *lines)
+
+    pipe.execute()
+
+
+def remove_source_state(redis, graph_uri, uri):
+    pipe = redis.pipeline()
+    pipe.delete(_state_key(graph_uri, uri))
+    pipe.delete(snapshot_key(graph_uri, uri))
+    pipe.srem(_sources_key(graph_uri), uri)
+    pipe.execute()
+
+
+def add_removed_lines(redis, graph_uri, lines):
+    if lines:
+        redis.sadd(_removed_key(graph_uri), *lines)
+
+
+def get_removed_lines(redis, graph_uri):
+    return set(_decode(item) for item in redis.smembers(_removed_key(graph_uri)))
+
+
+def commit_source_state(redis, namespace, graph_uri, uri):
+    """Moves the state of a source from a pending namespace to the graph.
+    The previous snapshot is kept if no snapshot exists in the namespace."""
+
+    pipe = redis.pipeline()
+    pipe.rename(_state_key(namespace, uri), _state_key(graph_uri, uri))
+
+    if has_snapshot(redis, namespace, uri):
+        pipe.rename(snapshot_key(namespace, uri), snapshot_key(graph_uri, uri))
+
+    pipe.sadd(_sources_key(graph_uri), uri)
+    pipe.srem(_sources_key(namespace), uri)
+    pipe.execute()
+
+
+def clear_namespace(redis, namespace):
+    keys = [_sources_key(namespace), _removed_key(namespace)]
+
+    for uri in get_known_sources(redis, namespace):
+        keys.extend([_state_key(namespace, uri), snapshot_key(namespace, uri)])
+
+    redis.delete(*keys)
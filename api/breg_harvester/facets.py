@@ -0,0 +1,573 @@
+"""Materialized facet index of the harvested datasets.
+
+The index is built at the end of each harvest and kept in Redis:
+one set of datasets for each value of each facet (see FilterKeys)
+and a hash with the serialized properties of each dataset.
+Filtered searches are then resolved with set intersections
+and a single lookup to hydrate the results. The facet values of each dataset
+are also kept to count the values of the whole result set in a single pass.
+
+The text properties of the datasets are also tokenized into an inverted index
+(one sorted set of datasets for each token scored by the weighted term frequency)
+to resolve keyword searches that are ranked by TF-IDF (see breg_harvester.fulltext).
+
+Results are sorted by dataset URI (N3), or by descending score in keyword
+searches, and paginated with opaque cursors that point to the sort key
+of the last dataset of the previous page.
+
+A new index is built under a new ID and then swapped into place,
+so that searches always see a complete index."""
+
+import base64
+import binascii
+import bisect
+import collections
+import enum
+import json
+import logging
+import math
+import time
+import uuid
+
+from rdflib import Graph
+from rdflib.namespace import DCAT, DCTERMS
+
+import breg_harvester.fulltext
+import breg_harvester.store
+
+_logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "breg:harvester:facets"
+_KEY_CURRENT = f"{_KEY_PREFIX}:current"
+_TMP_TTL = 60
+DEFAULT_HYDRATE_BATCH = 200
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+class FilterKeys(enum.Enum):
+    CATALOG = "catalog"
+    DATASET = "dataset"
+    THEME_TAXONOMY = "themeTaxonomy"
+    LANGUAGE = "language"
+    THEME = "theme"
+    PUBLISHER = "publisher"
+    PUBLISHER_TYPE = "publisherType"
+    LOCATION = "location"
+
+
+_PREFIXES = """
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX dcat: <http://www.w3.org/ns/dcat#>
+    PREFIX dct: <http://purl.org/dc/terms/>
+    """
+
+# Properties of the dataset that are hydrated as lists:
+# Literals are kept as they are and URIs are serialized in N3
+
+_DATASET_PROPERTIES = {
+    DCTERMS.description: ("description", False),
+    DCTERMS.identifier: ("identifier", False),
+    DCTERMS.title: ("title", False),
+    DCTERMS.spatial: ("location", True),
+    DCAT.theme: ("theme", True)
+}
+
+_REQUIRED_KEYS = [
+    "catalog", "language", "distribution"
+] + [key for key, _ in _DATASET_PROPERTIES.values()]
+
+# Graph pattern that matches the datasets that get_datasets can hydrate
+# (i.e. that have all the required keys), for searches that are resolved
+# with SPARQL queries. The catalog and language are matched by the search.
+
+HYDRATABLE_FILTER = """
+    FILTER EXISTS {{
+        {properties}
+        ?dataset dcat:distribution ?_distribution .
+        ?_distribution dcat:accessURL ?_distributionURL .
+        ?_distribution dcat:mediaType ?_distributionType .
+    }}
+    """.format(properties="\n        ".join(
+    f"?dataset {prop.n3()} ?_{key} ." for prop, (key, _) in _DATASET_PROPERTIES.items()))
+
+
+def _hydration_query(uris, select, where):
+    return """
+        {prefixes}
+        SELECT DISTINCT {select}
+        WHERE {{
+            VALUES ?dataset {{ {uris} }}
+            {where}
+        }}
+        """.format(
+        prefixes=_PREFIXES,
+        select=select,
+        uris=" ".join(uris),
+        where=where)
+
+
+def _hydrate_catalogs(graph, uris, datasets):
+    query = _hydration_query(uris, select="?dataset ?catalog ?language", where="""
+        ?catalog rdf:type dcat:Catalog .
+        ?dataset rdf:type dcat:Dataset .
+        ?catalog dcat:dataset ?dataset .
+        ?catalog dct:LinguisticSystem ?language .
+        """)
+
+    for row in graph.query(query):
+        dset = datasets[row[0].n3()]
+        dset["catalog"] = row[1].n3()
+        dset.setdefault("language", set()).add(row[2].n3())
+
+
+def _hydrate_properties(graph, uris, datasets):
+    query = _hydration_query(uris, select="?dataset ?prop ?value", where="""
+        VALUES ?prop {{ {props} }}
+        ?dataset ?prop ?value .
+        """.format(props=" ".join(item.n3() for item in _DATASET_PROPERTIES)))
+
+    for row in graph.query(query):
+        key, is_uri = _DATASET_PROPERTIES[row[1]]
+        value = row[2].n3() if is_uri else row[2]
+        datasets[row[0].n3()].setdefault(key, set()).add(value)
+
+
+def _hydrate_distributions(graph, uris, datasets):
+    query = _hydration_query(
+        uris,
+        select="?dataset ?distribution ?distributionURL ?distributionType ?distributionDescription",
+        where="""
+        ?dataset dcat:distribution ?distribution .
+        ?distribution dcat:accessURL ?distributionURL .
+        ?distribution dcat:mediaType ?distributionType .
+        OPTIONAL { ?distribution dct:description ?distributionDescription }
+        """)
+
+    for row in graph.query(query):
+        distr_dict = datasets[row[0].n3()].setdefault("distribution", {})
+        distr_item = distr_dict.setdefault(row[1].n3(), {})
+        distr_item["url"] = row[2].n3()
+        distr_item["type"] = row[3].n3()
+
+        if row[4]:
+            distr_item.setdefault("description", set()).add(row[4].n3())
+
+
+def get_datasets(graph, uris):
+    """Returns a dict of dataset (N3) to the dataset properties.
+    Each group of properties is fetched with a separate query so that
+    the number of rows is linear in the number of distinct values.
+    Datasets that lack any of the properties are left out,
+    as in the single query that joined all of them."""
+
+    if len(uris) == 0:
+        return []
+
+    datasets = collections.defaultdict(dict)
+
+    _hydrate_catalogs(graph, uris, datasets)
+    _hydrate_properties(graph, uris, datasets)
+    _hydrate_distributions(graph, uris, datasets)
+
+    for dset in datasets.values():
+        for key, val in dset.items():
+            if isinstance(val, set):
+                dset[key] = list(val)
+
+        for distr_item in dset.get("distribution", {}).values():
+            if "description" in distr_item:
+                distr_item["description"] = list(distr_item["description"])
+
+    return {
+        key: dset for key, dset in datasets.items()
+        if all(item in dset for item in _REQUIRED_KEYS)
+    }
+
+
+_PATTERNS_BASE = [
+    "?catalog rdf:type dcat:Catalog",
+    "?dataset rdf:type dcat:Dataset",
+    "?catalog dcat:dataset ?dataset"
+]
+
+_PATTERNS_FACET = {
+    FilterKeys.CATALOG: [],
+    FilterKeys.DATASET: [],
+    FilterKeys.THEME_TAXONOMY: ["?catalog dcat:themeTaxonomy ?themeTaxonomy"],
+    FilterKeys.LANGUAGE: ["?catalog dct:LinguisticSystem ?language"],
+    FilterKeys.THEME: ["?dataset dcat:theme ?theme"],
+    FilterKeys.PUBLISHER: ["?catalog dct:publisher ?publisher"],
+    FilterKeys.PUBLISHER_TYPE: [
+        "?catalog dct:publisher ?publisher",
+        "?publisher dct:type ?publisherType"
+    ],
+    FilterKeys.LOCATION: ["?catalog dct:spatial ?location"]
+}
+
+
+def _facet_query(filter_key):
+    patterns = _PATTERNS_BASE + _PATTERNS_FACET[filter_key]
+    where = "\n".join(f"{item} ." for item in patterns)
+
+    return """
+        {prefixes}
+        SELECT DISTINCT ?dataset ?{key}
+        WHERE {{
+            {where}
+        }}
+        """.format(prefixes=_PREFIXES, key=filter_key.value, where=where)
+
+
+def _index_prefix(index_id):
+    return f"{_KEY_PREFIX}:{index_id}"
+
+
+def _datasets_key(index_id):
+    return f"{_index_prefix(index_id)}:datasets"
+
+
+def _docs_key(index_id):
+    return f"{_index_prefix(index_id)}:docs"
+
+
+def _dataset_facets_key(index_id):
+    return f"{_index_prefix(index_id)}:dataset-facets"
+
+
+def _values_key(index_id, filter_key):
+    return f"{_index_prefix(index_id)}:values:{filter_key.value}"
+
+
+def _term_key(index_id, token):
+    return f"{_index_prefix(index_id)}:terms:{token}"
+
+
+def _facet_key(index_id, filter_key, value):
+    return f"{_index_prefix(index_id)}:facet:{filter_key.value}:{value}"
+
+
+def _decode(val):
+    return val.decode("utf-8") if isinstance(val, bytes) else val
+
+
+def _query_facets(graph):
+    """Returns a dict of facet to value (N3) to the set of datasets (N3).
+    Only datasets that have values for all facets are indexed, which
+    matches the graph patterns of the SPARQL search."""
+
+    facets = {}
+
+    for filter_key in FilterKeys:
+        facet = collections.defaultdict(set)
+
+        for row in graph.query(_facet_query(filter_key)):
+            facet[row[1].n3()].add(row[0].n3())
+
+        facets[filter_key] = facet
+
+    datasets = None
+
+    for facet in facets.values():
+        facet_datasets = set().union(*facet.values())
+        datasets = facet_datasets if datasets is None else datasets & facet_datasets
+
+    return facets, datasets or set()
+
+
+def _invert_facets(facets, datasets):
+    """Returns a dict of dataset (N3) to facet to the list of values (N3)."""
+
+    dataset_facets = {uri: collections.defaultdict(list) for uri in datasets}
+
+    for filter_key, facet in facets.items():
+        if filter_key is FilterKeys.DATASET:
+            continue
+
+        for value, facet_datasets in facet.items():
+            for uri in facet_datasets & datasets:
+                dataset_facets[uri][filter_key.value].append(value)
+
+    return dataset_facets
+
+
+def count_facets(dataset_facets):
+    """Returns the number of datasets for each value of each facet
+    given an iterable of dicts of facet to values (one for each dataset)."""
+
+    counts = {
+        item.value: collections.Counter()
+        for item in FilterKeys if item is not FilterKeys.DATASET
+    }
+
+    for item in dataset_facets:
+        for key, values in item.items():
+            if key in counts:
+                counts[key].update(set(values))
+
+    return {key: dict(val) for key, val in counts.items()}
+
+
+def encode_cursor(sort_key):
+    data = json.dumps(list(sort_key)).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Raises ValueError if the cursor is not valid."""
+
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError) as ex:
+        raise ValueError(f"Invalid cursor: {cursor}") from ex
+
+    if not isinstance(sort_key, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    return tuple(sort_key)
+
+
+def _uri_sort_key(uri):
+    return (uri,)
+
+
+def paginate(items, limit, cursor=None, sort_key=_uri_sort_key):
+    """Returns the page of the items (sorted by sort_key) that follows the cursor
+    and the cursor of the next page (None if this is the last page)."""
+
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise ValueError(f"Invalid limit: {limit}")
+
+    keys = [sort_key(item) for item in items]
+
+    try:
+        start = bisect.bisect_right(keys, decode_cursor(cursor)) if cursor else 0
+    except TypeError as ex:
+        raise ValueError(f"Invalid cursor: {cursor}") from ex
+
+    page = items[start:start + limit]
+    has_next = start + limit < len(items)
+    next_cursor = encode_cursor(keys[start + limit - 1]) if page and has_next else None
+
+    return page, next_cursor
+
+
+def _delete_index(redis, index_id):
+    keys = list(redis.scan_iter(match=f"{_index_prefix(index_id)}:*"))
+
+    if keys:
+        redis.delete(*keys)
+
+
+def build_facet_index(redis, store_kwargs, graph_uri, hydrate_batch=DEFAULT_HYDRATE_BATCH):
+    """Builds the facet index of the datasets in the graph
+    and replaces the current index once it is complete."""
+
+    started = time.time()
+    store = breg_harvester.store.get_sparql_store(**store_kwargs)
+    graph = Graph(store, identifier=graph_uri)
+    index_id = uuid.uuid4().hex
+
+    try:
+        facets, datasets = _query_facets(graph)
+        uris = sorted(datasets)
+        tokens = set()
+        hydrated = set()
+
+        # Datasets that cannot be hydrated are left out of the index,
+        # so that the totals of the searches match the returned datasets
+
+        for idx in range(0, len(uris), hydrate_batch):
+            docs = get_datasets(graph, uris[idx:idx + hydrate_batch])
+
+            if not docs:
+                continue
+
+            hydrated.update(docs)
+            pipe = redis.pipeline(transaction=False)
+
+            pipe.hset(_docs_key(index_id), mapping={
+                key: json.dumps(val) for key, val in docs.items()
+            })
+
+            for uri, doc in docs.items():
+                for token, score in breg_harvester.fulltext.score_document(doc).items():
+                    pipe.zadd(_term_key(index_id, token), {uri: score})
+                    tokens.add(token)
+
+            pipe.execute()
+
+        datasets = hydrated
+        pipe = redis.pipeline(transaction=False)
+
+        if datasets:
+            pipe.sadd(_datasets_key(index_id), *datasets)
+
+        for filter_key, facet in facets.items():
+            for value, facet_datasets in facet.items():
+                facet_datasets = facet_datasets & datasets
+
+                if not facet_datasets:
+                    continue
+
+                pipe.sadd(_facet_key(index_id, filter_key, value), *facet_datasets)
+                pipe.sadd(_values_key(index_id, filter_key), value)
+
+        for uri, val in _invert_facets(facets, datasets).items():
+            pipe.hset(_dataset_facets_key(index_id), uri, json.dumps(val))
+
+        pipe.execute()
+    except:
+        _delete_index(redis, index_id)
+        raise
+    finally:
+        graph.close()
+
+    previous_id = _decode(redis.getset(_KEY_CURRENT, index_id))
+
+    if previous_id:
+        _delete_index(redis, previous_id)
+
+    res = {
+        "index_id": index_id,
+        "num_datasets": len(datasets),
+        "num_values": {
+            key.value: len([val for val in facet.values() if val & datasets])
+            for key, facet in facets.items()
+        },
+        "num_tokens": len(tokens),
+        "seconds": round(time.time() - started, 3)
+    }
+
+    _logger.info("Built facet index:\n%s", res)
+
+    return res
+
+
+def clear_facet_index(redis):
+    """Removes the current index so that the search falls back to SPARQL
+    queries instead of serving the datasets of a previous graph."""
+
+    pipe = redis.pipeline()
+    pipe.get(_KEY_CURRENT)
+    pipe.delete(_KEY_CURRENT)
+    previous_id = _decode(pipe.execute()[0])
+
+    if previous_id:
+        _delete_index(redis, previous_id)
+
+    return previous_id
+
+
+def get_current_index(redis):
+    return _decode(redis.get(_KEY_CURRENT))
+
+
+def _rank_matches(redis, index_id, tokens):
+    """Returns a dict of dataset (N3) to the TF-IDF score
+    for the datasets that contain all the tokens."""
+
+    term_keys = [_term_key(index_id, token) for token in sorted(set(tokens))]
+    pipe = redis.pipeline(transaction=False)
+    pipe.scard(_datasets_key(index_id))
+
+    for key in term_keys:
+        pipe.zcard(key)
+
+    num_datasets, *freqs = pipe.execute()
+
+    if not all(freqs):
+        return {}
+
+    weights = {
+        key: math.log(1 + num_datasets / freq)
+        for key, freq in zip(term_keys, freqs)
+    }
+
+    tmp_key = f"{_KEY_PREFIX}:tmp:{uuid.uuid4().hex}"
+    pipe = redis.pipeline(transaction=False)
+    pipe.zinterstore(tmp_key, weights, aggregate="SUM")
+    pipe.zrange(tmp_key, 0, -1, withscores=True)
+    pipe.delete(tmp_key)
+    _, ranked, _ = pipe.execute()
+
+    return {_decode(uri): score for uri, score in ranked}
+
+
+def search_facet_index(
+        redis, index_id, filters, limit=DEFAULT_PAGE_SIZE, cursor=None, query=None, lang=None):
+    """Returns the page of hydrated datasets that match the filters (and the
+    keywords of the query, if any), the facet counts of all the matches and the
+    cursor of the next page. Values of the same facet are combined with OR and
+    facets with AND. Raises ValueError if the cursor is not valid."""
+
+    tmp_keys = []
+    keys = []
+    pipe = redis.pipeline(transaction=False)
+
+    for filter_key in FilterKeys:
+        values = filters.get(filter_key.value)
+
+        if not values:
+            continue
+
+        facet_keys = [_facet_key(index_id, filter_key, value) for value in values]
+
+        if len(facet_keys) == 1:
+            keys.extend(facet_keys)
+            continue
+
+        tmp_key = f"{_KEY_PREFIX}:tmp:{uuid.uuid4().hex}"
+        pipe.sunionstore(tmp_key, facet_keys)
+        pipe.expire(tmp_key, _TMP_TTL)
+        tmp_keys.append(tmp_key)
+        keys.append(tmp_key)
+
+    if keys:
+        pipe.sinter(keys)
+    else:
+        pipe.smembers(_datasets_key(index_id))
+
+    if tmp_keys:
+        pipe.delete(*tmp_keys)
+
+    res = pipe.execute()
+    matches = res[-2] if tmp_keys else res[-1]
+    uris = [_decode(item) for item in matches]
+    scores = None
+
+    # Queries without keywords (e.g. only stop words) do not filter the datasets
+
+    tokens = breg_harvester.fulltext.tokenize(query, lang=lang) if query else []
+
+    if tokens:
+        ranked = _rank_matches(redis, index_id, tokens)
+        scores = {uri: ranked[uri] for uri in uris if uri in ranked}
+
+        def rank_key(uri):
+            return (-scores[uri], uri)
+
+        uris = sorted(scores, key=rank_key)
+        page, next_cursor = paginate(uris, limit=limit, cursor=cursor, sort_key=rank_key)
+    else:
+        uris = sorted(uris)
+        page, next_cursor = paginate(uris, limit=limit, cursor=cursor)
+
+    docs = redis.hmget(_docs_key(index_id), page) if page else []
+    dataset_facets = redis.hmget(_dataset_facets_key(index_id), uris) if uris else []
+
+    res = {
+        "datasets": {
+            uri: json.loads(doc)
+            for uri, doc in zip(page, docs) if doc
+        },
+        "order": [uri for uri, doc in zip(page, docs) if doc],
+        "counts": count_facets(json.loads(item) for item in dataset_facets if item),
+        "total": len(uris),
+        "cursor": next_cursor
+    }
+
+    if scores is not None:
+        res["scores"] = {uri: scores[uri] for uri in res["order"]}
+
+    return res
@@ -0,0 +1,140 @@
+import collections
+import hashlib
+import itertools
+import logging
+import tempfile
+
+import requests
+from rdflib.plugins.parsers.ntriples import NTriplesParser
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_CHUNK_LINES = 1000
+DEFAULT_CHUNK_SIZE = 64 * 1024
+_SPOOL_PREFIX = "breg-harvester-"
+
+FetchResult = collections.namedtuple(
+    "FetchResult",
+    ["source", "spool", "not_modified", "etag", "last_modified", "content_hash"])
+
+
+def hash_content(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def close_spool(fetch_res):
+    if fetch_res and fetch_res.spool:
+        fetch_res.spool.close()
+
+
+def _spool_response(res, chunk_size, progress=None):
+    """Writes the body of the response to a temporary file.
+    Returns the file (positioned at the start) and the hash of the contents.
+    The optional progress function receives the size of each chunk."""
+
+    hasher = hashlib.sha256()
+    spool = tempfile.NamedTemporaryFile(prefix=_SPOOL_PREFIX)
+
+    try:
+        for chunk in res.iter_content(chunk_size=chunk_size):
+            hasher.update(chunk)
+            spool.write(chunk)
+
+            if progress:
+                progress(len(chunk))
+
+        spool.flush()
+        spool.seek(0)
+    except:
+        spool.close()
+        raise
+
+    return spool, hasher.hexdigest()
+
+
+def fetch_source(
+        source, state=None, timeout=DEFAULT_TIMEOUT,
+        chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Downloads the raw contents of a source to a local spool file,
+    so that the same snapshot of the data can be validated and parsed
+    without downloading the source again. The spool file is deleted when closed.
+    If the previous state of the source is known (ETag or Last-Modified)
+    a conditional GET is sent and the spool may be undefined
+    when the server replies with 304 Not Modified.
+    The optional progress function receives the number of bytes
+    of each chunk that is written to the spool file."""
+
+    state = state if state else {}
+    headers = {"Accept": source.mime_type}
+
+    if state.get("etag"):
+        headers["If-None-Match"] = state.get("etag")
+
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state.get("last_modified")
+
+    _logger.debug("GET %s (headers=%s)", source.uri, headers)
+
+    with requests.get(source.uri, headers=headers, stream=True, timeout=timeout) as res:
+        if res.status_code == requests.codes.not_modified:
+            _logger.debug("Not modified: %s", source)
+
+            return FetchResult(
+                source=source,
+                spool=None,
+                not_modified=True,
+                etag=state.get("etag"),
+                last_modified=state.get("last_modified"),
+                content_hash=state.get("content_hash"))
+
+        res.raise_for_status()
+        spool, content_hash = _spool_response(
+            res, chunk_size=chunk_size, progress=progress)
+
+        return FetchResult(
+            source=source,
+            spool=spool,
+            not_modified=False,
+            etag=res.headers.get("ETag"),
+            last_modified=res.headers.get("Last-Modified"),
+            content_hash=content_hash)
+
+
+class _TriplesSink:
+    def __init__(self):
+        self.triples = []
+
+    def triple(self, subj, pred, obj):
+        self.triples.append((subj, pred, obj))
+
+
+def stream_ntriples(spool, chunk_lines=DEFAULT_CHUNK_LINES, stats=None):
+    """Yields the triples of an N-Triples spool file.
+    The file is parsed in chunks of lines so that the memory usage
+    does not depend on the size of the source. The number of bytes read
+    and triples parsed are accumulated in the optional stats dict.
+    The spool file is closed once all the triples have been read."""
+
+    stats = stats if stats is not None else {}
+    stats.update({"bytes": 0, "triples": 0})
+
+    with spool:
+        spool.seek(0)
+        sink = _TriplesSink()
+        parser = NTriplesParser(sink=sink)
+        lines = (line.rstrip(b"\r\n") for line in spool)
+
+        while True:
+            chunk = list(itertools.islice(lines, chunk_lines))
+
+            if not chunk:
+                return
+
+            stats["bytes"] += sum(len(line) + 1 for line in chunk)
+            parser.parsestring(b"\n".join(chunk).decode("utf-8"))
+            stats["triples"] += len(sink.triples)
+
+            yield from sink.triples
+
+            sink.triples = []
@@ -0,0 +1,104 @@
+"""Tokenization of the text properties of datasets for keyword search.
+
+Text is split in words, case folded and stripped of diacritics.
+Stop words are removed using the list of the language of each literal
+(or the lists of all supported languages for untagged literals).
+Each field has a weight, so that matches in titles rank higher
+than matches in descriptions."""
+
+import collections
+import re
+import unicodedata
+
+from rdflib import Literal
+
+MIN_TOKEN_LENGTH = 2
+
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "identifier": 2.0,
+    "description": 1.0
+}
+
+_RE_WORD = re.compile(r"\w+", re.UNICODE)
+
+STOP_WORDS = {
+    "en": {
+        "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in",
+        "into", "is", "it", "of", "on", "or", "that", "the", "this", "to", "with"
+    },
+    "es": {
+        "a", "al", "como", "con", "de", "del", "el", "en", "es", "la", "las",
+        "lo", "los", "o", "para", "por", "que", "se", "su", "un", "una", "y"
+    },
+    "fr": {
+        "a", "au", "aux", "avec", "ce", "d", "dans", "de", "des", "du", "en",
+        "est", "et", "l", "la", "le", "les", "ou", "par", "pour", "sur", "un", "une"
+    },
+    "de": {
+        "am", "an", "auf", "das", "dem", "den", "der", "des", "die", "ein",
+        "eine", "einer", "für", "im", "in", "ist", "mit", "oder", "und", "von", "zu"
+    },
+    "it": {
+        "a", "al", "alla", "con", "da", "dei", "del", "della", "di", "e", "il",
+        "in", "la", "le", "per", "su", "un", "una", "che", "o", "gli"
+    },
+    "pt": {
+        "a", "ao", "com", "da", "das", "de", "do", "dos", "e", "em", "na",
+        "no", "o", "os", "ou", "para", "por", "que", "um", "uma"
+    },
+    "nl": {
+        "de", "een", "en", "het", "in", "is", "met", "of", "op", "te", "van",
+        "voor", "die", "dat"
+    }
+}
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+_FOLDED_STOP_WORDS = {
+    lang: set(_fold(item) for item in words)
+    for lang, words in STOP_WORDS.items()
+}
+
+_ALL_STOP_WORDS = set().union(*_FOLDED_STOP_WORDS.values())
+
+
+def get_stop_words(lang=None):
+    """Returns the stop words of the language (the primary subtag is enough).
+    All stop words are returned if the language is undefined or unknown."""
+
+    if not lang:
+        return _ALL_STOP_WORDS
+
+    return _FOLDED_STOP_WORDS.get(lang.lower().split("-")[0], _ALL_STOP_WORDS)
+
+
+def tokenize(text, lang=None):
+    stop_words = get_stop_words(lang)
+
+    return [
+        token for token in (_fold(item) for item in _RE_WORD.findall(text))
+        if len(token) >= MIN_TOKEN_LENGTH and token not in stop_words
+    ]
+
+
+def _literal_language(val):
+    return val.language if isinstance(val, Literal) else None
+
+
+def score_document(doc):
+    """Returns a dict of token to the weighted term frequency
+    in the text fields of a hydrated dataset."""
+
+    scores = collections.Counter()
+
+    for field, weight in FIELD_WEIGHTS.items():
+        for val in doc.get(field, []):
+            for token in tokenize(str(val), lang=_literal_language(val)):
+                scores[token] += weight
+
+    return scores
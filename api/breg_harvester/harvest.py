@@ -1,16 +1,36 @@
+import collections
+import concurrent.futures
+import itertools
+import json
 import logging
 import pprint
+import time
+import uuid
 
 import redis
-from flask import Blueprint, current_app, g, jsonify, request
+from flask import (Blueprint, Response, current_app, jsonify, request,
+                   stream_with_context)
 from rdflib import Graph
-from SPARQLWrapper import SPARQLWrapper
+from rq import get_current_job
+from rq.job import Job, JobStatus
 from werkzeug.exceptions import NotFound, ServiceUnavailable
 
+import breg_harvester.cache
+import breg_harvester.delta
+import breg_harvester.facets
 import breg_harvester.jobs_queue
+import breg_harvester.progress
+import breg_harvester.sessions
 import breg_harvester.store
 import breg_harvester.utils
-from breg_harvester.models import SourceDataset
+from breg_harvester.fetch import close_spool, fetch_source, stream_ntriples
+from breg_harvester.loader import get_loader
+from breg_harvester.models import DataTypes, SourceDataset
+from breg_harvester.progress import (PHASE_COPY, PHASE_FAILED, PHASE_FETCH,
+                                     PHASE_FINISHED, PHASE_INDEX, PHASE_LOAD,
+                                     PHASE_PARSE, PHASE_PROCESSED,
+                                     PHASE_SOURCES, PHASE_SWAP, PHASE_UNLOAD,
+                                     PHASE_VALIDATE)
 from breg_harvester.validator import get_validator
 
 _logger = logging.getLogger(__name__)
@@ -18,50 +38,1031 @@ _logger = logging.getLogger(__name__)
 BLUEPRINT_NAME = "harvest"
 blueprint = Blueprint(BLUEPRINT_NAME, __name__)
 
+DEFAULT_CONCURRENCY = 4
+DEFAULT_SOURCE_TIMEOUT = 300
+_POLL_INTERVAL_SECONDS = 1
+_FANOUT_KEY_PREFIX = "breg:harvester:fanout"
+_FANOUT_KEY_TTL = 7 * 24 * 3600
+_FANOUT_ENDED_STATUSES = (JobStatus.FINISHED, JobStatus.FAILED)
 
-def run_harvest(sources, store_kwargs=None, validator=None, graph_uri=None):
+SourceResult = collections.namedtuple(
+    "SourceResult",
+    ["source", "fetch_res", "changed", "valid", "graph", "streamed", "durations"])
+
+
+def _get_store_session(store_kwargs):
+    return breg_harvester.store.get_store_session(
+        sparql_user=store_kwargs.get("sparql_user"),
+        sparql_pass=store_kwargs.get("sparql_pass"))
+
+
+def _swap_staging_graph(store_kwargs, staging_uri, graph_uri):
+    with _get_store_session(store_kwargs) as session:
+        breg_harvester.store.move_graph(
+            session=session,
+            source_uri=staging_uri,
+            target_uri=graph_uri,
+            update_endpoint=store_kwargs.get("update_endpoint"))
+
+
+def _drop_staging_graph(store_kwargs, staging_uri):
+    try:
+        with _get_store_session(store_kwargs) as session:
+            breg_harvester.store.drop_graph(
+                session=session,
+                graph_uri=staging_uri,
+                update_endpoint=store_kwargs.get("update_endpoint"))
+    except Exception:
+        _logger.warning(
+            "Error dropping staging graph <%s>",
+            staging_uri, exc_info=True)
+
+
+def _copy_live_graph(store_kwargs, graph_uri, staging_uri):
+    with _get_store_session(store_kwargs) as session:
+        breg_harvester.store.copy_graph(
+            session=session,
+            source_uri=graph_uri,
+            target_uri=staging_uri,
+            update_endpoint=store_kwargs.get("update_endpoint"))
+
+
+def _is_unchanged(fetch_res, state):
+    if fetch_res.not_modified:
+        return True
+
+    return bool(state) and fetch_res.content_hash == state.get("content_hash")
+
+
+def _fetch_state(fetch_res):
+    return {
+        "etag": fetch_res.etag,
+        "last_modified": fetch_res.last_modified,
+        "content_hash": fetch_res.content_hash
+    }
+
+
+def _source_delta(redis_client, graph_uri, item, state):
+    """Compares the canonical triples of a changed source with
+    the snapshot from the previous harvest to find the triples
+    that should be added to and removed from the triple store.
+    Returns the added lines, the removed lines, the new snapshot
+    (undefined if the source has not changed) and a small report."""
+
+    if item.graph is None:
+        return set(), set(), None, {"status": "unchanged"}
+
+    uri = item.source.uri
+    lines = breg_harvester.delta.canonical_lines(item.graph, scope=uri)
+    graph_hash = breg_harvester.delta.hash_lines(lines)
+    prev_graph_hash = state.get("graph_hash")
+    state["graph_hash"] = graph_hash
+
+    if graph_hash == prev_graph_hash:
+        return set(), set(), None, {"status": "unchanged"}
+
+    previous = breg_harvester.delta.get_snapshot(redis_client, graph_uri, uri)
+    added = lines.difference(previous)
+    removed = previous.difference(lines)
+
+    report = {
+        "status": "changed" if previous else "new",
+        "added": len(added),
+        "removed": len(removed)
+    }
+
+    return added, removed, lines, report
+
+
+def _stale_sources_delta(redis_client, graph_uri, sources):
+    """Returns the triples of the sources that were harvested
+    before but are not configured anymore."""
+
+    configured = set(source.uri for source in sources)
+    known = breg_harvester.delta.get_known_sources(redis_client, graph_uri)
+    removed = set()
+    report = {}
+
+    for uri in known.difference(configured):
+        previous = breg_harvester.delta.get_snapshot(
+            redis_client, graph_uri, uri)
+
+        removed.update(previous)
+        report[uri] = {"status": "removed", "removed": len(previous)}
+
+    return removed, report
+
+
+def _remove_stale_states(redis_client, graph_uri, sources):
+    configured = set(source.uri for source in sources)
+    known = breg_harvester.delta.get_known_sources(redis_client, graph_uri)
+
+    for uri in known.difference(configured):
+        breg_harvester.delta.remove_source_state(redis_client, graph_uri, uri)
+
+
+def _has_previous_harvest(redis_client, graph_uri):
+    return any(
+        breg_harvester.delta.has_snapshot(redis_client, graph_uri, uri)
+        for uri in breg_harvester.delta.get_known_sources(redis_client, graph_uri))
+
+
+def _notify_graph_updated(redis_url, graph_uri):
+    """Failures are only logged given that the graph has already been updated."""
+
+    if not redis_url:
+        return
+
+    try:
+        redis_client = redis.from_url(redis_url)
+        breg_harvester.cache.notify_graph_updated(redis_client, graph_uri)
+        redis_client.connection_pool.disconnect()
+    except Exception:
+        _logger.warning("Error notifying graph update", exc_info=True)
+
+
+def _notify_partial_update(redis_client, graph_uri):
+    """Failed harvests that already modified the live graph must still
+    invalidate the caches. Errors are logged to keep the original failure."""
+
+    _logger.warning("Harvest failed after modifying <%s>", graph_uri)
+
+    try:
+        breg_harvester.cache.notify_graph_updated(redis_client, graph_uri)
+    except Exception:
+        _logger.warning("Error notifying graph update", exc_info=True)
+
+
+def _build_facet_index(redis_url, store_kwargs, graph_uri):
+    """The browser search falls back to SPARQL queries
+    when the facet index cannot be built: the index of
+    the previous harvest is removed given that it is stale."""
+
+    if not redis_url:
+        return None
+
+    redis_client = redis.from_url(redis_url)
+
+    try:
+        return breg_harvester.facets.build_facet_index(
+            redis_client,
+            store_kwargs=store_kwargs,
+            graph_uri=graph_uri)
+    except Exception as ex:
+        _logger.warning("Error building facet index", exc_info=True)
+
+        try:
+            breg_harvester.facets.clear_facet_index(redis_client)
+        except Exception:
+            _logger.warning("Error removing stale facet index", exc_info=True)
+
+        return {"error": repr(ex)}
+    finally:
+        redis_client.connection_pool.disconnect()
+
+
+def _count_triples(store_kwargs, graph_uri):
+    store = breg_harvester.store.get_sparql_store(**store_kwargs)
+    store_graph = Graph(store, identifier=graph_uri)
+
+    try:
+        return len(store_graph)
+    finally:
+        store_graph.close()
+
+
+def _is_streamable(source, validator, delta):
+    """N-Triples sources are streamed to the triple store instead of being
+    parsed in memory, unless the whole graph is needed to compute a delta
+    or to be validated locally."""
+
+    return source.data_type is DataTypes.TRIPLES \
+        and not delta \
+        and not getattr(validator, "requires_graph", False)
+
+
+def _stream_triples(item, stream_stats):
+    if not item.streamed:
+        return item.graph
+
+    stats = stream_stats.setdefault(item.source.uri, {})
+
+    return stream_ntriples(item.fetch_res.spool, stats=stats)
+
+
+def _close_spools(source_results):
+    for item in source_results:
+        close_spool(item.fetch_res)
+
+
+def _process_source(source, validator, state, delta, source_timeout, reporter):
+    """Fetches, validates and parses a single source.
+    Each source is downloaded once to a spool file that is shared
+    by the validation and parse stages.
+    Unchanged sources are neither validated nor parsed in delta mode.
+    Streamable sources are only validated here: their spool file
+    is kept open to be parsed while being loaded."""
+
+    durations = {}
+    started = time.time()
+
+    _logger.debug("Fetching: %s", source)
+    reporter.set_source_phase(source.uri, PHASE_FETCH)
+
+    try:
+        fetch_res = fetch_source(
+            source,
+            state=state,
+            timeout=source_timeout,
+            progress=lambda num: reporter.increment_source(source.uri, "bytes", num))
+    except:
+        reporter.set_source_phase(source.uri, PHASE_FAILED)
+        raise
+
+    durations["fetch"] = time.time() - started
+
+    changed = not delta or not _is_unchanged(fetch_res, state)
+    streamed = changed and _is_streamable(source, validator, delta)
+    valid = None
+    graph = None
+
+    try:
+        if changed and not streamed:
+            _logger.debug("Parsing: %s", source)
+            reporter.set_source_phase(source.uri, PHASE_PARSE)
+            time_parse = time.time()
+            graph = Graph()
+
+            graph.parse(
+                file=fetch_res.spool,
+                format=source.rdflib_format,
+                publicID=source.uri)
+
+            durations["parse"] = time.time() - time_parse
+            reporter.update_source(source.uri, triples_parsed=len(graph))
+
+        if changed:
+            reporter.set_source_phase(source.uri, PHASE_VALIDATE)
+            time_validate = time.time()
+
+            valid = validator.validate(
+                source,
+                graph=graph,
+                content_hash=fetch_res.content_hash,
+                spool=fetch_res.spool)
+
+            durations["validate"] = time.time() - time_validate
+    except:
+        close_spool(fetch_res)
+        reporter.set_source_phase(source.uri, PHASE_FAILED)
+        raise
+
+    if not streamed:
+        close_spool(fetch_res)
+
+    durations["total"] = time.time() - started
+
+    reporter.update_source(source.uri, changed=changed, streamed=streamed)
+    reporter.set_source_phase(source.uri, PHASE_PROCESSED, durations=durations)
+
+    return SourceResult(
+        source=source,
+        fetch_res=fetch_res,
+        changed=changed,
+        valid=valid,
+        graph=graph,
+        streamed=streamed,
+        durations={key: round(val, 3) for key, val in durations.items()})
+
+
+def _process_sources(sources, validator, states, delta, concurrency, source_timeout, reporter):
+    """Runs the fetch, validation and parse stages of all sources
+    in a bounded thread pool. A TimeoutError is raised if any source
+    takes longer than the given timeout since it started processing."""
+
+    started = {}
+
+    def process(source):
+        started[source.uri] = time.time()
+
+        return _process_source(
+            source,
+            validator=validator,
+            state=states.get(source.uri),
+            delta=delta,
+            source_timeout=source_timeout,
+            reporter=reporter)
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, int(concurrency)))
+
+    futures = [executor.submit(process, source) for source in sources]
+
+    try:
+        pending = set(futures)
+
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=_POLL_INTERVAL_SECONDS,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                future.result()
+
+            now = time.time()
+
+            expired = [
+                source for source, future in zip(sources, futures)
+                if future in pending
+                and source.uri in started
+                and now - started[source.uri] > source_timeout
+            ]
+
+            if expired:
+                raise TimeoutError(
+                    f"Timeout processing sources:\n{pprint.pformat(expired)}")
+
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+
+        executor.shutdown(wait=False)
+
+
+def run_harvest(
+        sources, store_kwargs=None, validator=None, graph_uri=None,
+        loader=None, staging=False, delta=False, redis_url=None,
+        concurrency=DEFAULT_CONCURRENCY, source_timeout=DEFAULT_SOURCE_TIMEOUT):
     if not validator:
         validator = get_validator()
 
+    if not loader:
+        loader = get_loader()
+
     if not graph_uri:
         graph_uri = current_app.config.get("GRAPH_URI")
 
+    if delta and not redis_url:
+        redis_url = current_app.config.get("REDIS_URL")
+
     store_kwargs = store_kwargs if store_kwargs else {}
 
     _logger.info("Running harvest:\n%s", pprint.pformat({
         "sources": sources,
         "store_kwargs": store_kwargs,
         "validator": validator,
-        "graph_uri": graph_uri
+        "loader": loader,
+        "graph_uri": graph_uri,
+        "staging": staging,
+        "delta": delta,
+        "concurrency": concurrency,
+        "source_timeout": source_timeout
     }))
 
-    store = breg_harvester.store.get_sparql_store(**store_kwargs)
-    store_graph = Graph(store, identifier=graph_uri)
+    reporter = breg_harvester.progress.get_reporter()
+
+    try:
+        return _run_harvest_stages(
+            sources,
+            store_kwargs=store_kwargs,
+            validator=validator,
+            graph_uri=graph_uri,
+            loader=loader,
+            staging=staging,
+            delta=delta,
+            redis_url=redis_url,
+            concurrency=concurrency,
+            source_timeout=source_timeout,
+            reporter=reporter)
+    except:
+        reporter.finish(failed=True)
+        raise
+
+
+def _run_harvest_stages(
+        sources, store_kwargs, validator, graph_uri, loader, staging,
+        delta, redis_url, concurrency, source_timeout, reporter):
+    redis_client = redis.from_url(redis_url) if delta else None
+    stream_stats = {}
+    reporter.set_phase(PHASE_SOURCES)
+
+    states = {
+        source.uri: breg_harvester.delta.get_source_state(
+            redis_client, graph_uri, source.uri)
+        for source in sources
+    } if delta else {}
+
+    source_results = _process_sources(
+        sources,
+        validator=validator,
+        states=states,
+        delta=delta,
+        concurrency=concurrency,
+        source_timeout=source_timeout,
+        reporter=reporter)
 
     err_sources = [
-        source for source in sources
-        if not validator.validate(source)
+        item.source for item in source_results
+        if item.changed and not item.valid
     ]
 
     if len(err_sources) > 0:
+        _close_spools(source_results)
+
+        for source in err_sources:
+            reporter.set_source_phase(source.uri, PHASE_FAILED)
+
         raise ValueError(f"Invalid sources:\n{pprint.pformat(err_sources)}")
 
-    breg_harvester.store.set_store_header_update(store)
+    if delta:
+        added = set()
+        removed = set()
+        snapshots = {}
+        delta_report = {}
 
-    for source in sources:
-        _logger.debug("Parsing: %s", source)
-        store_graph.parse(source.uri, format=source.rdflib_format)
+        for item in source_results:
+            uri = item.source.uri
+            states[uri].update(_fetch_state(item.fetch_res))
+
+            src_added, src_removed, lines, report = _source_delta(
+                redis_client,
+                graph_uri=graph_uri,
+                item=item,
+                state=states[uri])
+
+            added.update(src_added)
+            removed.update(src_removed)
+            delta_report[uri] = report
+
+            if lines is not None:
+                snapshots[uri] = lines
+
+        stale_removed, stale_report = _stale_sources_delta(
+            redis_client,
+            graph_uri=graph_uri,
+            sources=sources)
+
+        removed.update(stale_removed)
+        delta_report.update(stale_report)
+
+        # Triples that are still provided by any other source must be kept
+
+        for lines in snapshots.values():
+            removed.difference_update(lines)
+
+        removed = breg_harvester.delta.filter_shared_lines(
+            redis_client,
+            lines=removed,
+            keys=[
+                breg_harvester.delta.snapshot_key(graph_uri, source.uri)
+                for source in sources if source.uri not in snapshots
+            ])
+
+        triples_load = breg_harvester.delta.lines_to_graph(added)
+        triples_unload = breg_harvester.delta.lines_to_graph(removed)
+        has_previous = _has_previous_harvest(redis_client, graph_uri)
+    else:
+        triples_load = itertools.chain.from_iterable(
+            _stream_triples(item, stream_stats)
+            for item in source_results)
+
+        triples_unload = []
+        has_previous = False
+
+    # In staging mode the data is loaded into a temporary graph that
+    # replaces the live graph only after the whole load has succeeded.
+    # Delta harvests start from a copy of the live graph
+    # unless there is no snapshot of any previous harvest.
+
+    skip_load = delta and not added and not removed
+    use_staging = staging and not skip_load
+
+    load_uri = breg_harvester.store.build_staging_graph_uri(graph_uri) \
+        if use_staging else graph_uri
+
+    load_stats = None
+    unload_stats = None
+    live_modified = False
+
+    try:
+        if use_staging and has_previous:
+            reporter.set_phase(PHASE_COPY)
+
+            _copy_live_graph(
+                store_kwargs=store_kwargs,
+                graph_uri=graph_uri,
+                staging_uri=load_uri)
+
+        if not skip_load and len(triples_unload) > 0:
+            reporter.set_phase(PHASE_UNLOAD)
+            live_modified = not use_staging
+
+            unload_stats = loader.unload(
+                triples=triples_unload,
+                graph_uri=load_uri,
+                store_kwargs=store_kwargs,
+                progress=lambda num: reporter.increment("triples_unloaded", num))
+
+        if not skip_load:
+            reporter.set_phase(PHASE_LOAD)
+            live_modified = not use_staging
+
+            load_stats = loader.load(
+                triples=triples_load,
+                graph_uri=load_uri,
+                store_kwargs=store_kwargs,
+                progress=lambda num: reporter.increment("triples_loaded", num))
+
+        # Streamed sources are parsed while being loaded
+
+        for uri, stats in stream_stats.items():
+            reporter.update_source(uri, triples_parsed=stats.get("triples"))
+
+        if use_staging:
+            _logger.info("Swapping <%s> into <%s>", load_uri, graph_uri)
+            reporter.set_phase(PHASE_SWAP)
+
+            _swap_staging_graph(
+                store_kwargs=store_kwargs,
+                staging_uri=load_uri,
+                graph_uri=graph_uri)
+    except:
+        _close_spools(source_results)
+
+        if use_staging:
+            _drop_staging_graph(
+                store_kwargs=store_kwargs,
+                staging_uri=load_uri)
+
+        if live_modified and redis_url:
+            _notify_partial_update(redis_client or redis.from_url(redis_url), graph_uri)
+
+        raise
+
+    if delta:
+        _remove_stale_states(redis_client, graph_uri=graph_uri, sources=sources)
+
+        for source in sources:
+            breg_harvester.delta.save_source_state(
+                redis_client,
+                graph_uri=graph_uri,
+                uri=source.uri,
+                state=states[source.uri],
+                lines=snapshots.get(source.uri))
+
+        redis_client.connection_pool.disconnect()
+
+    res = {
+        "num_triples": _count_triples(store_kwargs, graph_uri),
+        "sources": [item.to_dict() for item in sources],
+        "load": load_stats,
+        "staging": staging,
+        "durations": {
+            item.source.uri: item.durations
+            for item in source_results
+        },
+        "streamed": stream_stats,
+        "peak_memory_kb": breg_harvester.utils.peak_memory_kb()
+    }
+
+    if delta:
+        res.update({
+            "unload": unload_stats,
+            "delta": {
+                "sources": delta_report,
+                "num_added": len(added),
+                "num_removed": len(removed)
+            }
+        })
+
+    reporter.set_phase(PHASE_INDEX)
+    res["facets"] = _build_facet_index(redis_url, store_kwargs, graph_uri)
+    res["http"] = breg_harvester.sessions.sessions_stats()
+
+    _logger.info("Harvest result:\n%s", pprint.pformat(res))
+
+    _notify_graph_updated(redis_url, graph_uri)
+    reporter.finish()
+    res["progress"] = reporter.snapshot()
+
+    return res
+
+
+def _fanout_key(parent_id, name):
+    return f"{_FANOUT_KEY_PREFIX}:{parent_id}:{name}"
+
+
+def _fail_deferred_jobs(redis_client, job_ids, reason):
+    """Moves the given jobs to the failed registry if they are still deferred.
+    RQ never enqueues the jobs that depend on a failed job."""
+
+    rqueue = breg_harvester.jobs_queue.get_queue(connection=redis_client)
+
+    for job in Job.fetch_many(job_ids, connection=redis_client):
+        if not job or job.get_status() != JobStatus.DEFERRED:
+            continue
+
+        with redis_client.pipeline() as pipe:
+            job.set_status(JobStatus.FAILED, pipeline=pipe)
+            rqueue.deferred_job_registry.remove(job, pipeline=pipe)
+
+            rqueue.failed_job_registry.add(
+                job,
+                ttl=job.failure_ttl,
+                exc_string=reason,
+                pipeline=pipe)
+
+            pipe.execute()
+
+
+def _release_final_job(redis_client, parent_id):
+    """Enqueues the deferred final job of a fan-out harvest. The final job is
+    released by the last source job, by a failed preparation job or by the
+    watchdog; it is only enqueued once. Returns True if it was enqueued."""
+
+    released = redis_client.set(
+        _fanout_key(parent_id, "released"), 1,
+        nx=True, ex=_FANOUT_KEY_TTL)
+
+    if not released:
+        return False
+
+    parent_job = Job.fetch(parent_id, connection=redis_client)
+    rqueue = breg_harvester.jobs_queue.get_queue(connection=redis_client)
+    rqueue.deferred_job_registry.remove(parent_job)
+    rqueue.enqueue_job(parent_job)
+
+    return True
+
+
+def prepare_harvest(graph_uri, load_uri, store_kwargs, staging, delta, redis_url, parent_id):
+    """First job of a fan-out harvest: the source jobs depend on it.
+    Delta harvests in staging mode start from a copy of the live graph.
+    If the preparation fails the source jobs are failed and the final job
+    is released, which then fails given that no source has been loaded."""
+
+    redis_client = redis.from_url(redis_url)
+
+    try:
+        if staging and delta and _has_previous_harvest(redis_client, graph_uri):
+            _copy_live_graph(
+                store_kwargs=store_kwargs,
+                graph_uri=graph_uri,
+                staging_uri=load_uri)
+    except:
+        parent_job = Job.fetch(parent_id, connection=redis_client)
+
+        _fail_deferred_jobs(
+            redis_client,
+            job_ids=list(parent_job.meta["fanout"]["children"].values()),
+            reason=f"Preparation job failed: {get_current_job().id}")
+
+        _release_final_job(redis_client, parent_id)
+
+        raise
+    finally:
+        redis_client.connection_pool.disconnect()
+
+    return {"graph_uri": graph_uri, "load_uri": load_uri}
+
+
+def _harvest_single_source(
+        redis_client, source, parent_id, store_kwargs, validator,
+        loader, graph_uri, load_uri, delta, source_timeout, reporter):
+    namespace = breg_harvester.delta.pending_namespace(graph_uri, parent_id)
+
+    state = breg_harvester.delta.get_source_state(
+        redis_client, graph_uri, source.uri) if delta else {}
+
+    item = _process_source(
+        source,
+        validator=validator,
+        state=state,
+        delta=delta,
+        source_timeout=source_timeout,
+        reporter=reporter)
+
+    if item.changed and not item.valid:
+        close_spool(item.fetch_res)
+        raise ValueError(f"Invalid source: {source}")
+
+    report = None
+    stream_stats = {}
+
+    if delta:
+        state.update(_fetch_state(item.fetch_res))
+
+        added, removed, lines, report = _source_delta(
+            redis_client,
+            graph_uri=graph_uri,
+            item=item,
+            state=state)
+
+        # Removals are applied by the final job, once the
+        # triples of all the other sources are known
+
+        triples = breg_harvester.delta.lines_to_graph(added)
+        breg_harvester.delta.add_removed_lines(redis_client, namespace, removed)
+    else:
+        triples = _stream_triples(item, stream_stats)
+
+    reporter.set_source_phase(source.uri, PHASE_LOAD)
+
+    try:
+        load_stats = loader.load(
+            triples=triples,
+            graph_uri=load_uri,
+            store_kwargs=store_kwargs,
+            progress=lambda num: reporter.increment_source(
+                source.uri, "triples_loaded", num)) \
+            if item.streamed or len(triples) > 0 else None
+    except:
+        # Without staging the source is loaded into the live graph
+
+        if load_uri == graph_uri:
+            _notify_partial_update(redis_client, graph_uri)
+
+        raise
+    finally:
+        close_spool(item.fetch_res)
+
+    if source.uri in stream_stats:
+        reporter.update_source(
+            source.uri, triples_parsed=stream_stats[source.uri].get("triples"))
+
+    reporter.set_source_phase(source.uri, PHASE_FINISHED, durations={
+        **item.durations,
+        "load": load_stats.get("seconds") if load_stats else 0
+    })
+
+    if delta:
+        breg_harvester.delta.save_source_state(
+            redis_client,
+            graph_uri=namespace,
+            uri=source.uri,
+            state=state,
+            lines=lines)
+
+    return {
+        "load": load_stats,
+        "durations": item.durations,
+        "delta": report,
+        "streamed": stream_stats.get(source.uri),
+        "peak_memory_kb": breg_harvester.utils.peak_memory_kb()
+    }
+
+
+def _join_fanout_child(redis_client, parent_id, uri, child_res):
+    """Records the result of a source job and enqueues
+    the (deferred) final job once all source jobs are done."""
+
+    results_key = _fanout_key(parent_id, "results")
+    pending_key = _fanout_key(parent_id, "pending")
+
+    pipe = redis_client.pipeline()
+    pipe.hset(results_key, uri, json.dumps(breg_harvester.utils.to_json(child_res)))
+    pipe.expire(results_key, _FANOUT_KEY_TTL)
+    pipe.decr(pending_key)
+    remaining = pipe.execute()[-1]
+
+    _logger.debug("Pending source jobs for %s: %s", parent_id, remaining)
+
+    if remaining > 0:
+        return
+
+    _release_final_job(redis_client, parent_id)
+
+
+def _check_fanout_job(job):
+    """Watchdog of a fan-out harvest: releases the deferred final job once
+    all source jobs have ended, including the source jobs that were killed
+    (e.g. on timeout) before they could report their result, and the source
+    jobs that were never run because the preparation job failed.
+    Returns True if the final job has been released."""
+
+    fanout = job.meta.get("fanout")
+
+    if not fanout or job.get_status() != JobStatus.DEFERRED:
+        return False
+
+    rqueue = breg_harvester.jobs_queue.get_queue(connection=job.connection)
+
+    # Jobs of dead workers are moved to the failed registry once they expire
+
+    rqueue.started_job_registry.cleanup()
+
+    child_ids = list(fanout.get("children", {}).values())
+    prepare_job = Job.fetch_many([fanout.get("prepare")], connection=job.connection)[0]
+
+    if prepare_job is None or prepare_job.get_status() == JobStatus.FAILED:
+        _fail_deferred_jobs(
+            job.connection,
+            job_ids=child_ids,
+            reason=f"Preparation job failed: {fanout.get('prepare')}")
+
+    # Expired or deleted jobs (None) are considered ended
+
+    statuses = [
+        item.get_status() if item else None
+        for item in Job.fetch_many(child_ids, connection=job.connection)
+    ]
+
+    if any(status and status not in _FANOUT_ENDED_STATUSES for status in statuses):
+        return False
+
+    _logger.warning("Releasing final job of fan-out harvest: %s", job.id)
+
+    return _release_final_job(job.connection, job.id)
+
+
+def check_fanout_jobs(redis_url):
+    """Runs the watchdog on all the deferred final jobs of fan-out harvests."""
+
+    redis_client = redis.from_url(redis_url)
+    rqueue = breg_harvester.jobs_queue.get_queue(connection=redis_client)
+    released = []
+
+    try:
+        job_ids = rqueue.deferred_job_registry.get_job_ids()
+
+        for job in Job.fetch_many(job_ids, connection=redis_client):
+            try:
+                if job and _check_fanout_job(job):
+                    released.append(job.id)
+            except Exception:
+                _logger.warning("Error checking fan-out job: %s", job.id, exc_info=True)
+    finally:
+        redis_client.connection_pool.disconnect()
+
+    return released
 
-    breg_harvester.store.set_store_header_read(store)
+
+def run_harvest_source(
+        source, parent_id, store_kwargs, validator, loader, graph_uri,
+        load_uri, delta, redis_url, source_timeout=DEFAULT_SOURCE_TIMEOUT):
+    """Fetches, validates and loads a single source of a fan-out harvest."""
+
+    redis_client = redis.from_url(redis_url)
+    child_res = {"uri": source.uri}
+    reporter = breg_harvester.progress.get_reporter(channel_id=parent_id)
+
+    try:
+        res = _harvest_single_source(
+            redis_client,
+            source=source,
+            parent_id=parent_id,
+            store_kwargs=store_kwargs,
+            validator=validator,
+            loader=loader,
+            graph_uri=graph_uri,
+            load_uri=load_uri,
+            delta=delta,
+            source_timeout=source_timeout,
+            reporter=reporter)
+
+        child_res.update(res)
+        child_res["status"] = JobStatus.FINISHED
+
+        return res
+    except Exception as ex:
+        child_res.update({"status": JobStatus.FAILED, "error": repr(ex)})
+        reporter.set_source_phase(source.uri, PHASE_FAILED)
+        raise
+    finally:
+        _join_fanout_child(
+            redis_client,
+            parent_id=parent_id,
+            uri=source.uri,
+            child_res=child_res)
+
+
+def finalize_harvest(sources, store_kwargs, loader, graph_uri, load_uri, staging, delta, redis_url):
+    """Final job of a fan-out harvest. Aggregates the results of the source jobs,
+    applies the delta removals and swaps the staging graph into place."""
+
+    parent_id = get_current_job().id
+    namespace = breg_harvester.delta.pending_namespace(graph_uri, parent_id)
+    redis_client = redis.from_url(redis_url)
+    reporter = breg_harvester.progress.get_reporter()
+
+    results = {
+        key.decode("utf-8"): json.loads(val)
+        for key, val in redis_client.hgetall(_fanout_key(parent_id, "results")).items()
+    }
+
+    failed = [
+        source for source in sources
+        if results.get(source.uri, {}).get("status") != JobStatus.FINISHED
+    ]
+
+    unload_stats = None
+    num_removed = None
+
+    # Without staging the source jobs load into the live graph
+
+    live_modified = not staging and any(
+        item.get("load") for item in results.values())
+
+    try:
+        if failed:
+            raise ValueError(f"Failed sources:\n{pprint.pformat(failed)}")
+
+        if delta:
+            removed = breg_harvester.delta.get_removed_lines(redis_client, namespace)
+
+            stale_removed, _ = _stale_sources_delta(
+                redis_client,
+                graph_uri=graph_uri,
+                sources=sources)
+
+            removed.update(stale_removed)
+
+            keys = [
+                breg_harvester.delta.snapshot_key(namespace, source.uri)
+                if breg_harvester.delta.has_snapshot(redis_client, namespace, source.uri)
+                else breg_harvester.delta.snapshot_key(graph_uri, source.uri)
+                for source in sources
+            ]
+
+            removed = breg_harvester.delta.filter_shared_lines(
+                redis_client, lines=removed, keys=keys)
+
+            num_removed = len(removed)
+
+            if removed:
+                reporter.set_phase(PHASE_UNLOAD)
+                live_modified = live_modified or not staging
+
+                unload_stats = loader.unload(
+                    triples=breg_harvester.delta.lines_to_graph(removed),
+                    graph_uri=load_uri,
+                    store_kwargs=store_kwargs,
+                    progress=lambda num: reporter.increment("triples_unloaded", num))
+
+        if staging:
+            _logger.info("Swapping <%s> into <%s>", load_uri, graph_uri)
+            reporter.set_phase(PHASE_SWAP)
+
+            _swap_staging_graph(
+                store_kwargs=store_kwargs,
+                staging_uri=load_uri,
+                graph_uri=graph_uri)
+
+        if delta:
+            _remove_stale_states(redis_client, graph_uri=graph_uri, sources=sources)
+
+            for source in sources:
+                breg_harvester.delta.commit_source_state(
+                    redis_client,
+                    namespace=namespace,
+                    graph_uri=graph_uri,
+                    uri=source.uri)
+    except:
+        reporter.finish(failed=True)
+
+        if staging:
+            _drop_staging_graph(
+                store_kwargs=store_kwargs,
+                staging_uri=load_uri)
+
+        if live_modified:
+            _notify_partial_update(redis_client, graph_uri)
+
+        raise
+    finally:
+        breg_harvester.delta.clear_namespace(redis_client, namespace)
+
+        redis_client.delete(
+            _fanout_key(parent_id, "results"),
+            _fanout_key(parent_id, "pending"),
+            _fanout_key(parent_id, "released"))
+
+        redis_client.connection_pool.disconnect()
 
     res = {
-        "num_triples": len(store_graph),
-        "sources": [item.to_dict() for item in sources]
+        "num_triples": _count_triples(store_kwargs, graph_uri),
+        "sources": [item.to_dict() for item in sources],
+        "staging": staging,
+        "fanout": results,
+        "peak_memory_kb": max(
+            [item.get("peak_memory_kb") or 0 for item in results.values()] +
+            [breg_harvester.utils.peak_memory_kb() or 0])
     }
 
+    if delta:
+        res.update({"unload": unload_stats, "delta": {"num_removed": num_removed}})
+
+    reporter.set_phase(PHASE_INDEX)
+    res["facets"] = _build_facet_index(redis_url, store_kwargs, graph_uri)
+    res["http"] = breg_harvester.sessions.sessions_stats()
+
     _logger.info("Harvest result:\n%s", pprint.pformat(res))
 
-    store_graph.close()
+    _notify_graph_updated(redis_url, graph_uri)
+    reporter.finish()
+    res["progress"] = reporter.snapshot()
 
     return res
 
@@ -79,6 +1080,104 @@ def get_sources():
     return jsonify([source.to_dict() for source in sources])
 
 
+def _enqueue_fanout_jobs(rqueue, harvest_kwargs, result_ttl):
+    """Enqueues one job per source plus a deferred final job.
+    The source jobs depend on a preparation job and the last source
+    job to finish enqueues the final job. The final job is returned
+    given that it represents the harvest as a whole."""
+
+    sources = harvest_kwargs["sources"]
+    graph_uri = harvest_kwargs["graph_uri"]
+    staging = harvest_kwargs["staging"]
+
+    load_uri = breg_harvester.store.build_staging_graph_uri(graph_uri) \
+        if staging else graph_uri
+
+    parent_id = str(uuid.uuid4())
+    prepare_id = str(uuid.uuid4())
+    child_ids = {source.uri: str(uuid.uuid4()) for source in sources}
+
+    common_kwargs = {
+        "store_kwargs": harvest_kwargs["store_kwargs"],
+        "graph_uri": graph_uri,
+        "load_uri": load_uri,
+        "delta": harvest_kwargs["delta"],
+        "redis_url": harvest_kwargs["redis_url"]
+    }
+
+    rqueue.connection.set(
+        _fanout_key(parent_id, "pending"),
+        len(sources),
+        ex=_FANOUT_KEY_TTL)
+
+    parent_job = Job.create(
+        finalize_harvest,
+        kwargs={
+            **common_kwargs,
+            "sources": sources,
+            "loader": harvest_kwargs["loader"],
+            "staging": staging
+        },
+        connection=rqueue.connection,
+        id=parent_id,
+        origin=rqueue.name,
+        result_ttl=result_ttl,
+        status=JobStatus.DEFERRED,
+        meta={"fanout": {"prepare": prepare_id, "children": child_ids}})
+
+    parent_job.save()
+
+    # Deferred jobs are only visible to operators through this registry
+
+    rqueue.deferred_job_registry.add(parent_job)
+
+    prepare_job = rqueue.enqueue(
+        prepare_harvest,
+        job_id=prepare_id,
+        result_ttl=result_ttl,
+        kwargs={**common_kwargs, "staging": staging, "parent_id": parent_id})
+
+    for source in sources:
+        rqueue.enqueue(
+            run_harvest_source,
+            job_id=child_ids[source.uri],
+            depends_on=prepare_job,
+            result_ttl=result_ttl,
+            kwargs={
+                **common_kwargs,
+                "source": source,
+                "parent_id": parent_id,
+                "validator": harvest_kwargs["validator"],
+                "loader": harvest_kwargs["loader"],
+                "source_timeout": harvest_kwargs["source_timeout"]
+            })
+
+    return parent_job
+
+
+def _fanout_progress(job):
+    fanout = job.meta.get("fanout")
+
+    if not fanout:
+        return None
+
+    child_ids = fanout.get("children", {})
+    job_ids = [fanout.get("prepare")] + list(child_ids.values())
+    jobs = Job.fetch_many(job_ids, connection=job.connection)
+    statuses = [item.get_status() if item else None for item in jobs]
+    source_statuses = dict(zip(child_ids.keys(), statuses[1:]))
+    counts = collections.Counter(source_statuses.values())
+
+    return {
+        "prepare": statuses[0],
+        "sources": source_statuses,
+        "total": len(child_ids),
+        "finished": counts.get(JobStatus.FINISHED, 0),
+        "failed": counts.get(JobStatus.FAILED, 0),
+        "started": counts.get(JobStatus.STARTED, 0)
+    }
+
+
 def enqueue_harvest_job(sources, app_config=None):
     app_config = app_config if app_config else current_app.config
 
@@ -98,23 +1197,38 @@ def enqueue_harvest_job(sources, app_config=None):
     }
 
     validator = get_validator(app_config=app_config)
+    loader = get_loader(app_config=app_config)
     graph_uri = app_config.get("GRAPH_URI")
+    staging = bool(app_config.get("STAGING_ENABLED"))
+    delta = bool(app_config.get("DELTA_ENABLED"))
 
     harvest_kwargs = {
         "sources": sources,
         "store_kwargs": store_kwargs,
         "validator": validator,
-        "graph_uri": graph_uri
+        "loader": loader,
+        "graph_uri": graph_uri,
+        "staging": staging,
+        "delta": delta,
+        "redis_url": app_config.get("REDIS_URL"),
+        "concurrency": app_config.get("CONCURRENCY") or DEFAULT_CONCURRENCY,
+        "source_timeout": app_config.get("SOURCE_TIMEOUT") or DEFAULT_SOURCE_TIMEOUT
     }
 
     _logger.debug("Enqueuing new harvest job:\n%s", pprint.pformat(sources))
 
     result_ttl = app_config.get("RESULT_TTL")
 
-    job = rqueue.enqueue(
-        run_harvest,
-        result_ttl=result_ttl,
-        kwargs=harvest_kwargs)
+    if app_config.get("FANOUT_ENABLED"):
+        job = _enqueue_fanout_jobs(
+            rqueue=rqueue,
+            harvest_kwargs=harvest_kwargs,
+            result_ttl=result_ttl)
+    else:
+        job = rqueue.enqueue(
+            run_harvest,
+            result_ttl=result_ttl,
+            kwargs=harvest_kwargs)
 
     return breg_harvester.utils.job_to_json(job)
 
@@ -140,7 +1254,37 @@ def get_harvest_job(job_id):
     if not job:
         raise NotFound()
 
-    return breg_harvester.utils.job_to_json(job)
+    job_dict = breg_harvester.utils.job_to_json(job)
+    job_dict["progress"] = breg_harvester.progress.get_job_progress(job)
+    progress = _fanout_progress(job)
+
+    if progress:
+        job_dict["fanout"] = breg_harvester.utils.to_json(progress)
+
+    return job_dict
+
+
+@blueprint.route("/<job_id>/events", methods=["GET"])
+def get_harvest_job_events(job_id):
+    """Streams the progress of the job as Server-Sent Events."""
+
+    rqueue = breg_harvester.jobs_queue.get_queue()
+    job = rqueue.fetch_job(job_id)
+
+    if not job:
+        raise NotFound()
+
+    events = breg_harvester.progress.iter_events(
+        breg_harvester.jobs_queue.get_redis(),
+        job=job)
+
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        })
 
 
 def _fetch_registry_jobs(reg, rqueue, num, extended):
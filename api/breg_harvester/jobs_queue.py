@@ -5,11 +5,16 @@ import redis
 from flask import current_app, g
 from rq import Queue
 
+from breg_harvester.utils import ProcessLock
+
 ENV_TIMEOUT = "HARVESTER_QUEUE_TIMEOUT"
 DEFAULT_TIMEOUT = 1800
 
 _logger = logging.getLogger(__name__)
 
+_pools = {}
+_pools_lock = ProcessLock()
+
 
 def get_queue(connection=None):
     connection = connection if connection else get_redis()
@@ -20,25 +25,30 @@ def get_queue(connection=None):
         default_timeout=default_timeout)
 
 
+def _get_connection_pool(redis_url):
+    """Connection pools are shared by all the requests of the process.
+    Redis connection pools reset themselves when used after a fork."""
+
+    with _pools_lock:
+        if redis_url not in _pools:
+            _pools[redis_url] = redis.ConnectionPool.from_url(redis_url)
+
+        return _pools[redis_url]
+
+
 def get_redis():
     if "redis" not in g:
         redis_url = current_app.config.get("REDIS_URL")
-        redis_client = redis.from_url(redis_url)
-        g.redis = redis_client
+        pool = _get_connection_pool(redis_url)
+        g.redis = redis.Redis(connection_pool=pool)
 
     return g.get("redis")
 
 
 def close_redis(e=None):
-    redis_client = g.pop("redis", None)
-
-    if redis_client is None:
-        return
+    # Connections are released to the shared pool after each command
 
-    try:
-        redis_client.connection_pool.disconnect()
-    except:
-        _logger.warning("Error closing Redis", exc_info=True)
+    g.pop("redis", None)
 
 
 def init_app_redis(app):
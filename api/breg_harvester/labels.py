@@ -0,0 +1,354 @@
+"""Index of the human-readable labels of vocabulary terms.
+
+Labels are extracted once from the dereferenced graph of each term and
+kept in a Redis hash per term. Hash fields follow the <lang>|<property> format
+(the language is empty for untagged literals). An additional marker field
+is always set so that terms without labels are also known to be indexed.
+
+The index is a managed cache: label hashes expire after a TTL, the least
+recently used terms are evicted when the number of terms exceeds a budget
+and terms that could not be dereferenced are retried with exponential back-off.
+Terms preloaded from vocabulary dumps are pinned: they have their own TTL
+and are exempt from the budget, given that they are refreshed in bulk."""
+
+import itertools
+import logging
+import time
+
+from flask import current_app
+from rdflib import Literal, URIRef
+from rdflib.namespace import DCTERMS, RDF, RDFS, SKOS
+
+from breg_harvester.jobs_queue import get_redis
+
+_logger = logging.getLogger(__name__)
+
+LABEL_PROPERTIES = [SKOS.prefLabel, RDFS.label, DCTERMS.title]
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 3600
+DEFAULT_MAX_TERMS = 50000
+DEFAULT_PINNED_TTL = 14 * 24 * 3600
+MAX_NEGATIVE_TTL = 7 * 24 * 3600
+
+_KEY_PREFIX = "breg:harvester:labels"
+_KEY_LRU = f"{_KEY_PREFIX}:lru"
+_KEY_SIZES = f"{_KEY_PREFIX}:sizes"
+_KEY_EXPIRES = f"{_KEY_PREFIX}:expires"
+_KEY_STATS = f"{_KEY_PREFIX}:stats"
+_KEY_FAILED = f"{_KEY_PREFIX}:failed"
+_KEY_ATTEMPTS_PREFIX = f"{_KEY_PREFIX}:attempts"
+_FIELD_INDEXED = "_"
+_FIELD_SEP = "|"
+_STAT_HITS = "hits"
+_STAT_MISSES = "misses"
+_STAT_EVICTIONS = "evictions"
+
+
+def _decode(val):
+    return val.decode("utf-8") if isinstance(val, bytes) else val
+
+
+def _labels_key(val):
+    return f"{_KEY_PREFIX}:{val}"
+
+
+def _attempts_key(val):
+    return f"{_KEY_ATTEMPTS_PREFIX}:{val}"
+
+
+def build_labels_key(term):
+    return _labels_key(term.n3())
+
+
+def _labels_size(labels):
+    return sum(len(key) + len(val) for key, val in labels.items())
+
+
+def _label_field(prop, literal):
+    return f"{literal.language or ''}{_FIELD_SEP}{prop}"
+
+
+def extract_labels(graph, term):
+    """Returns a dict with the first label of the term
+    for each combination of language and label property."""
+
+    labels = {_FIELD_INDEXED: ""}
+
+    for prop in LABEL_PROPERTIES:
+        for obj in graph.objects(subject=term, predicate=prop):
+            if isinstance(obj, Literal):
+                labels.setdefault(_label_field(prop, obj), str(obj))
+
+    return labels
+
+
+def extract_all_labels(graph):
+    """Returns a dict of term to labels for all the URIs in the graph
+    that have labels or are SKOS concepts, in a single pass over each property."""
+
+    terms = {
+        subj: {_FIELD_INDEXED: ""}
+        for subj in graph.subjects(predicate=RDF.type, object=SKOS.Concept)
+        if isinstance(subj, URIRef)
+    }
+
+    for prop in LABEL_PROPERTIES:
+        for subj, obj in graph.subject_objects(predicate=prop):
+            if not isinstance(subj, URIRef) or not isinstance(obj, Literal):
+                continue
+
+            labels = terms.setdefault(subj, {_FIELD_INDEXED: ""})
+            labels.setdefault(_label_field(prop, obj), str(obj))
+
+    return terms
+
+
+def select_label(labels, lang="en"):
+    """Returns the (property, label) tuple that best matches the language.
+    Label properties are checked in order of preference and
+    untagged labels are used when there is no label in the given language."""
+
+    for label_lang in [lang, ""]:
+        for prop in LABEL_PROPERTIES:
+            label = labels.get(f"{label_lang}{_FIELD_SEP}{prop}")
+
+            if label is not None:
+                return prop, label
+
+    return None, None
+
+
+class LabelIndex:
+    def __init__(
+            self, redis, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+            max_terms=DEFAULT_MAX_TERMS, pinned_ttl=DEFAULT_PINNED_TTL):
+        self.redis = redis
+        self.ttl = int(ttl)
+        self.negative_ttl = int(negative_ttl)
+        self.max_terms = int(max_terms)
+        self.pinned_ttl = int(pinned_ttl)
+
+    @property
+    def settings(self):
+        """Keyword arguments to build an equivalent index on another connection."""
+
+        return {
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "max_terms": self.max_terms,
+            "pinned_ttl": self.pinned_ttl
+        }
+
+    def get(self, terms):
+        """Returns a dict of term to labels for the indexed terms.
+        All hashes are read in a pipelined round trip. The access times
+        of the hits (pinned terms excluded) are refreshed in a second one,
+        together with the hit counters."""
+
+        if not terms:
+            return {}
+
+        pipe = self.redis.pipeline(transaction=False)
+
+        for term in terms:
+            pipe.hgetall(build_labels_key(term))
+
+        res = pipe.execute()
+
+        labels = {
+            term: {_decode(key): _decode(val) for key, val in item.items()}
+            for term, item in zip(terms, res) if item
+        }
+
+        pipe = self.redis.pipeline(transaction=False)
+
+        if labels:
+            now = time.time()
+            pipe.zadd(_KEY_LRU, {term.n3(): now for term in labels}, xx=True)
+
+        pipe.hincrby(_KEY_STATS, _STAT_HITS, len(labels))
+        pipe.hincrby(_KEY_STATS, _STAT_MISSES, len(terms) - len(labels))
+        pipe.execute()
+
+        return labels
+
+    def _save(self, pipe, term, labels, now, pinned=False):
+        val = term.n3()
+        name = _labels_key(val)
+        ttl = self.pinned_ttl if pinned else self.ttl
+        pipe.delete(name)
+        pipe.hset(name, mapping=labels)
+        pipe.expire(name, ttl)
+
+        if pinned:
+            pipe.zrem(_KEY_LRU, val)
+        else:
+            pipe.zadd(_KEY_LRU, {val: now})
+
+        pipe.zadd(_KEY_EXPIRES, {val: now + ttl})
+        pipe.hset(_KEY_SIZES, val, _labels_size(labels))
+        pipe.zrem(_KEY_FAILED, val)
+        pipe.delete(_attempts_key(val))
+
+    def save(self, term, labels):
+        _logger.debug("HSET %s (%s fields)", build_labels_key(term), len(labels))
+        pipe = self.redis.pipeline(transaction=False)
+        self._save(pipe, term, labels, now=time.time())
+        pipe.execute()
+        self.enforce_budget()
+
+    def save_many(self, term_labels, batch_size=1000, pinned=False):
+        """Indexes the labels of multiple terms in pipelined batches.
+        Pinned terms expire after the pinned TTL and are never evicted."""
+
+        items = iter(term_labels.items())
+
+        while True:
+            batch = list(itertools.islice(items, batch_size))
+
+            if not batch:
+                break
+
+            now = time.time()
+            pipe = self.redis.pipeline(transaction=False)
+
+            for term, labels in batch:
+                self._save(pipe, term, labels, now=now, pinned=pinned)
+
+            pipe.execute()
+
+        self.enforce_budget()
+
+    def prune_expired(self):
+        """Removes the terms whose hashes have expired
+        from the access times and the sizes of the index."""
+
+        now = time.time()
+        members = [_decode(item) for item in self.redis.zrangebyscore(_KEY_EXPIRES, "-inf", now)]
+
+        if not members:
+            return 0
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrem(_KEY_LRU, *members)
+        pipe.hdel(_KEY_SIZES, *members)
+        pipe.zrem(_KEY_EXPIRES, *members)
+        pipe.execute()
+
+        return len(members)
+
+    def enforce_budget(self):
+        """Evicts the least recently used terms that exceed the budget,
+        once the terms whose hashes have already expired are pruned.
+        Pinned terms do not count towards the budget."""
+
+        self.prune_expired()
+        excess = self.redis.zcard(_KEY_LRU) - self.max_terms
+
+        if excess <= 0:
+            return 0
+
+        members = [_decode(item) for item in self.redis.zrange(_KEY_LRU, 0, excess - 1)]
+
+        if not members:
+            return 0
+
+        _logger.debug("Evicting %s terms from the label index", len(members))
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(*[_labels_key(val) for val in members])
+        pipe.zrem(_KEY_LRU, *members)
+        pipe.hdel(_KEY_SIZES, *members)
+        pipe.zrem(_KEY_EXPIRES, *members)
+        pipe.hincrby(_KEY_STATS, _STAT_EVICTIONS, len(members))
+        pipe.execute()
+
+        return len(members)
+
+    def flag_failed(self, term):
+        """Blocks the term until its next retry. The delay is doubled
+        after each consecutive failure up to MAX_NEGATIVE_TTL.
+        The count of failures is kept in a key per term that expires
+        at the same time as the failed entry is pruned, so that
+        terms that never resolve do not accumulate in the index."""
+
+        val = term.n3()
+        attempts_key = _attempts_key(val)
+        attempts = self.redis.incr(attempts_key)
+        delay = min(self.negative_ttl * 2 ** (attempts - 1), MAX_NEGATIVE_TTL)
+
+        _logger.debug("Term %s failed (attempt #%s): Retry in %s s", term, attempts, delay)
+
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.expire(attempts_key, delay + MAX_NEGATIVE_TTL)
+        pipe.zadd(_KEY_FAILED, {val: now + delay})
+        pipe.zremrangebyscore(_KEY_FAILED, "-inf", now - MAX_NEGATIVE_TTL)
+        pipe.execute()
+
+    def get_failed(self, terms):
+        """Returns the subset of terms that are waiting to be retried."""
+
+        if not terms:
+            return set()
+
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+
+        for term in terms:
+            pipe.zscore(_KEY_FAILED, term.n3())
+
+        res = pipe.execute()
+
+        return set(
+            term for term, retry_at in zip(terms, res)
+            if retry_at is not None and retry_at > now)
+
+    def stats(self):
+        self.prune_expired()
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(_KEY_STATS)
+        pipe.zcard(_KEY_EXPIRES)
+        pipe.zcard(_KEY_LRU)
+        pipe.hvals(_KEY_SIZES)
+        pipe.zcount(_KEY_FAILED, time.time(), "+inf")
+        counters, num_terms, num_lru, sizes, num_failed = pipe.execute()
+
+        counters = {_decode(key): int(val) for key, val in counters.items()}
+        hits = counters.get(_STAT_HITS, 0)
+        misses = counters.get(_STAT_MISSES, 0)
+        lookups = hits + misses
+
+        return {
+            "terms": num_terms,
+            "pinned": num_terms - num_lru,
+            "max_terms": self.max_terms,
+            "bytes": sum(int(item) for item in sizes),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "evictions": counters.get(_STAT_EVICTIONS, 0),
+            "failed": num_failed,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "pinned_ttl": self.pinned_ttl
+        }
+
+
+def get_label_index(app_config=None, redis=None):
+    app_config = app_config if app_config else current_app.config
+    redis = redis if redis else get_redis()
+
+    # Pinned terms outlive a failed preload of the vocabularies
+
+    preload_interval = app_config.get("VOCABULARIES_INTERVAL")
+    pinned_ttl = 2 * int(preload_interval) if preload_interval else DEFAULT_PINNED_TTL
+
+    return LabelIndex(
+        redis,
+        ttl=app_config.get("LABELS_TTL") or DEFAULT_TTL,
+        negative_ttl=app_config.get("LABELS_NEGATIVE_TTL") or DEFAULT_NEGATIVE_TTL,
+        max_terms=app_config.get("LABELS_MAX_TERMS") or DEFAULT_MAX_TERMS,
+        pinned_ttl=pinned_ttl)
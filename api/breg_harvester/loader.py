@@ -0,0 +1,241 @@
+import enum
+import itertools
+import logging
+import time
+
+from flask import current_app
+from rdflib import Graph
+
+import breg_harvester.store
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+class LoadMethods(enum.Enum):
+    STORE = "store"
+    INSERT = "insert"
+    GSP = "gsp"
+
+
+def _iter_batches(triples, batch_size):
+    iterator = iter(triples)
+
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+
+        if not batch:
+            return
+
+        yield batch
+
+
+def _build_data_update(operation, batch, graph_uri):
+    statements = "\n".join(
+        breg_harvester.store.triple_to_sparql(triple)
+        for triple in batch)
+
+    return "{} {{ GRAPH <{}> {{\n{}\n}} }}".format(
+        operation, graph_uri, statements)
+
+
+def _build_stats(method, batch_size, num_batches, num_triples, started):
+    seconds = time.time() - started
+    throughput = num_triples / seconds if seconds > 0 else None
+
+    return {
+        "method": method.value,
+        "batch_size": batch_size,
+        "num_batches": num_batches,
+        "num_triples": num_triples,
+        "seconds": round(seconds, 3),
+        "triples_per_second": round(throughput, 1) if throughput else None
+    }
+
+
+class StoreLoader:
+    """Adds the triples one by one through the rdflib SPARQLUpdateStore.
+    Each triple is sent in its own SPARQL update request."""
+
+    method = LoadMethods.STORE
+
+    def _run(self, triples, graph_uri, store_kwargs, remove, progress):
+        store_kwargs = store_kwargs if store_kwargs else {}
+        started = time.time()
+
+        store = breg_harvester.store.get_sparql_store(**store_kwargs)
+        store_graph = Graph(store, identifier=graph_uri)
+
+        num_triples = 0
+
+        for triple in triples:
+            if remove:
+                store_graph.remove(triple)
+            else:
+                store_graph.add(triple)
+
+            num_triples += 1
+
+            if progress:
+                progress(1)
+
+        store_graph.close()
+
+        return _build_stats(
+            method=self.method,
+            batch_size=1,
+            num_batches=num_triples,
+            num_triples=num_triples,
+            started=started)
+
+    def load(self, triples, graph_uri, store_kwargs=None, progress=None):
+        return self._run(
+            triples=triples,
+            graph_uri=graph_uri,
+            store_kwargs=store_kwargs,
+            remove=False,
+            progress=progress)
+
+    def unload(self, triples, graph_uri, store_kwargs=None, progress=None):
+        return self._run(
+            triples=triples,
+            graph_uri=graph_uri,
+            store_kwargs=store_kwargs,
+            remove=True,
+            progress=progress)
+
+
+class BatchLoader:
+    """Base class for loaders that push the triples
+    to the triple store in fixed-size batches.
+    The optional progress function of load and unload
+    receives the number of triples of each batch that is sent."""
+
+    method = None
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = int(batch_size)
+
+    def load_batch(self, session, batch, graph_uri, store_kwargs):
+        raise NotImplementedError
+
+    def unload_batch(self, session, batch, graph_uri, store_kwargs):
+        query = _build_data_update("DELETE DATA", batch, graph_uri)
+
+        breg_harvester.store.run_sparql_update(
+            session=session,
+            query=query,
+            update_endpoint=store_kwargs.get("update_endpoint"))
+
+    def _run(self, triples, graph_uri, store_kwargs, batch_func, progress):
+        store_kwargs = store_kwargs if store_kwargs else {}
+        started = time.time()
+
+        session = breg_harvester.store.get_store_session(
+            sparql_user=store_kwargs.get("sparql_user"),
+            sparql_pass=store_kwargs.get("sparql_pass"))
+
+        num_batches = 0
+        num_triples = 0
+
+        try:
+            for batch in _iter_batches(triples, self.batch_size):
+                _logger.debug(
+                    "Sending batch #%s (%s triples) to <%s>",
+                    num_batches, len(batch), graph_uri)
+
+                batch_func(
+                    session=session,
+                    batch=batch,
+                    graph_uri=graph_uri,
+                    store_kwargs=store_kwargs)
+
+                num_batches += 1
+                num_triples += len(batch)
+
+                if progress:
+                    progress(len(batch))
+        finally:
+            session.close()
+
+        return _build_stats(
+            method=self.method,
+            batch_size=self.batch_size,
+            num_batches=num_batches,
+            num_triples=num_triples,
+            started=started)
+
+    def load(self, triples, graph_uri, store_kwargs=None, progress=None):
+        return self._run(
+            triples=triples,
+            graph_uri=graph_uri,
+            store_kwargs=store_kwargs,
+            batch_func=self.load_batch,
+            progress=progress)
+
+    def unload(self, triples, graph_uri, store_kwargs=None, progress=None):
+        return self._run(
+            triples=triples,
+            graph_uri=graph_uri,
+            store_kwargs=store_kwargs,
+            batch_func=self.unload_batch,
+            progress=progress)
+
+
+class InsertDataLoader(BatchLoader):
+    """Sends each batch of triples as a single SPARQL INSERT DATA update."""
+
+    method = LoadMethods.INSERT
+
+    def load_batch(self, session, batch, graph_uri, store_kwargs):
+        query = _build_data_update("INSERT DATA", batch, graph_uri)
+
+        breg_harvester.store.run_sparql_update(
+            session=session,
+            query=query,
+            update_endpoint=store_kwargs.get("update_endpoint"))
+
+
+class GraphStoreLoader(BatchLoader):
+    """Sends each batch of triples as a Turtle document
+    using the SPARQL 1.1 Graph Store HTTP Protocol.
+    Triples are removed with DELETE DATA updates given that
+    the protocol does not support partial deletes."""
+
+    method = LoadMethods.GSP
+
+    def __init__(self, gsp_endpoint, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(batch_size=batch_size)
+        self.gsp_endpoint = gsp_endpoint
+
+    def load_batch(self, session, batch, graph_uri, store_kwargs):
+        data = "\n".join(
+            breg_harvester.store.triple_to_sparql(triple)
+            for triple in batch)
+
+        breg_harvester.store.post_graph_data(
+            session=session,
+            data=data,
+            graph_uri=graph_uri,
+            gsp_endpoint=self.gsp_endpoint)
+
+
+def get_loader(app_config=None):
+    app_config = app_config if app_config else current_app.config
+
+    method = app_config.get("LOAD_METHOD") or LoadMethods.STORE.value
+    batch_size = app_config.get("LOAD_BATCH_SIZE") or DEFAULT_BATCH_SIZE
+
+    if method == LoadMethods.STORE.value:
+        return StoreLoader()
+
+    if method == LoadMethods.INSERT.value:
+        return InsertDataLoader(batch_size=batch_size)
+
+    if method == LoadMethods.GSP.value:
+        return GraphStoreLoader(
+            gsp_endpoint=app_config.get("GSP_ENDPOINT"),
+            batch_size=batch_size)
+
+    raise ValueError(f"Unknown load method: {method}")
@@ -38,8 +38,9 @@ class SourceDataset:
     ENV_SOURCES = "HARVESTER_SOURCES"
 
     @classmethod
-    def from_env(cls):
-        sources_str = os.getenv(cls.ENV_SOURCES)
+    def from_env(cls, env_var=None):
+        env_var = env_var if env_var else cls.ENV_SOURCES
+        sources_str = os.getenv(env_var)
 
         if not sources_str:
             return None
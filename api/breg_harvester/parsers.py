@@ -0,0 +1,196 @@
+"""Pool of processes that parse the RDF documents of dereferenced terms.
+
+Parsing is CPU-bound and holds the GIL, which stalls every other thread
+(or greenlet) of the API workers. Documents are parsed in a pool of
+processes instead, which is started on the first parse of each process
+and loads the rdflib parser plugins upfront.
+
+Callers wait for the result until a deadline. Running tasks cannot be
+interrupted, so a parse that misses its deadline retires its pool:
+new parses go to a new pool, and the retired pool is terminated once
+the other parses that are still running in it have finished.
+The pool is disabled (documents are parsed in the calling process)
+when the number of workers is zero.
+
+The pool is also disabled in cooperative workers (e.g. the eventlet
+workers of gunicorn), where the threading module is monkey-patched:
+the process pool relies on native threads and locks to manage its
+processes, which is not known to be safe under green threads.
+Harvests are not parsed in the pool either: each job runs in its own
+work horse process, so parsing in the job process does not stall any
+other job and avoids copying the parsed triples between processes."""
+
+import concurrent.futures
+import logging
+import os
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from rdflib import Graph, URIRef
+
+import breg_harvester.labels
+from breg_harvester.utils import ProcessLock
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_DEADLINE = 60
+
+_WARM_UP_DOCS = [
+    ("turtle", "<urn:s> <urn:p> <urn:o> ."),
+    ("nt", "<urn:s> <urn:p> <urn:o> ."),
+    ("xml", (
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="urn:s"/></rdf:RDF>')),
+    ("json-ld", '{"@id": "urn:s", "urn:p": {"@id": "urn:o"}}')
+]
+
+_lock = ProcessLock()
+_pool = None
+_max_workers = DEFAULT_WORKERS
+
+
+def _warm_up():
+    for frmt, data in _WARM_UP_DOCS:
+        try:
+            Graph().parse(data=data, format=frmt)
+        except Exception:
+            _logger.debug("Error warming up parser: %s", frmt, exc_info=True)
+
+
+def _is_green():
+    """Returns True if the threads of the process are green threads.
+    eventlet is only checked if it has already been imported
+    (i.e. by the eventlet workers of gunicorn)."""
+
+    patcher = sys.modules.get("eventlet.patcher")
+
+    return bool(patcher) and patcher.is_monkey_patched("thread")
+
+
+def is_pool_enabled():
+    return _max_workers > 0 and not _is_green()
+
+
+def init_parser_pool(app_config):
+    """Applies the number of workers of the configuration
+    to the pools that are created from now on in the current process."""
+
+    global _max_workers
+
+    workers = app_config.get("PARSER_WORKERS")
+    _max_workers = int(workers) if workers is not None else DEFAULT_WORKERS
+
+
+class _ParserPool:
+    """Process pool and the parses that are still pending in it."""
+
+    def __init__(self, max_workers):
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_warm_up)
+
+        self.pid = os.getpid()
+        self.pending = set()
+        self.expired = set()
+        self.retired = False
+        self.terminated = False
+
+    def submit(self, func, *args):
+        future = self.executor.submit(func, *args)
+
+        with _lock:
+            self.pending.add(future)
+
+        future.add_done_callback(self._on_done)
+
+        return future
+
+    def _on_done(self, future):
+        with _lock:
+            self.pending.discard(future)
+            self.expired.discard(future)
+
+        self._terminate_if_drained()
+
+    def retire(self, expired=None):
+        """Stops sending parses to this pool. The pool is terminated
+        as soon as the only parses left are those that missed their deadline."""
+
+        with _lock:
+            self.retired = True
+
+            if expired is not None and expired in self.pending:
+                self.expired.add(expired)
+
+        self._terminate_if_drained()
+
+    def _terminate_if_drained(self):
+        with _lock:
+            if not self.retired or self.terminated or self.pending - self.expired:
+                return
+
+            self.terminated = True
+
+        # There is no public API to stop the running tasks of the pool
+
+        processes = list((getattr(self.executor, "_processes", None) or {}).values())
+
+        for proc in processes:
+            proc.terminate()
+
+        self.executor.shutdown(wait=False)
+
+        _logger.warning("Terminated parser pool (%s processes)", len(processes))
+
+
+def _get_pool():
+    global _pool
+
+    with _lock:
+        # The pool of the parent process is not usable after a fork
+
+        if _pool is None or _pool.retired or _pool.pid != os.getpid():
+            _pool = _ParserPool(max_workers=_max_workers)
+
+        return _pool
+
+
+def run_parser(func, *args, deadline=DEFAULT_DEADLINE):
+    """Runs the parse function in the pool and returns its result.
+    Raises TimeoutError if the result is not ready before the deadline (seconds).
+    Raises BrokenProcessPool if a process of the pool died during the parse:
+    the pool is replaced and the parse may be retried."""
+
+    if not is_pool_enabled():
+        return func(*args)
+
+    pool = _get_pool()
+    future = pool.submit(func, *args)
+
+    try:
+        return future.result(timeout=deadline)
+    except concurrent.futures.TimeoutError:
+        if not future.cancel():
+            pool.retire(expired=future)
+
+        raise TimeoutError(f"Parse did not finish in {deadline} s")
+    except BrokenProcessPool:
+        pool.retire()
+        raise
+
+
+def parse_labels(data, frmt, public_id, term):
+    """Returns the labels of the term in the document (see labels.extract_labels)."""
+
+    started = time.time()
+    graph = Graph()
+    graph.parse(data=data, format=frmt, publicID=public_id)
+    labels = breg_harvester.labels.extract_labels(graph=graph, term=URIRef(term))
+
+    _logger.debug(
+        "Parsed %s as %s (%s bytes) in %.3f s",
+        public_id, frmt, len(data), time.time() - started)
+
+    return labels
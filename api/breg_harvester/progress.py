@@ -0,0 +1,239 @@
+"""Progress reports of running harvest jobs.
+
+Each job keeps a snapshot of its progress in the job metadata
+(the current phase of each source, the bytes fetched, the triples parsed
+and loaded, and the time spent in each phase). Snapshots are published
+to a Redis channel of the harvest so that clients can follow the job
+without polling. The source jobs of a fan-out harvest publish
+to the channel of the final job: their snapshots only contain
+the sources, which are merged into the snapshot of the harvest."""
+
+import datetime
+import json
+import logging
+import time
+
+from rq import get_current_job
+from rq.job import Job, JobStatus
+
+from breg_harvester.utils import ProcessLock, to_json
+
+_logger = logging.getLogger(__name__)
+
+_CHANNEL_PREFIX = "breg:harvester:progress"
+_META_KEY = "progress"
+DEFAULT_MIN_INTERVAL = 0.5
+DEFAULT_HEARTBEAT = 15
+_ENDED_STATUSES = (JobStatus.FINISHED, JobStatus.FAILED)
+
+PHASE_SOURCES = "sources"
+PHASE_FETCH = "fetch"
+PHASE_PARSE = "parse"
+PHASE_VALIDATE = "validate"
+PHASE_LOAD = "load"
+PHASE_UNLOAD = "unload"
+PHASE_COPY = "copy"
+PHASE_SWAP = "swap"
+PHASE_INDEX = "index"
+PHASE_PROCESSED = "processed"
+PHASE_FINISHED = "finished"
+PHASE_FAILED = "failed"
+
+
+def channel_name(job_id):
+    return f"{_CHANNEL_PREFIX}:{job_id}"
+
+
+def merge_progress(base, other):
+    """Merges the snapshot of a source job into the snapshot of the harvest."""
+
+    res = dict(base or {})
+    sources = dict(res.get("sources") or {})
+
+    for uri, item in ((other or {}).get("sources") or {}).items():
+        sources[uri] = {**sources.get(uri, {}), **item}
+
+    res.update({key: val for key, val in (other or {}).items() if key != "sources"})
+    res["sources"] = sources
+
+    return res
+
+
+def get_job_progress(job):
+    """Returns the progress snapshot of the job, including
+    the progress of the source jobs of a fan-out harvest."""
+
+    res = job.meta.get(_META_KEY) or {}
+    fanout = job.meta.get("fanout")
+
+    if not fanout:
+        return res
+
+    children = [
+        child for child in Job.fetch_many(
+            list(fanout.get("children", {}).values()),
+            connection=job.connection)
+        if child
+    ]
+
+    for child in children:
+        res = merge_progress(res, child.meta.get(_META_KEY))
+
+    return res
+
+
+class ProgressReporter:
+    """Thread-safe progress snapshot of a job.
+    The snapshot is saved and published at most once per interval,
+    except for phase changes, which are always sent.
+    Progress is only logged when the reporter is not bound to a job
+    (e.g. when a harvest runs outside of a worker)."""
+
+    def __init__(self, job=None, channel_id=None, min_interval=DEFAULT_MIN_INTERVAL):
+        self.job = job
+        self.channel_id = channel_id or (job.id if job else None)
+        self.min_interval = min_interval
+        self._lock = ProcessLock()
+        self._snapshot = {"sources": {}}
+        self._sent_at = None
+        self._started = {}
+
+    def _flush(self, force=False):
+        now = time.time()
+
+        if not force and self._sent_at and now - self._sent_at < self.min_interval:
+            return
+
+        self._sent_at = now
+        self._snapshot["updated_at"] = datetime.datetime.utcnow().isoformat()
+        snapshot = to_json(self._snapshot)
+
+        if not self.job:
+            _logger.debug("Progress: %s", snapshot)
+            return
+
+        # Progress reports must never interrupt the harvest
+
+        try:
+            self.job.meta[_META_KEY] = snapshot
+            self.job.save_meta()
+
+            self.job.connection.publish(
+                channel_name(self.channel_id),
+                json.dumps(snapshot))
+        except Exception:
+            _logger.warning("Error reporting progress", exc_info=True)
+
+    def snapshot(self):
+        with self._lock:
+            return to_json(self._snapshot)
+
+    def set_phase(self, phase):
+        with self._lock:
+            now = time.time()
+            prev = self._snapshot.get("phase")
+
+            if prev and prev in self._started:
+                durations = self._snapshot.setdefault("durations", {})
+                durations[prev] = round(now - self._started.pop(prev), 3)
+
+            self._snapshot["phase"] = phase
+            self._started[phase] = now
+            self._flush(force=True)
+
+    def update(self, **kwargs):
+        with self._lock:
+            self._snapshot.update(kwargs)
+            self._flush()
+
+    def increment(self, key, num):
+        with self._lock:
+            self._snapshot[key] = self._snapshot.get(key, 0) + num
+            self._flush()
+
+    def set_source_phase(self, uri, phase, durations=None):
+        with self._lock:
+            item = self._snapshot["sources"].setdefault(uri, {})
+            item["phase"] = phase
+
+            if durations is not None:
+                item["durations"] = {
+                    key: round(val, 3) for key, val in durations.items()
+                }
+
+            self._flush(force=True)
+
+    def update_source(self, uri, **kwargs):
+        with self._lock:
+            self._snapshot["sources"].setdefault(uri, {}).update(kwargs)
+            self._flush()
+
+    def increment_source(self, uri, key, num):
+        with self._lock:
+            item = self._snapshot["sources"].setdefault(uri, {})
+            item[key] = item.get(key, 0) + num
+            self._flush()
+
+    def finish(self, failed=False):
+        self.set_phase(PHASE_FAILED if failed else PHASE_FINISHED)
+
+
+def get_reporter(channel_id=None):
+    """Returns a reporter for the current job. Source jobs of
+    a fan-out harvest pass the ID of the final job as the channel."""
+
+    job = get_current_job()
+
+    return ProgressReporter(
+        job=job,
+        channel_id=channel_id or (job.id if job else None))
+
+
+def _format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _get_ended_status(job):
+    status = job.get_status()
+
+    # Jobs whose results have expired are considered ended
+
+    if status is None or status in _ENDED_STATUSES:
+        return status or "expired"
+
+    return None
+
+
+def iter_events(redis_client, job, heartbeat=DEFAULT_HEARTBEAT):
+    """Yields Server-Sent Events with the progress snapshots of the job.
+    The current snapshot is sent first. The stream ends with an 'end' event
+    once the job has finished or failed; comments are sent as heartbeats
+    while there are no updates."""
+
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+
+    # Subscribing before reading the snapshot to avoid missing any update
+
+    pubsub.subscribe(channel_name(job.id))
+
+    try:
+        snapshot = get_job_progress(job)
+        yield _format_event("progress", snapshot)
+
+        while True:
+            status = _get_ended_status(job)
+
+            if status:
+                yield _format_event("end", {"status": status})
+                return
+
+            message = pubsub.get_message(timeout=heartbeat)
+
+            if message is None:
+                yield ": heartbeat\n\n"
+                continue
+
+            snapshot = merge_progress(snapshot, json.loads(message["data"]))
+            yield _format_event("progress", snapshot)
+    finally:
+        pubsub.close()
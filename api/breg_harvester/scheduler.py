@@ -12,10 +12,11 @@ from flask import Blueprint, current_app, request
 from werkzeug.exceptions import BadRequest, NotFound
 
 from breg_harvester.config import AppConfig
-from breg_harvester.harvest import enqueue_harvest_job
+from breg_harvester.harvest import check_fanout_jobs, enqueue_harvest_job
 from breg_harvester.models import SourceDataset
 from breg_harvester.utils import (no_cache_headers, redis_kwargs_from_url,
                                   to_json)
+from breg_harvester.vocabs import enqueue_preload_job, get_vocabularies
 
 _logger = logging.getLogger(__name__)
 
@@ -25,6 +26,10 @@ blueprint = Blueprint(BLUEPRINT_NAME, __name__)
 DEFAULT_INTERVAL_SECONDS = 5 * 24 * 3600
 PERIODIC_WAKEUP_INTERVAL_SECONDS = 180
 PERIODIC_WAKEUP_SUFFIX = "wakeup"
+DEFAULT_PRELOAD_INTERVAL_SECONDS = 7 * 24 * 3600
+PRELOAD_SUFFIX = "vocabularies"
+WATCHDOG_INTERVAL_SECONDS = 300
+WATCHDOG_SUFFIX = "watchdog"
 
 
 def run_scheduled_harvest(app_config):
@@ -37,6 +42,25 @@ def run_scheduled_harvest(app_config):
     return enqueue_harvest_job(sources, app_config=app_config)
 
 
+def run_scheduled_preload(app_config):
+    vocabularies = get_vocabularies()
+
+    if not vocabularies or len(vocabularies) == 0:
+        _logger.info("Undefined vocabularies: Skipping scheduled preload")
+        return None
+
+    return enqueue_preload_job(vocabularies, app_config=app_config)
+
+
+def run_scheduled_watchdog(app_config):
+    released = check_fanout_jobs(app_config.get("REDIS_URL"))
+
+    if released:
+        _logger.warning("Released stuck fan-out harvests: %s", released)
+
+    return released
+
+
 def run_scheduled_wakeup():
     """In our setup we run a single instance of APScheduler
      in the Flask app master (with gunicorn --preload). 
@@ -52,6 +76,21 @@ def get_wakeup_job_id(job_id):
     return f"{job_id}_{PERIODIC_WAKEUP_SUFFIX}"
 
 
+def get_preload_job_id(job_id):
+    return f"{job_id}_{PRELOAD_SUFFIX}"
+
+
+def get_watchdog_job_id(job_id):
+    return f"{job_id}_{WATCHDOG_SUFFIX}"
+
+
+def _filter_app_config(app):
+    return {
+        key: val for key, val in app.config.items()
+        if key in [item.value for item in AppConfig]
+    }
+
+
 def add_scheduled_harvest(app, job_id=None, interval=None, force=False):
     job_id = job_id if job_id else app.config.get("SCHEDULER_JOB_ID")
 
@@ -66,11 +105,7 @@ def add_scheduled_harvest(app, job_id=None, interval=None, force=False):
         _logger.debug("Existing scheduled job: %s", job)
         return None
 
-    app_config = {
-        key: val for key, val in app.config.items()
-        if key in [item.value for item in AppConfig]
-    }
-
+    app_config = _filter_app_config(app)
     interval = int(interval) if interval else DEFAULT_INTERVAL_SECONDS
 
     job_kwargs = {
@@ -120,6 +155,70 @@ def remove_scheduled_harvest(app, job_id=None):
         pass
 
 
+def add_scheduled_preload(app, force=False):
+    """Schedules the periodic preload of the vocabulary dumps.
+    The first preload runs as soon as the job is added."""
+
+    job_id = app.config.get("SCHEDULER_JOB_ID")
+
+    if not job_id:
+        raise Exception("Undefined scheduler job ID")
+
+    job_id = get_preload_job_id(job_id=job_id)
+    job = app.apscheduler.get_job(job_id)
+
+    if job and not force:
+        _logger.debug("Existing scheduled preload job: %s", job)
+        return None
+
+    interval = app.config.get("VOCABULARIES_INTERVAL") or DEFAULT_PRELOAD_INTERVAL_SECONDS
+
+    job_kwargs = {
+        "func": run_scheduled_preload,
+        "id": job_id,
+        "kwargs": {"app_config": _filter_app_config(app)},
+        "trigger": "interval",
+        "seconds": int(interval),
+        "next_run_time": datetime.datetime.now(datetime.timezone.utc),
+        "replace_existing": True
+    }
+
+    _logger.debug(
+        "Adding scheduled preload job:\n%s",
+        pprint.pformat(job_kwargs))
+
+    app.apscheduler.add_job(**job_kwargs)
+
+    return app.apscheduler.get_job(job_id)
+
+
+def add_scheduled_watchdog(app):
+    """Schedules the periodic check of the fan-out harvests whose
+    final job is still waiting for source jobs that have ended."""
+
+    job_id = app.config.get("SCHEDULER_JOB_ID")
+
+    if not job_id:
+        raise Exception("Undefined scheduler job ID")
+
+    job_kwargs = {
+        "func": run_scheduled_watchdog,
+        "id": get_watchdog_job_id(job_id=job_id),
+        "kwargs": {"app_config": _filter_app_config(app)},
+        "trigger": "interval",
+        "seconds": WATCHDOG_INTERVAL_SECONDS,
+        "replace_existing": True
+    }
+
+    _logger.debug(
+        "Adding scheduled watchdog job:\n%s",
+        pprint.pformat(job_kwargs))
+
+    app.apscheduler.add_job(**job_kwargs)
+
+    return app.apscheduler.get_job(job_kwargs["id"])
+
+
 def init_scheduler(app):
     redis_url = app.config.get("REDIS_URL")
 
@@ -152,6 +251,16 @@ def init_scheduler(app):
     app.apscheduler.start()
 
     add_scheduled_harvest(app, force=False)
+    add_scheduled_watchdog(app)
+
+    try:
+        has_vocabularies = bool(get_vocabularies())
+    except Exception:
+        _logger.warning("Error reading vocabularies", exc_info=True)
+        has_vocabularies = False
+
+    if has_vocabularies:
+        add_scheduled_preload(app, force=False)
 
     _logger.info("Running scheduler: %s", app.apscheduler)
 
@@ -0,0 +1,188 @@
+"""Process-wide HTTP sessions with keep-alive connection pools.
+
+Sessions are shared by all threads (and greenlets) of a process and
+are rebuilt after a fork, given that sockets must not be shared between
+processes. Closing a shared session is a no-op so that callers may keep
+using them as context managers.
+
+Digest credentials are wrapped in an auth object that shares the last
+challenge of the server, so that requests are authorized upfront with
+the negotiated nonce instead of being challenged again in each thread."""
+
+import collections
+import logging
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+
+from breg_harvester.utils import ProcessLock
+
+_logger = logging.getLogger(__name__)
+
+SESSION_SPARQL = "sparql"
+SESSION_VALIDATOR = "validator"
+SESSION_DEREF = "deref"
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_POOL_HOSTS = 10
+
+_lock = ProcessLock()
+_pid = None
+_sessions = {}
+_counters = collections.defaultdict(collections.Counter)
+_pool_size = DEFAULT_POOL_SIZE
+
+
+class SharedDigestAuth(HTTPDigestAuth):
+    """Digest auth that shares the last challenge between threads.
+    Each request is sent with a new nonce count; the per-request state
+    (e.g. the number of 401 responses) is still kept by thread."""
+
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        self._shared_lock = ProcessLock()
+        self._shared_chal = None
+        self._shared_count = 0
+
+    def __call__(self, r):
+        self.init_per_thread_state()
+
+        with self._shared_lock:
+            if self._shared_chal:
+                self._thread_local.chal = dict(self._shared_chal)
+                self._thread_local.last_nonce = self._shared_chal.get("nonce")
+                self._thread_local.nonce_count = self._shared_count
+                self._shared_count += 1
+
+        return super().__call__(r)
+
+    def handle_401(self, r, **kwargs):
+        res = super().handle_401(r, **kwargs)
+        chal = getattr(self._thread_local, "chal", None)
+
+        with self._shared_lock:
+            if chal and chal != self._shared_chal:
+                self._shared_chal = dict(chal)
+                self._shared_count = self._thread_local.nonce_count
+
+        return res
+
+
+class _SharedSession(requests.Session):
+    def close(self):
+        pass
+
+
+def init_sessions(app_config):
+    """Applies the pool size of the configuration to the sessions
+    that are created from now on in the current process."""
+
+    global _pool_size
+
+    _pool_size = int(app_config.get("HTTP_POOL_SIZE") or DEFAULT_POOL_SIZE)
+
+
+def _check_pid():
+    global _pid
+
+    pid = os.getpid()
+
+    if _pid != pid:
+        # The pools inherited from the parent process are left untouched
+
+        _sessions.clear()
+        _counters.clear()
+        _pid = pid
+
+
+def _count_response(name, res):
+    _counters[name]["requests"] += 1
+
+    if res.status_code >= 400:
+        _counters[name]["errors"] += 1
+
+
+def _build_session(name, username, password):
+    session = _SharedSession()
+
+    adapter = HTTPAdapter(
+        pool_connections=DEFAULT_POOL_HOSTS,
+        pool_maxsize=_pool_size)
+
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    session.hooks["response"].append(
+        lambda res, *args, **kwargs: _count_response(name, res))
+
+    if username:
+        session.auth = SharedDigestAuth(username, password)
+
+    _logger.debug("Created HTTP session '%s' (pool size: %s)", name, _pool_size)
+
+    return session
+
+
+def get_session(name, username=None, password=None):
+    """Returns the shared session of the current process for the given
+    name and credentials (digest auth is used if there is a username)."""
+
+    key = (name, username, password)
+
+    with _lock:
+        _check_pid()
+
+        if key not in _sessions:
+            _sessions[key] = _build_session(name, username, password)
+
+        return _sessions[key]
+
+
+def _pools_stats(session):
+    res = []
+
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+
+        for key in pools.keys():
+            pool = pools.get(key)
+
+            if pool is None:
+                continue
+
+            res.append({
+                "host": f"{key.key_scheme}://{key.key_host}:{key.key_port}",
+                "connections": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None),
+                "max_size": pool.pool.maxsize
+            })
+
+    return res
+
+
+def sessions_stats():
+    """Returns the request counters and the state of the connection pools
+    of the sessions of the current process, grouped by session name."""
+
+    with _lock:
+        _check_pid()
+        res = {}
+
+        for (name, _, _), session in _sessions.items():
+            item = res.setdefault(name, {"pools": []})
+            item["pools"].extend(_pools_stats(session))
+
+        for name, counter in _counters.items():
+            res.setdefault(name, {"pools": []}).update({
+                "requests": counter["requests"],
+                "errors": counter["errors"]
+            })
+
+        return {
+            "pid": _pid,
+            "pool_size": _pool_size,
+            "sessions": res
+        }
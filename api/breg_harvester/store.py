@@ -7,13 +7,20 @@ import logging
 import uuid
 
 from flask import current_app
-from rdflib import BNode
-from rdflib.plugins.stores.sparqlstore import SPARQLUpdateStore
-from requests.auth import HTTPDigestAuth
+from rdflib import BNode, Graph
+from rdflib.plugins.stores.sparqlstore import SPARQLStore, SPARQLUpdateStore
+
+import breg_harvester.sessions
+import breg_harvester.utils
 
 _logger = logging.getLogger(__name__)
 
 _MIME_SPARQL_UPDATE = "application/sparql-update"
+_MIME_TURTLE = "text/turtle"
+
+_read_lock = breg_harvester.utils.ProcessLock()
+_read_stores = {}
+_read_graphs = {}
 
 
 def _node_to_sparql(node):
@@ -25,6 +32,43 @@ def _node_to_sparql(node):
     return node.n3()
 
 
+class _PooledSessionMixin:
+    """Sends the requests of the store through the shared HTTP
+    session of the process instead of a new session per thread."""
+
+    def __init__(self, *args, sparql_user=None, sparql_pass=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparql_user = sparql_user
+        self.sparql_pass = sparql_pass
+
+    @property
+    def session(self):
+        return breg_harvester.sessions.get_session(
+            breg_harvester.sessions.SESSION_SPARQL,
+            username=self.sparql_user,
+            password=self.sparql_pass)
+
+
+class PooledSPARQLStore(_PooledSessionMixin, SPARQLStore):
+    """Read-only store. Queries do not modify the state of the store,
+    so a single instance can be shared by all threads of the process."""
+
+
+class PooledSPARQLUpdateStore(_PooledSessionMixin, SPARQLUpdateStore):
+    """Store for the harvest jobs. Updates are sent with their own
+    request headers instead of mutating the headers of the store."""
+
+    def _update(self, update):
+        self._updates += 1
+
+        res = self.session.post(
+            self.update_endpoint,
+            data=update.encode("utf-8"),
+            headers={"content-type": _MIME_SPARQL_UPDATE})
+
+        res.raise_for_status()
+
+
 def get_sparql_store(query_endpoint=None, update_endpoint=None, sparql_user=None, sparql_pass=None):
     if not query_endpoint:
         query_endpoint = current_app.config.get("SPARQL_ENDPOINT")
@@ -38,12 +82,11 @@ def get_sparql_store(query_endpoint=None, update_endpoint=None, sparql_user=None
     if not sparql_pass:
         sparql_pass = current_app.config.get("SPARQL_PASS")
 
-    auth = HTTPDigestAuth(sparql_user, sparql_pass)
-
-    store = SPARQLUpdateStore(
+    store = PooledSPARQLUpdateStore(
         queryEndpoint=query_endpoint,
         update_endpoint=update_endpoint,
-        auth=auth,
+        sparql_user=sparql_user,
+        sparql_pass=sparql_pass,
         context_aware=True,
         postAsEncoded=False,
         node_to_sparql=_node_to_sparql)
@@ -54,29 +97,144 @@ def get_sparql_store(query_endpoint=None, update_endpoint=None, sparql_user=None
     return store
 
 
-def set_store_header_update(store):
-    """Call this function before any `Graph.add()` 
-    calls to set the appropriate request headers."""
+def get_read_store(query_endpoint=None, sparql_user=None, sparql_pass=None):
+    """Returns the read-only store of the current process for the endpoint.
+    The store is created once and shared by all threads and greenlets."""
+
+    if not query_endpoint:
+        query_endpoint = current_app.config.get("SPARQL_ENDPOINT")
+
+    if not sparql_user:
+        sparql_user = current_app.config.get("SPARQL_USER")
+
+    if not sparql_pass:
+        sparql_pass = current_app.config.get("SPARQL_PASS")
+
+    key = (query_endpoint, sparql_user, sparql_pass)
+
+    with _read_lock:
+        if key not in _read_stores:
+            store = PooledSPARQLStore(
+                endpoint=query_endpoint,
+                sparql_user=sparql_user,
+                sparql_pass=sparql_pass,
+                context_aware=True,
+                node_to_sparql=_node_to_sparql)
+
+            store.method = "POST"
+            _read_stores[key] = store
+
+        return _read_stores[key]
+
+
+def get_read_graph(graph_uri=None):
+    """Returns the shared read-only graph of the current process.
+    The namespace manager is initialized upfront given that
+    it is otherwise lazily created (and bound) on the first query."""
+
+    if not graph_uri:
+        graph_uri = current_app.config.get("GRAPH_URI")
+
+    store = get_read_store()
+    key = (id(store), graph_uri)
+
+    with _read_lock:
+        if key not in _read_graphs:
+            graph = Graph(store, identifier=graph_uri)
+            graph.namespace_manager
+            _read_graphs[key] = graph
+
+        return _read_graphs[key]
+
+
+def triple_to_sparql(triple):
+    """Serializes a triple as a statement that is valid both 
+    in a SPARQL INSERT DATA block and in a Turtle document."""
+
+    return " ".join(_node_to_sparql(node) for node in triple) + " ."
+
+
+def get_store_session(sparql_user=None, sparql_pass=None):
+    """Returns the shared HTTP session of the process for the SPARQL endpoint.
+    Connections are kept alive and the digest auth nonce is reused across requests."""
+
+    if not sparql_user:
+        sparql_user = current_app.config.get("SPARQL_USER")
+
+    if not sparql_pass:
+        sparql_pass = current_app.config.get("SPARQL_PASS")
+
+    return breg_harvester.sessions.get_session(
+        breg_harvester.sessions.SESSION_SPARQL,
+        username=sparql_user,
+        password=sparql_pass)
+
+
+def run_sparql_update(session, query, update_endpoint=None):
+    if not update_endpoint:
+        update_endpoint = current_app.config.get("SPARQL_UPDATE_ENDPOINT")
+
+    res = session.post(
+        update_endpoint,
+        data=query.encode("utf-8"),
+        headers={"content-type": _MIME_SPARQL_UPDATE})
+
+    res.raise_for_status()
+
+    return res
+
+
+def post_graph_data(session, data, graph_uri, gsp_endpoint):
+    """Appends Turtle data to a named graph using 
+    the SPARQL 1.1 Graph Store HTTP Protocol."""
+
+    res = session.post(
+        gsp_endpoint,
+        params={"graph": graph_uri},
+        data=data.encode("utf-8"),
+        headers={"content-type": _MIME_TURTLE})
+
+    res.raise_for_status()
+
+    return res
+
+
+def build_staging_graph_uri(graph_uri):
+    return f"{graph_uri}/staging/{uuid.uuid4().hex}"
+
+
+def drop_graph(session, graph_uri, update_endpoint=None):
+    query = f"DROP SILENT GRAPH <{graph_uri}>"
+    _logger.debug("Dropping graph: %s", query)
+
+    return run_sparql_update(
+        session=session,
+        query=query,
+        update_endpoint=update_endpoint)
 
-    if "headers" not in store.kwargs:
-        store.kwargs.update({"headers": {}})
 
-    store.kwargs['headers'].update({
-        "content-type": _MIME_SPARQL_UPDATE
-    })
+def move_graph(session, source_uri, target_uri, update_endpoint=None):
+    """Replaces the contents of the target graph with those of the source graph 
+    in a single update request. The source graph is removed afterwards.
+    Not SILENT: a failed swap must fail the harvest."""
 
-    _logger.debug(
-        "Updated store (%s) content-type: %s",
-        store, _MIME_SPARQL_UPDATE)
+    query = f"MOVE GRAPH <{source_uri}> TO GRAPH <{target_uri}>"
+    _logger.debug("Moving graph: %s", query)
 
+    return run_sparql_update(
+        session=session,
+        query=query,
+        update_endpoint=update_endpoint)
 
-def set_store_header_read(store):
-    """Call this function before any `Graph.triples()` 
-    calls to set the appropriate request headers."""
 
-    if "headers" not in store.kwargs:
-        store.kwargs.update({"headers": {}})
+def copy_graph(session, source_uri, target_uri, update_endpoint=None):
+    """Replaces the contents of the target graph with a copy of the source graph.
+    Not SILENT: deltas applied to an incomplete copy would drop live data."""
 
-    store.kwargs["headers"].pop("content-type", None)
+    query = f"COPY GRAPH <{source_uri}> TO GRAPH <{target_uri}>"
+    _logger.debug("Copying graph: %s", query)
 
-    _logger.debug("Cleared store (%s) content-type", store)
+    return run_sparql_update(
+        session=session,
+        query=query,
+        update_endpoint=update_endpoint)
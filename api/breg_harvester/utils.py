@@ -1,13 +1,22 @@
 import datetime
 import json
 import logging
+import os
+import threading
 from functools import update_wrapper, wraps
 
 import redis
 from flask import make_response
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
 _logger = logging.getLogger(__name__)
 
+_process_locks_guard = threading.Lock()
+
 
 def to_json(val):
     if isinstance(val, dict):
@@ -48,6 +57,15 @@ def job_to_json(job, extended=True):
     return to_json(job_dict)
 
 
+def peak_memory_kb():
+    """Returns the peak resident set size of the current process."""
+
+    if not resource:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
 def redis_kwargs_from_url(redis_url):
     client = redis.from_url(redis_url)
     conn_kwargs = client.connection_pool.connection_kwargs
@@ -74,3 +92,32 @@ def no_cache_headers(view):
         return response
 
     return update_wrapper(no_cache, view)
+
+
+class ProcessLock:
+    """Lock that is built on first use in each process.
+    Module-level locks are created when the app is preloaded in the gunicorn
+    master, before eventlet patches the threading module of the workers.
+    A native lock that is held by a greenlet that yields (e.g. on I/O)
+    would block the whole worker when another greenlet tries to acquire it."""
+
+    def __init__(self):
+        self._pid = None
+        self._lock = None
+
+    def _get_lock(self):
+        pid = os.getpid()
+
+        if self._pid != pid:
+            with _process_locks_guard:
+                if self._pid != pid:
+                    self._lock = threading.Lock()
+                    self._pid = pid
+
+        return self._lock
+
+    def __enter__(self):
+        return self._get_lock().__enter__()
+
+    def __exit__(self, *args):
+        return self._lock.__exit__(*args)
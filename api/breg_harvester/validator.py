@@ -1,12 +1,20 @@
+import base64
+import collections
+import enum
+import hashlib
 import json
 import logging
+import os
 import pprint
 
+import pyshacl
 import rdflib
-import requests
+import redis
 from flask import current_app
 from rdflib.namespace import SH
 
+import breg_harvester.sessions
+import breg_harvester.utils
 from breg_harvester.models import DataTypes, mime_for_type
 
 _logger = logging.getLogger(__name__)
@@ -26,14 +34,32 @@ URL_SHACL_SHAPES = (
     "BRegDCAT-AP_shacl_shapes_2.00.ttl"
 )
 
+PATH_ONTOLOGY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ontology")
+PATH_SHACL_MDR = os.path.join(PATH_ONTOLOGY, "BRegDCAT-AP_shacl_mdr-vocabularies_2.00.ttl")
+PATH_SHACL_SHAPES = os.path.join(PATH_ONTOLOGY, "BRegDCAT-AP_shacl_shapes_2.00.ttl")
+
 VALIDATION_TYPE_ANY = "any"
 VALIDATION_TYPE_LATEST = "main.latest"
 EMBEDDING_METHOD_URL = "URL"
+EMBEDDING_METHOD_BASE64 = "BASE64"
 
 
-def validation_report_conforms(data, strict):
-    grph = rdflib.Graph()
-    grph.parse(data=data)
+_shapes_cache = {}
+_shapes_lock = breg_harvester.utils.ProcessLock()
+
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+_KEY_CACHE_PREFIX = "breg:harvester:validation"
+
+
+class ValidatorTypes(enum.Enum):
+    BREG = "breg"
+    GENERIC = "generic"
+    LOCAL = "local"
+
+
+def summarize_report(grph):
+    """Returns a compact summary of a SHACL validation report graph:
+    the conformance flag and the number of results by severity."""
 
     _logger.debug(
         "Checking SHACL validation report:\n%s",
@@ -42,36 +68,156 @@ def validation_report_conforms(data, strict):
     triples_conforms = grph.triples((None, SH.conforms, rdflib.Literal(True)))
     conforms = len(list(triples_conforms)) > 0
 
-    if conforms:
+    severities = collections.Counter(
+        str(severity).split("#")[-1]
+        for severity in grph.objects(None, SH.resultSeverity))
+
+    return {
+        "conforms": conforms,
+        "severities": dict(severities)
+    }
+
+
+def summary_conforms(summary, strict):
+    if summary["conforms"]:
         return True
-    elif not conforms and strict:
+    elif not summary["conforms"] and strict:
         return False
 
-    triples_violation = grph.triples((None, SH.resultSeverity, SH.Violation))
-    has_violations = len(list(triples_violation)) > 0
+    violation = str(SH.Violation).split("#")[-1]
+
+    return summary["severities"].get(violation, 0) == 0
+
+
+def validation_report_summary(data):
+    grph = rdflib.Graph()
+    grph.parse(data=data)
+    return summarize_report(grph)
+
+
+def validation_report_conforms(data, strict):
+    return summary_conforms(validation_report_summary(data), strict=strict)
+
+
+def _log_validation_result(source, valid):
+    _logger.log(
+        logging.DEBUG if valid else logging.WARNING,
+        "Validation result for %s: %s", source, "OK" if valid else "Invalid")
+
+    return valid
+
+
+class Base64JSONBody:
+    """File-like JSON body of a validation request that embeds the contents
+    of the spool file in base64. The contents are encoded in chunks while
+    the request is sent, so that large sources are never held in memory.
+    The length is known upfront, so it is sent as the Content-Length."""
 
-    return not has_violations
+    # Multiple of 3 so that chunks are encoded without padding
 
+    CHUNK_SIZE = 3 * 64 * 1024
 
-def _request_validation(url_api, source, body, strict):
+    def __init__(self, body, field, spool):
+        data = json.dumps({key: val for key, val in body.items() if key != field})
+        sep = ", " if len(data) > 2 else ""
+        self._prefix = f'{data[:-1]}{sep}"{field}": "'.encode("utf-8")
+        self._suffix = b'"}'
+        self._spool = spool
+        self._spool.seek(0, os.SEEK_END)
+        self._num_bytes = self._spool.tell()
+        self._spool.seek(0)
+        self._parts = self._iter_parts()
+        self._buffer = b""
+
+    def __len__(self):
+        encoded = 4 * ((self._num_bytes + 2) // 3)
+        return len(self._prefix) + encoded + len(self._suffix)
+
+    def _iter_parts(self):
+        yield self._prefix
+
+        while True:
+            chunk = self._spool.read(self.CHUNK_SIZE)
+
+            if not chunk:
+                break
+
+            yield base64.b64encode(chunk)
+
+        self._spool.seek(0)
+
+        yield self._suffix
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            part = next(self._parts, None)
+
+            if part is None:
+                break
+
+            self._buffer += part
+
+        if size is None or size < 0:
+            size = len(self._buffer)
+
+        res, self._buffer = self._buffer[:size], self._buffer[size:]
+
+        return res
+
+
+def _content_to_validate(source, spool):
+    """Returns the content and embedding method for a validation request.
+    The contents of the local spool file are embedded when available:
+    the content is then undefined given that it is streamed from the spool
+    (see Base64JSONBody). Otherwise the validation service downloads
+    the source by itself."""
+
+    if spool is None:
+        return source.uri, EMBEDDING_METHOD_URL
+
+    return None, EMBEDDING_METHOD_BASE64
+
+
+def _request_validation(url_api, source, body, spool=None):
     try:
         _logger.debug(
-            "Request validation (%s):\n%s",
-            url_api, pprint.pformat(body))
+            "Request validation (%s): %s (%s)",
+            url_api, source, body.get("embeddingMethod"))
 
-        res = requests.post(url_api, json=body)
-        valid = validation_report_conforms(data=res.text, strict=strict)
+        session = breg_harvester.sessions.get_session(
+            breg_harvester.sessions.SESSION_VALIDATOR)
 
-        _logger.log(
-            logging.DEBUG if valid else logging.WARNING,
-            "Validation result for %s: %s", source, "OK" if valid else "Invalid")
+        if body.get("embeddingMethod") == EMBEDDING_METHOD_BASE64:
+            res = session.post(
+                url_api,
+                data=Base64JSONBody(body, field="contentToValidate", spool=spool),
+                headers={"Content-Type": "application/json"})
+        else:
+            res = session.post(url_api, json=body)
 
-        return valid
+        return validation_report_summary(data=res.text)
     except Exception as ex:
         raise Exception(f"Error during validation of {source}") from ex
 
 
-class GenericAPIValidator:
+class BaseValidator:
+    """Validators produce a summary of the SHACL validation report
+    (see summarize_report) that is then checked for conformance."""
+
+    def identity(self):
+        """Returns a string that identifies the validation service and rule set."""
+
+        raise NotImplementedError
+
+    def validate_summary(self, source, graph=None, spool=None):
+        raise NotImplementedError
+
+    def validate(self, source, strict=False, graph=None, content_hash=None, spool=None):
+        summary = self.validate_summary(source, graph=graph, spool=spool)
+        return _log_validation_result(source, summary_conforms(summary, strict))
+
+
+class GenericAPIValidator(BaseValidator):
     def __init__(self, url_api=URL_API_ANY, external_rules=None):
         self.url_api = url_api
 
@@ -82,7 +228,13 @@ class GenericAPIValidator:
 
         self.external_rules = external_rules if external_rules else default_rules
 
-    def build_source_body(self, source, external_rules):
+    def identity(self):
+        rules = [(rule_url, rule_type.value) for rule_url, rule_type in self.external_rules]
+        return json.dumps([self.url_api, VALIDATION_TYPE_ANY, rules])
+
+    def build_source_body(self, source, external_rules, spool=None):
+        content, embedding_method = _content_to_validate(source, spool)
+
         external_rules = [
             {
                 "ruleSet": rule_url,
@@ -94,46 +246,181 @@ class GenericAPIValidator:
 
         return {
             "contentSyntax": source.mime_type,
-            "contentToValidate": source.uri,
-            "embeddingMethod": EMBEDDING_METHOD_URL,
+            "contentToValidate": content,
+            "embeddingMethod": embedding_method,
             "validationType": VALIDATION_TYPE_ANY,
             "reportSyntax": mime_for_type(DataTypes.XML),
             "externalRules": external_rules
         }
 
-    def validate(self, source, strict=False):
+    def validate_summary(self, source, graph=None, spool=None):
         body = self.build_source_body(
             source=source,
-            external_rules=self.external_rules)
+            external_rules=self.external_rules,
+            spool=spool)
 
         return _request_validation(
             url_api=self.url_api,
             source=source,
             body=body,
-            strict=strict)
+            spool=spool)
 
 
-class BRegAPIValidator:
+class BRegAPIValidator(BaseValidator):
     def __init__(self, url_api=URL_API_BREG):
         self.url_api = url_api
 
-    def build_source_body(self, source):
+    def identity(self):
+        return json.dumps([self.url_api, VALIDATION_TYPE_LATEST])
+
+    def build_source_body(self, source, spool=None):
+        content, embedding_method = _content_to_validate(source, spool)
+
         return {
             "contentSyntax": source.mime_type,
-            "contentToValidate": source.uri,
-            "embeddingMethod": EMBEDDING_METHOD_URL,
+            "contentToValidate": content,
+            "embeddingMethod": embedding_method,
             "validationType": VALIDATION_TYPE_LATEST,
             "reportSyntax": mime_for_type(DataTypes.XML)
         }
 
-    def validate(self, source, strict=False):
-        body = self.build_source_body(source=source)
+    def validate_summary(self, source, graph=None, spool=None):
+        body = self.build_source_body(source=source, spool=spool)
 
         return _request_validation(
             url_api=self.url_api,
             source=source,
             body=body,
-            strict=strict)
+            spool=spool)
+
+
+def load_shapes_graph(rules):
+    """Returns the SHACL shapes graph for the given rules (local paths or URLs).
+    Shapes graphs are parsed once and kept in memory for the lifetime of the process."""
+
+    key = tuple(rules)
+
+    with _shapes_lock:
+        if key not in _shapes_cache:
+            grph = rdflib.Graph()
+
+            for rule_location, rule_type in rules:
+                _logger.debug("Loading SHACL shapes: %s", rule_location)
+                grph.parse(rule_location, format=rule_type.value)
+
+            _shapes_cache[key] = grph
+
+    return _shapes_cache[key]
+
+
+class LocalSHACLValidator(BaseValidator):
+    """Validates the already parsed source graph in-process with pySHACL
+    using the BRegDCAT-AP shapes that are bundled with the package."""
+
+    requires_graph = True
+
+    def __init__(self, rules=None):
+        default_rules = [
+            (PATH_SHACL_MDR, DataTypes.TURTLE),
+            (PATH_SHACL_SHAPES, DataTypes.TURTLE)
+        ]
+
+        self.rules = rules if rules else default_rules
+
+    def identity(self):
+        rules = [(os.path.basename(loc), rule_type.value) for loc, rule_type in self.rules]
+        return json.dumps([pyshacl.__version__, rules])
+
+    def preload(self):
+        load_shapes_graph(self.rules)
+
+    def validate_summary(self, source, graph=None, spool=None):
+        try:
+            if graph is None and spool is not None:
+                spool.seek(0)
+                graph = rdflib.Graph()
+                graph.parse(file=spool, format=source.rdflib_format, publicID=source.uri)
+            elif graph is None:
+                graph = rdflib.Graph()
+                graph.parse(source.uri, format=source.rdflib_format)
+
+            _, report_graph, _ = pyshacl.validate(
+                graph,
+                shacl_graph=load_shapes_graph(self.rules),
+                inference="none",
+                abort_on_error=False)
+
+            return summarize_report(report_graph)
+        except Exception as ex:
+            raise Exception(f"Error during validation of {source}") from ex
+
+
+class CachedValidator:
+    """Wraps a validator to keep the validation summaries in Redis.
+    Entries are keyed by the validator type, the rule set identity and
+    the hash of the source contents, so unchanged sources are not validated again."""
+
+    def __init__(self, validator, redis_url, ttl=DEFAULT_CACHE_TTL):
+        self.validator = validator
+        self.redis_url = redis_url
+        self.ttl = int(ttl)
+        self._redis = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_redis"] = None
+        return state
+
+    def __repr__(self):
+        return "<{}> {!r}".format(self.__class__.__name__, self.validator)
+
+    @property
+    def requires_graph(self):
+        return getattr(self.validator, "requires_graph", False)
+
+    def preload(self):
+        if hasattr(self.validator, "preload"):
+            self.validator.preload()
+
+    def get_redis(self):
+        if self._redis is None:
+            self._redis = redis.from_url(self.redis_url)
+
+        return self._redis
+
+    def build_cache_key(self, content_hash):
+        identity = hashlib.sha1(self.validator.identity().encode("utf-8")).hexdigest()
+        validator_type = self.validator.__class__.__name__
+        return f"{_KEY_CACHE_PREFIX}:{validator_type}:{identity}:{content_hash}"
+
+    def _get_cached(self, key):
+        try:
+            data = self.get_redis().get(key)
+            return json.loads(data) if data else None
+        except Exception:
+            _logger.warning("Error reading validation cache", exc_info=True)
+            return None
+
+    def _set_cached(self, key, summary):
+        try:
+            self.get_redis().set(key, json.dumps(summary), ex=self.ttl)
+        except Exception:
+            _logger.warning("Error writing validation cache", exc_info=True)
+
+    def validate(self, source, strict=False, graph=None, content_hash=None, spool=None):
+        if not content_hash:
+            return self.validator.validate(source, strict=strict, graph=graph, spool=spool)
+
+        key = self.build_cache_key(content_hash)
+        summary = self._get_cached(key)
+
+        if summary is None:
+            summary = self.validator.validate_summary(source, graph=graph, spool=spool)
+            self._set_cached(key, summary)
+        else:
+            _logger.debug("Validation cache hit for %s: %s", source, summary)
+
+        return _log_validation_result(source, summary_conforms(summary, strict))
 
 
 class DummyValidator:
@@ -141,6 +428,19 @@ class DummyValidator:
         return True
 
 
+def _build_validator(validator_type):
+    if validator_type == ValidatorTypes.LOCAL.value:
+        return LocalSHACLValidator()
+
+    if validator_type == ValidatorTypes.GENERIC.value:
+        return GenericAPIValidator()
+
+    if validator_type == ValidatorTypes.BREG.value:
+        return BRegAPIValidator()
+
+    raise ValueError(f"Unknown validator type: {validator_type}")
+
+
 def get_validator(app_config=None):
     app_config = app_config if app_config else current_app.config
 
@@ -154,4 +454,13 @@ def get_validator(app_config=None):
         _logger.info("Validator disabled: Using %s", DummyValidator)
         return DummyValidator()
 
-    return BRegAPIValidator()
+    validator_type = app_config.get("VALIDATOR_TYPE") or ValidatorTypes.BREG.value
+    validator = _build_validator(validator_type)
+
+    cache_ttl = app_config.get("VALIDATION_CACHE_TTL")
+    redis_url = app_config.get("REDIS_URL")
+
+    if cache_ttl and redis_url:
+        return CachedValidator(validator, redis_url=redis_url, ttl=cache_ttl)
+
+    return validator
@@ -0,0 +1,139 @@
+"""Bulk preload of the labels of controlled vocabularies.
+
+Most terms displayed by the browser come from a few large EU authority tables
+(data themes, countries, languages, corporate bodies). Their dumps are loaded
+in a single pass to fill the label index, so that these terms
+are never dereferenced one by one."""
+
+import logging
+import pprint
+import time
+
+import redis
+from flask import Blueprint, current_app, jsonify
+from rdflib import Graph
+from werkzeug.exceptions import ServiceUnavailable
+
+import breg_harvester.cache
+import breg_harvester.jobs_queue
+import breg_harvester.labels
+import breg_harvester.utils
+from breg_harvester.models import SourceDataset
+
+_logger = logging.getLogger(__name__)
+
+BLUEPRINT_NAME = "vocabulary"
+blueprint = Blueprint(BLUEPRINT_NAME, __name__)
+
+ENV_VOCABULARIES = "HARVESTER_VOCABULARIES"
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_vocabularies():
+    return SourceDataset.from_env(env_var=ENV_VOCABULARIES)
+
+
+def _preload_vocabulary(vocabulary, index, batch_size):
+    started = time.time()
+
+    _logger.info("Loading vocabulary: %s", vocabulary)
+
+    graph = Graph()
+    graph.parse(vocabulary.uri, format=vocabulary.rdflib_format)
+    term_labels = breg_harvester.labels.extract_all_labels(graph)
+
+    index.save_many(term_labels, batch_size=batch_size, pinned=True)
+
+    return {
+        "num_triples": len(graph),
+        "num_terms": len(term_labels),
+        "seconds": round(time.time() - started, 3)
+    }
+
+
+def run_vocabulary_preload(
+        vocabularies, redis_url, batch_size=DEFAULT_BATCH_SIZE, index_settings=None):
+    """Fills the label index with all the terms of the given vocabulary dumps.
+    Vocabularies that cannot be loaded are reported in the result
+    without interrupting the preload of the others."""
+
+    _logger.info("Running vocabulary preload:\n%s", pprint.pformat(vocabularies))
+
+    redis_client = redis.from_url(redis_url)
+    index_settings = index_settings if index_settings else {}
+    index = breg_harvester.labels.LabelIndex(redis_client, **index_settings)
+    res = {}
+
+    try:
+        for vocabulary in vocabularies:
+            try:
+                res[vocabulary.uri] = _preload_vocabulary(
+                    vocabulary,
+                    index=index,
+                    batch_size=batch_size)
+            except Exception as ex:
+                _logger.warning("Error loading vocabulary: %s", vocabulary, exc_info=True)
+                res[vocabulary.uri] = {"error": repr(ex)}
+
+        # Cached browser responses include the labels of the terms
+
+        breg_harvester.cache.notify_graph_updated(redis_client, ENV_VOCABULARIES)
+    finally:
+        redis_client.connection_pool.disconnect()
+
+    res = {
+        "vocabularies": res,
+        "num_terms": sum(item.get("num_terms", 0) for item in res.values())
+    }
+
+    _logger.info("Vocabulary preload result:\n%s", pprint.pformat(res))
+
+    return res
+
+
+def enqueue_preload_job(vocabularies, app_config=None):
+    app_config = app_config if app_config else current_app.config
+    redis_url = app_config.get("REDIS_URL")
+    connection = redis.from_url(redis_url)
+    rqueue = breg_harvester.jobs_queue.get_queue(connection=connection)
+
+    index_settings = breg_harvester.labels.get_label_index(
+        app_config=app_config,
+        redis=connection).settings
+
+    _logger.debug("Enqueuing new vocabulary preload job:\n%s", pprint.pformat(vocabularies))
+
+    job = rqueue.enqueue(
+        run_vocabulary_preload,
+        result_ttl=app_config.get("RESULT_TTL"),
+        kwargs={
+            "vocabularies": vocabularies,
+            "redis_url": redis_url,
+            "index_settings": index_settings
+        })
+
+    return breg_harvester.utils.job_to_json(job)
+
+
+def _get_vocabularies_or_raise():
+    try:
+        vocabularies = get_vocabularies()
+    except Exception as ex:
+        raise ServiceUnavailable(f"Error reading vocabularies: {str(ex)}")
+
+    if not vocabularies:
+        raise ServiceUnavailable("Undefined vocabularies")
+
+    return vocabularies
+
+
+@blueprint.route("/", methods=["GET"])
+def get_vocabulary_dumps():
+    vocabularies = _get_vocabularies_or_raise()
+    return jsonify([item.to_dict() for item in vocabularies])
+
+
+@blueprint.route("/", methods=["POST"])
+def create_preload_job():
+    vocabularies = _get_vocabularies_or_raise()
+    return enqueue_preload_job(vocabularies)
@@ -0,0 +1,45 @@
+"""Entrypoint for the queue workers.
+
+RQ workers fork a new process for each job. Any state that is loaded here,
+before the worker starts listening, is inherited by every job process.
+This is used to parse the bundled SHACL shapes only once per worker
+when the local validator is configured."""
+
+import logging
+
+import redis
+from rq import Worker
+
+from breg_harvester.config import AppConfig, app_config_from_env
+from breg_harvester.jobs_queue import get_queue
+from breg_harvester.sessions import init_sessions
+from breg_harvester.validator import LocalSHACLValidator, ValidatorTypes
+
+_logger = logging.getLogger(__name__)
+
+
+def run_worker(app_config=None):
+    app_config = app_config if app_config else app_config_from_env()
+    init_sessions(app_config)
+
+    is_local_validator = \
+        not app_config.get(AppConfig.VALIDATOR_DISABLED.value) and \
+        app_config.get(AppConfig.VALIDATOR_TYPE.value) == ValidatorTypes.LOCAL.value
+
+    if is_local_validator:
+        try:
+            LocalSHACLValidator().preload()
+        except Exception:
+            _logger.warning("Error preloading SHACL shapes", exc_info=True)
+
+    connection = redis.from_url(app_config.get(AppConfig.REDIS_URL.value))
+    rqueue = get_queue(connection=connection)
+    worker = Worker([rqueue], connection=connection)
+
+    _logger.info("Running worker: %s", worker)
+
+    worker.work(with_scheduler=True)
+
+
+if __name__ == "__main__":
+    run_worker()
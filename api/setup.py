@@ -19,8 +19,7 @@ setup(
         "sparqlwrapper>=1.8.5,<1.9",
         "APScheduler>=3.6,<3.7",
         "eventlet==0.30.2",
-        "gunicorn[eventlet]>=20.1,<20.2",
-        "timeout-decorator>=0.4,<0.5"
+        "gunicorn[eventlet]>=20.1,<20.2"
     ],
     extras_require={
         "dev": [
@@ -29,7 +28,8 @@ setup(
             "rope>=0.16.0,<1.0",
             "bumpversion>=0.5.3,<1.0",
             "pytest>=3.10.1,<4.0",
-            "mock>=3.0.5,<4.0"
+            "mock>=3.0.5,<4.0",
+            "fakeredis>=1.4,<2.0"
         ]
     }
 )
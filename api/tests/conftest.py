@@ -0,0 +1,72 @@
+import fakeredis
+import pytest
+
+import breg_harvester.facets
+import breg_harvester.store
+from breg_harvester.facets import FilterKeys
+
+DATASETS = {
+    "<http://example.org/d1>": {
+        "title": ["Business register of companies"],
+        "description": ["Legal entities registered in Spain"],
+        "identifier": ["d1"]
+    },
+    "<http://example.org/d2>": {
+        "title": ["Registry of associations"],
+        "description": ["Business associations and their members"],
+        "identifier": ["d2"]
+    },
+    "<http://example.org/d3>": {
+        "title": ["Beneficial owners"],
+        "description": ["Owners of companies"],
+        "identifier": ["d3"]
+    }
+}
+
+# Datasets that lack any of the required properties cannot be hydrated
+
+INCOMPLETE_DATASET = "<http://example.org/d4>"
+
+FACETS = {
+    FilterKeys.CATALOG: {
+        "<http://example.org/c1>": {"<http://example.org/d1>", "<http://example.org/d2>"},
+        "<http://example.org/c2>": {"<http://example.org/d3>", INCOMPLETE_DATASET}
+    },
+    FilterKeys.DATASET: {
+        uri: {uri} for uri in list(DATASETS) + [INCOMPLETE_DATASET]
+    },
+    FilterKeys.THEME: {
+        "<http://example.org/t1>": {"<http://example.org/d1>", "<http://example.org/d2>"},
+        "<http://example.org/t2>": {"<http://example.org/d3>"}
+    },
+    FilterKeys.LANGUAGE: {
+        "<http://example.org/en>": set(DATASETS) | {INCOMPLETE_DATASET},
+        "<http://example.org/es>": {"<http://example.org/d1>"}
+    }
+}
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeStrictRedis()
+
+
+@pytest.fixture
+def fake_store(monkeypatch):
+    """Replaces the SPARQL queries of the facet index with fixed results."""
+
+    def query_facets(graph):
+        return FACETS, set(DATASETS) | {INCOMPLETE_DATASET}
+
+    def get_datasets(graph, uris):
+        return {uri: DATASETS[uri] for uri in uris if uri in DATASETS}
+
+    monkeypatch.setattr(breg_harvester.store, "get_sparql_store", lambda **kwargs: "default")
+    monkeypatch.setattr(breg_harvester.facets, "_query_facets", query_facets)
+    monkeypatch.setattr(breg_harvester.facets, "get_datasets", get_datasets)
+
+
+@pytest.fixture
+def facet_index(redis_client, fake_store):
+    return breg_harvester.facets.build_facet_index(
+        redis_client, store_kwargs={}, graph_uri="http://example.org/graph")
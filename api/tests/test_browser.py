@@ -0,0 +1,116 @@
+import fakeredis
+import flask
+import pytest
+from rdflib import Graph, Literal, Namespace
+from rdflib.namespace import DCAT, DCTERMS, RDF
+
+import breg_harvester.browser
+import breg_harvester.jobs_queue
+import breg_harvester.store
+from breg_harvester.facets import FilterKeys
+
+EX = Namespace("http://example.org/")
+
+
+def _sparql_available():
+    # The SPARQL parser of rdflib 5 is not compatible with pyparsing 3
+
+    try:
+        Graph().query("SELECT ?s WHERE { ?s ?p ?o }")
+        return True
+    except Exception:
+        return False
+
+
+requires_sparql = pytest.mark.skipif(
+    not _sparql_available(),
+    reason="rdflib SPARQL engine not available")
+
+
+def _add_dataset(graph, catalog, dataset, theme, complete=True):
+    distribution = EX[f"{dataset.split('/')[-1]}-distribution"]
+
+    triples = [
+        (catalog, RDF.type, DCAT.Catalog),
+        (catalog, DCAT.dataset, dataset),
+        (catalog, DCAT.themeTaxonomy, EX.taxonomy),
+        (catalog, DCTERMS.LinguisticSystem, EX.en),
+        (catalog, DCTERMS.publisher, EX.publisher),
+        (catalog, DCTERMS.spatial, EX.es),
+        (EX.publisher, DCTERMS.type, EX.publisherType),
+        (dataset, RDF.type, DCAT.Dataset),
+        (dataset, DCAT.theme, theme)
+    ]
+
+    if complete:
+        triples += [
+            (dataset, DCTERMS.title, Literal("Title")),
+            (dataset, DCTERMS.description, Literal("Description")),
+            (dataset, DCTERMS.identifier, Literal("Identifier")),
+            (dataset, DCTERMS.spatial, EX.es),
+            (dataset, DCAT.distribution, distribution),
+            (distribution, DCAT.accessURL, EX.url),
+            (distribution, DCAT.mediaType, EX.csv)
+        ]
+
+    for triple in triples:
+        graph.add(triple)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    graph = Graph()
+    _add_dataset(graph, EX.c1, EX.d1, EX.t1)
+    _add_dataset(graph, EX.c1, EX.d2, EX.t2)
+    _add_dataset(graph, EX.c2, EX.d3, EX.t1)
+    _add_dataset(graph, EX.c2, EX.d4, EX.t1, complete=False)
+
+    server = fakeredis.FakeServer()
+
+    monkeypatch.setattr(
+        breg_harvester.jobs_queue, "_get_connection_pool",
+        lambda url: fakeredis.FakeStrictRedis(server=server).connection_pool)
+
+    monkeypatch.setattr(breg_harvester.store, "get_read_graph", lambda *args, **kwargs: graph)
+
+    app = flask.Flask(__name__)
+    app.config["REDIS_URL"] = "redis://localhost"
+    app.register_blueprint(breg_harvester.browser.blueprint, url_prefix="/api/browser")
+
+    return app.test_client()
+
+
+def _search(client, **kwargs):
+    res = client.post("/api/browser/dataset/search", json=kwargs)
+    assert res.status_code == 200
+    return res.get_json()
+
+
+@requires_sparql
+def test_search_without_index_pages(client):
+    first = _search(client, limit=2)
+
+    assert first["order"] == [EX.d1.n3(), EX.d2.n3()]
+    assert first["total"] == 3
+    assert first["counts"][FilterKeys.THEME.value] == {EX.t1.n3(): 2, EX.t2.n3(): 1}
+
+    second = _search(client, limit=2, cursor=first["cursor"])
+
+    assert second["order"] == [EX.d3.n3()]
+    assert second["total"] == 3
+    assert second["cursor"] is None
+
+
+@requires_sparql
+def test_search_without_index_filters(client):
+    res = _search(client, filters={FilterKeys.CATALOG.value: [EX.c2.n3()]})
+
+    assert res["order"] == [EX.d3.n3()]
+    assert res["total"] == len(res["datasets"]) == 1
+
+
+def test_search_page_query_limit():
+    query = breg_harvester.browser._search_page_query("", limit=10, after='http://example.org/"')
+
+    assert "LIMIT 11" in query
+    assert '"http://example.org/\\""' in query
@@ -0,0 +1,210 @@
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import FOAF
+
+import breg_harvester.delta
+import breg_harvester.harvest
+from breg_harvester.fetch import FetchResult
+from breg_harvester.models import DataTypes, SourceDataset
+
+_GRAPH_URI = "http://example.org/graph"
+_URI_A = "http://example.org/a"
+_URI_B = "http://example.org/b"
+
+_DOC_TEMPLATE = """
+@prefix dct: <http://purl.org/dc/terms/> .
+@prefix foaf: <http://xmlns.com/foaf/0.1/> .
+
+<{catalog}> dct:publisher [ foaf:name "{name}" ] .
+"""
+
+_DOC_V1 = """
+<http://example.org/d1> <http://purl.org/dc/terms/title> "One" .
+<http://example.org/d2> <http://purl.org/dc/terms/title> "Two" .
+"""
+
+_DOC_V2 = """
+<http://example.org/d1> <http://purl.org/dc/terms/title> "One" .
+<http://example.org/d3> <http://purl.org/dc/terms/title> "Three" .
+"""
+
+
+def _parse(catalog, name):
+    data = _DOC_TEMPLATE.format(catalog=catalog, name=name)
+    return Graph().parse(data=data, format="turtle")
+
+
+def _fetch_res(source, content_hash, not_modified=False, etag=None):
+    return FetchResult(
+        source=source,
+        spool=None,
+        not_modified=not_modified,
+        etag=etag,
+        last_modified=None,
+        content_hash=content_hash)
+
+
+def _source_result(source, data, content_hash):
+    graph = Graph().parse(data=data, format="nt") if data is not None else None
+
+    return breg_harvester.harvest.SourceResult(
+        source=source,
+        fetch_res=_fetch_res(source, content_hash),
+        changed=graph is not None,
+        valid=True,
+        graph=graph,
+        streamed=False,
+        durations={})
+
+
+def _harvest(redis_client, source, data, content_hash):
+    """Runs the delta stage of a harvest for a single source and saves its state."""
+
+    item = _source_result(source, data, content_hash)
+    state = breg_harvester.delta.get_source_state(redis_client, _GRAPH_URI, source.uri)
+    state.update(breg_harvester.harvest._fetch_state(item.fetch_res))
+
+    added, removed, lines, report = breg_harvester.harvest._source_delta(
+        redis_client, graph_uri=_GRAPH_URI, item=item, state=state)
+
+    breg_harvester.delta.save_source_state(
+        redis_client, graph_uri=_GRAPH_URI, uri=source.uri, state=state, lines=lines)
+
+    return added, removed, report
+
+
+def test_canonical_lines_stable():
+    graph_a = _parse("http://example.org/catalog", "Org A")
+    graph_b = _parse("http://example.org/catalog", "Org A")
+
+    lines_a = breg_harvester.delta.canonical_lines(graph_a, scope=_URI_A)
+    lines_b = breg_harvester.delta.canonical_lines(graph_b, scope=_URI_A)
+
+    assert lines_a == lines_b
+    assert all("_:" not in line for line in lines_a)
+
+
+def test_canonical_lines_blank_nodes_scoped_by_source():
+    graph_a = _parse("http://example.org/catalog-a", "Org A")
+    graph_b = _parse("http://example.org/catalog-b", "Org B")
+
+    lines_a = breg_harvester.delta.canonical_lines(graph_a, scope=_URI_A)
+    lines_b = breg_harvester.delta.canonical_lines(graph_b, scope=_URI_B)
+
+    merged = breg_harvester.delta.lines_to_graph(lines_a | lines_b)
+    publishers = set(merged.subjects(FOAF.name, None))
+
+    assert len(publishers) == 2
+
+    for publisher in publishers:
+        assert isinstance(publisher, URIRef)
+        assert len(list(merged.objects(publisher, FOAF.name))) == 1
+
+    names = set(merged.objects(None, FOAF.name))
+    assert names == {Literal("Org A"), Literal("Org B")}
+
+
+def test_new_source(redis_client):
+    source = SourceDataset(_URI_A, DataTypes.TRIPLES)
+    added, removed, report = _harvest(redis_client, source, _DOC_V1, "h1")
+
+    assert len(added) == 2
+    assert removed == set()
+    assert report == {"status": "new", "added": 2, "removed": 0}
+
+    state = breg_harvester.delta.get_source_state(redis_client, _GRAPH_URI, _URI_A)
+    assert state["content_hash"] == "h1"
+    assert breg_harvester.delta.get_snapshot(redis_client, _GRAPH_URI, _URI_A) == added
+
+
+def test_unchanged_source_not_modified(redis_client):
+    source = SourceDataset(_URI_A, DataTypes.TRIPLES)
+    _harvest(redis_client, source, _DOC_V1, "h1")
+    state = breg_harvester.delta.get_source_state(redis_client, _GRAPH_URI, _URI_A)
+
+    not_modified = _fetch_res(source, content_hash=None, not_modified=True)
+    same_content = _fetch_res(source, content_hash="h1")
+    other_content = _fetch_res(source, content_hash="h2")
+
+    assert breg_harvester.harvest._is_unchanged(not_modified, state)
+    assert breg_harvester.harvest._is_unchanged(same_content, state)
+    assert not breg_harvester.harvest._is_unchanged(other_content, state)
+    assert not breg_harvester.harvest._is_unchanged(same_content, {})
+
+    added, removed, report = _harvest(redis_client, source, None, "h1")
+
+    assert (added, removed) == (set(), set())
+    assert report == {"status": "unchanged"}
+    assert len(breg_harvester.delta.get_snapshot(redis_client, _GRAPH_URI, _URI_A)) == 2
+
+
+def test_same_graph_different_content(redis_client):
+    source = SourceDataset(_URI_A, DataTypes.TRIPLES)
+    _harvest(redis_client, source, _DOC_V1, "h1")
+
+    reordered = "\n".join(reversed(_DOC_V1.strip().splitlines()))
+    added, removed, report = _harvest(redis_client, source, reordered, "h2")
+
+    assert (added, removed) == (set(), set())
+    assert report == {"status": "unchanged"}
+    assert len(breg_harvester.delta.get_snapshot(redis_client, _GRAPH_URI, _URI_A)) == 2
+
+
+def test_changed_source(redis_client):
+    source = SourceDataset(_URI_A, DataTypes.TRIPLES)
+    _harvest(redis_client, source, _DOC_V1, "h1")
+    added, removed, report = _harvest(redis_client, source, _DOC_V2, "h2")
+
+    assert added == {'<http://example.org/d3> <http://purl.org/dc/terms/title> "Three" .'}
+    assert removed == {'<http://example.org/d2> <http://purl.org/dc/terms/title> "Two" .'}
+    assert report == {"status": "changed", "added": 1, "removed": 1}
+
+    snapshot = breg_harvester.delta.get_snapshot(redis_client, _GRAPH_URI, _URI_A)
+    assert snapshot == breg_harvester.delta.canonical_lines(
+        Graph().parse(data=_DOC_V2, format="nt"), scope=_URI_A)
+
+
+def test_removed_source(redis_client):
+    source_a = SourceDataset(_URI_A, DataTypes.TRIPLES)
+    source_b = SourceDataset(_URI_B, DataTypes.TRIPLES)
+    _harvest(redis_client, source_a, _DOC_V1, "h1")
+    _harvest(redis_client, source_b, _DOC_V2, "h2")
+
+    removed, report = breg_harvester.harvest._stale_sources_delta(
+        redis_client, graph_uri=_GRAPH_URI, sources=[source_a])
+
+    assert len(removed) == 2
+    assert report == {_URI_B: {"status": "removed", "removed": 2}}
+
+    # Triples that are still provided by another source are kept
+
+    keys = [breg_harvester.delta.snapshot_key(_GRAPH_URI, _URI_A)]
+    kept = breg_harvester.delta.filter_shared_lines(redis_client, lines=removed, keys=keys)
+    assert kept == {'<http://example.org/d3> <http://purl.org/dc/terms/title> "Three" .'}
+
+    breg_harvester.harvest._remove_stale_states(
+        redis_client, graph_uri=_GRAPH_URI, sources=[source_a])
+
+    assert breg_harvester.delta.get_known_sources(redis_client, _GRAPH_URI) == {_URI_A}
+    assert not breg_harvester.delta.has_snapshot(redis_client, _GRAPH_URI, _URI_B)
+
+
+def test_commit_pending_namespace(redis_client):
+    namespace = breg_harvester.delta.pending_namespace(_GRAPH_URI, "job")
+    lines = {'<http://example.org/d1> <http://purl.org/dc/terms/title> "One" .'}
+
+    breg_harvester.delta.save_source_state(
+        redis_client, graph_uri=namespace, uri=_URI_A,
+        state={"content_hash": "h1"}, lines=lines)
+
+    breg_harvester.delta.add_removed_lines(redis_client, namespace, {"<x> <y> <z> ."})
+
+    breg_harvester.delta.commit_source_state(
+        redis_client, namespace=namespace, graph_uri=_GRAPH_URI, uri=_URI_A)
+
+    breg_harvester.delta.clear_namespace(redis_client, namespace)
+
+    assert breg_harvester.delta.get_snapshot(redis_client, _GRAPH_URI, _URI_A) == lines
+    assert breg_harvester.delta.get_source_state(
+        redis_client, _GRAPH_URI, _URI_A)["content_hash"] == "h1"
+    assert breg_harvester.delta.get_removed_lines(redis_client, namespace) == set()
+    assert redis_client.keys(f"*{breg_harvester.delta._digest(namespace)}*") == []
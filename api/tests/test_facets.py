@@ -0,0 +1,120 @@
+import pytest
+
+import breg_harvester.facets
+import breg_harvester.harvest
+from breg_harvester.facets import FilterKeys
+
+_D1 = "<http://example.org/d1>"
+_D2 = "<http://example.org/d2>"
+_D3 = "<http://example.org/d3>"
+
+
+def _search(redis_client, filters=None, **kwargs):
+    index_id = breg_harvester.facets.get_current_index(redis_client)
+
+    return breg_harvester.facets.search_facet_index(
+        redis_client, index_id, filters=filters or {}, **kwargs)
+
+
+def test_build_facet_index(redis_client, facet_index):
+    assert facet_index["num_datasets"] == 3
+    assert facet_index["num_values"][FilterKeys.THEME.value] == 2
+    assert breg_harvester.facets.get_current_index(redis_client) == facet_index["index_id"]
+
+
+def test_build_facet_index_skips_incomplete_datasets(redis_client, facet_index):
+    res = _search(redis_client, filters={
+        FilterKeys.CATALOG.value: ["<http://example.org/c2>"]
+    })
+
+    assert res["order"] == [_D3]
+    assert res["total"] == len(res["datasets"]) == 1
+    assert res["counts"][FilterKeys.LANGUAGE.value] == {"<http://example.org/en>": 1}
+
+
+def test_rebuild_replaces_previous_index(redis_client, fake_store, facet_index):
+    rebuilt = breg_harvester.facets.build_facet_index(
+        redis_client, store_kwargs={}, graph_uri="http://example.org/graph")
+
+    assert breg_harvester.facets.get_current_index(redis_client) == rebuilt["index_id"]
+    assert not list(redis_client.scan_iter(match=f"*{facet_index['index_id']}*"))
+
+
+def test_search_without_filters(redis_client, facet_index):
+    res = _search(redis_client)
+
+    assert res["order"] == [_D1, _D2, _D3]
+    assert res["total"] == 3
+    assert res["cursor"] is None
+    assert res["counts"][FilterKeys.THEME.value] == {
+        "<http://example.org/t1>": 2,
+        "<http://example.org/t2>": 1
+    }
+
+
+def test_search_filters(redis_client, facet_index):
+    # Values of the same facet are combined with OR
+
+    res = _search(redis_client, filters={
+        FilterKeys.THEME.value: ["<http://example.org/t1>", "<http://example.org/t2>"]
+    })
+
+    assert res["order"] == [_D1, _D2, _D3]
+
+    # Facets are combined with AND
+
+    res = _search(redis_client, filters={
+        FilterKeys.THEME.value: ["<http://example.org/t1>"],
+        FilterKeys.LANGUAGE.value: ["<http://example.org/es>"]
+    })
+
+    assert res["order"] == [_D1]
+    assert res["total"] == 1
+    assert res["counts"][FilterKeys.CATALOG.value] == {"<http://example.org/c1>": 1}
+    assert not list(redis_client.scan_iter(match="breg:harvester:facets:tmp:*"))
+
+
+def test_search_pages(redis_client, facet_index):
+    first = _search(redis_client, limit=2)
+
+    assert first["order"] == [_D1, _D2]
+    assert first["total"] == 3
+    assert first["cursor"]
+
+    second = _search(redis_client, limit=2, cursor=first["cursor"])
+
+    assert second["order"] == [_D3]
+    assert second["cursor"] is None
+
+
+@pytest.mark.parametrize("limit", [0, -1, 2.5, "2", True])
+def test_paginate_invalid_limit(limit):
+    with pytest.raises(ValueError):
+        breg_harvester.facets.paginate([_D1, _D2], limit=limit)
+
+
+@pytest.mark.parametrize("cursor", ["abc", "e30=", "WzFd"])
+def test_paginate_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        breg_harvester.facets.paginate([_D1, _D2], limit=1, cursor=cursor)
+
+
+def test_clear_facet_index(redis_client, facet_index):
+    assert breg_harvester.facets.clear_facet_index(redis_client) == facet_index["index_id"]
+    assert breg_harvester.facets.get_current_index(redis_client) is None
+    assert not redis_client.keys("breg:harvester:facets:*")
+
+
+def test_failed_build_clears_stale_index(redis_client, monkeypatch, facet_index):
+    def query_facets(graph):
+        raise IOError("Store unavailable")
+
+    monkeypatch.setattr(breg_harvester.facets, "_query_facets", query_facets)
+    monkeypatch.setattr(breg_harvester.harvest.redis, "from_url", lambda url: redis_client)
+
+    res = breg_harvester.harvest._build_facet_index(
+        "redis://localhost", store_kwargs={}, graph_uri="http://example.org/graph")
+
+    assert "error" in res
+    assert breg_harvester.facets.get_current_index(redis_client) is None
+    assert not redis_client.keys("breg:harvester:facets:*")
@@ -0,0 +1,76 @@
+import pytest
+from rdflib import Literal
+
+import breg_harvester.facets
+import breg_harvester.fulltext
+
+_D1 = "<http://example.org/d1>"
+_D2 = "<http://example.org/d2>"
+_D3 = "<http://example.org/d3>"
+
+
+def _search(redis_client, query, lang=None, **kwargs):
+    index_id = breg_harvester.facets.get_current_index(redis_client)
+
+    return breg_harvester.facets.search_facet_index(
+        redis_client, index_id, filters={}, query=query, lang=lang, **kwargs)
+
+
+def test_tokenize_folds_case_and_diacritics():
+    assert breg_harvester.fulltext.tokenize("Registro de Empresas Públicas", lang="es") == [
+        "registro", "empresas", "publicas"
+    ]
+
+
+def test_tokenize_stop_words_by_language():
+    # "die" is only a stop word in German and Dutch
+
+    assert breg_harvester.fulltext.tokenize("die the", lang="en") == ["die"]
+    assert breg_harvester.fulltext.tokenize("die the", lang="de-AT") == ["the"]
+    assert breg_harvester.fulltext.tokenize("die the") == []
+    assert breg_harvester.fulltext.tokenize("a b c") == []
+
+
+def test_score_document_weights():
+    scores = breg_harvester.fulltext.score_document({
+        "title": [Literal("Business register", lang="en")],
+        "description": [Literal("Register of the business entities", lang="en")],
+        "identifier": ["BR-1"]
+    })
+
+    assert scores["business"] == 4.0
+    assert scores["register"] == 4.0
+    assert scores["entities"] == 1.0
+    assert scores["br"] == 2.0
+    assert "the" not in scores
+
+
+def test_search_ranks_matches(redis_client, facet_index):
+    res = _search(redis_client, "business")
+
+    # Title matches rank higher than description matches
+
+    assert res["order"] == [_D1, _D2]
+    assert res["total"] == 2
+    assert res["scores"][_D1] > res["scores"][_D2]
+
+
+def test_search_requires_all_keywords(redis_client, facet_index):
+    assert _search(redis_client, "business companies")["order"] == [_D1]
+    assert _search(redis_client, "business unknown")["order"] == []
+
+
+def test_search_ranked_pages(redis_client, facet_index):
+    first = _search(redis_client, "companies", limit=1)
+    second = _search(redis_client, "companies", limit=1, cursor=first["cursor"])
+
+    assert first["order"] + second["order"] == [_D1, _D3]
+    assert second["cursor"] is None
+
+
+@pytest.mark.parametrize("query", [None, "", "the of", "a"])
+def test_search_without_keywords(redis_client, facet_index, query):
+    res = _search(redis_client, query, lang="en")
+
+    assert res["order"] == [_D1, _D2, _D3]
+    assert "scores" not in res
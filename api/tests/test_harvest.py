@@ -0,0 +1,129 @@
+import json
+
+import pytest
+from rdflib import Graph
+from rq.job import JobStatus
+
+import breg_harvester.cache
+import breg_harvester.harvest
+from breg_harvester.fetch import FetchResult
+from breg_harvester.models import DataTypes, SourceDataset
+from breg_harvester.progress import ProgressReporter
+
+_GRAPH_URI = "http://example.org/graph"
+
+_DOC = """
+<http://example.org/d1> <http://purl.org/dc/terms/title> "One" .
+<http://example.org/d2> <http://purl.org/dc/terms/title> "Two" .
+"""
+
+
+class FailingLoader:
+    def __init__(self):
+        self.graph_uris = []
+
+    def load(self, triples, graph_uri, store_kwargs, progress=None):
+        self.graph_uris.append(graph_uri)
+        raise IOError("Store unavailable")
+
+
+@pytest.fixture
+def harvest(redis_client, monkeypatch):
+    source = SourceDataset("http://example.org/source", DataTypes.XML)
+
+    def process_sources(sources, **kwargs):
+        return [breg_harvester.harvest.SourceResult(
+            source=source,
+            fetch_res=FetchResult(
+                source=source,
+                spool=None,
+                not_modified=False,
+                etag=None,
+                last_modified=None,
+                content_hash="hash"),
+            changed=True,
+            valid=True,
+            graph=Graph().parse(data=_DOC, format="nt"),
+            streamed=False,
+            durations={})]
+
+    monkeypatch.setattr(breg_harvester.harvest, "_process_sources", process_sources)
+    monkeypatch.setattr(breg_harvester.harvest, "_drop_staging_graph", lambda **kwargs: None)
+    monkeypatch.setattr(breg_harvester.harvest.redis, "from_url", lambda url: redis_client)
+
+    def run(loader, staging):
+        with pytest.raises(IOError):
+            breg_harvester.harvest._run_harvest_stages(
+                [source],
+                store_kwargs={},
+                validator=None,
+                graph_uri=_GRAPH_URI,
+                loader=loader,
+                staging=staging,
+                delta=False,
+                redis_url="redis://localhost",
+                concurrency=1,
+                source_timeout=None,
+                reporter=ProgressReporter())
+
+    return run
+
+
+def _graph_version(redis_client):
+    return int(redis_client.get(breg_harvester.cache._KEY_GRAPH_VERSION) or 0)
+
+
+def test_failed_load_into_live_graph_bumps_version(redis_client, harvest):
+    loader = FailingLoader()
+    harvest(loader, staging=False)
+
+    assert loader.graph_uris == [_GRAPH_URI]
+    assert _graph_version(redis_client) == 1
+
+
+def test_failed_load_into_staging_graph_keeps_version(redis_client, harvest):
+    loader = FailingLoader()
+    harvest(loader, staging=True)
+
+    assert loader.graph_uris != [_GRAPH_URI]
+    assert _graph_version(redis_client) == 0
+
+
+@pytest.mark.parametrize("staging,loaded,expected", [
+    (False, True, 1),
+    (False, False, 0),
+    (True, True, 0)
+])
+def test_failed_fanout_bumps_version(redis_client, monkeypatch, staging, loaded, expected):
+    class Job:
+        id = "parent"
+
+    sources = [
+        SourceDataset("http://example.org/a", DataTypes.XML),
+        SourceDataset("http://example.org/b", DataTypes.XML)
+    ]
+
+    redis_client.hset(
+        breg_harvester.harvest._fanout_key(Job.id, "results"),
+        sources[0].uri,
+        json.dumps({
+            "status": JobStatus.FINISHED,
+            "load": {"num_triples": 2} if loaded else None
+        }))
+
+    monkeypatch.setattr(breg_harvester.harvest, "get_current_job", lambda: Job)
+    monkeypatch.setattr(breg_harvester.harvest, "_drop_staging_graph", lambda **kwargs: None)
+    monkeypatch.setattr(breg_harvester.harvest.redis, "from_url", lambda url: redis_client)
+
+    with pytest.raises(ValueError):
+        breg_harvester.harvest.finalize_harvest(
+            sources,
+            store_kwargs={},
+            loader=FailingLoader(),
+            graph_uri=_GRAPH_URI,
+            load_uri=_GRAPH_URI + "-staging" if staging else _GRAPH_URI,
+            staging=staging,
+            delta=False,
+            redis_url="redis://localhost")
+
+    assert _graph_version(redis_client) == expected
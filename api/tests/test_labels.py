@@ -0,0 +1,85 @@
+import time
+
+from rdflib import URIRef
+
+import breg_harvester.labels
+from breg_harvester.labels import LabelIndex
+
+_TERM = URIRef("http://example.org/term")
+
+
+def _labels(name):
+    return {"_": "", f"en|{breg_harvester.labels.SKOS.prefLabel}": name}
+
+
+def test_save_and_get(redis_client):
+    index = LabelIndex(redis_client)
+    index.save(_TERM, _labels("Term"))
+
+    assert index.get([_TERM, URIRef("http://example.org/other")]) == {_TERM: _labels("Term")}
+
+    stats = index.stats()
+    assert (stats["terms"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_budget_evicts_least_recently_used(redis_client):
+    index = LabelIndex(redis_client, max_terms=2)
+    terms = [URIRef(f"http://example.org/t{idx}") for idx in range(3)]
+
+    for term in terms[:2]:
+        index.save(term, _labels(str(term)))
+
+    index.get([terms[0]])
+    index.save(terms[2], _labels(str(terms[2])))
+
+    assert set(index.get(terms)) == {terms[0], terms[2]}
+    assert index.stats()["evictions"] == 1
+
+
+def test_pinned_terms_exempt_from_budget(redis_client):
+    index = LabelIndex(redis_client, max_terms=1)
+    pinned = {URIRef(f"http://example.org/p{idx}"): _labels("Pinned") for idx in range(3)}
+    index.save_many(pinned, pinned=True)
+    index.save(_TERM, _labels("Term"))
+
+    assert len(index.get(list(pinned) + [_TERM])) == 4
+    assert index.stats()["pinned"] == 3
+
+
+def test_prune_expired(redis_client):
+    index = LabelIndex(redis_client, ttl=1)
+    index.save(_TERM, _labels("Term"))
+    redis_client.zadd(breg_harvester.labels._KEY_EXPIRES, {_TERM.n3(): time.time() - 1})
+
+    assert index.prune_expired() == 1
+    assert redis_client.hlen(breg_harvester.labels._KEY_SIZES) == 0
+    assert redis_client.zcard(breg_harvester.labels._KEY_LRU) == 0
+
+
+def test_flag_failed_backs_off(redis_client):
+    index = LabelIndex(redis_client, negative_ttl=10)
+    failed_key = breg_harvester.labels._KEY_FAILED
+
+    index.flag_failed(_TERM)
+    first = redis_client.zscore(failed_key, _TERM.n3()) - time.time()
+    index.flag_failed(_TERM)
+    second = redis_client.zscore(failed_key, _TERM.n3()) - time.time()
+
+    assert 9 < first <= 10
+    assert 19 < second <= 20
+    assert index.get_failed([_TERM]) == {_TERM}
+
+
+def test_failed_attempts_expire(redis_client):
+    index = LabelIndex(redis_client, negative_ttl=10)
+    index.flag_failed(_TERM)
+
+    attempts_key = breg_harvester.labels._attempts_key(_TERM.n3())
+    ttl = redis_client.ttl(attempts_key)
+
+    assert 0 < ttl <= 10 + breg_harvester.labels.MAX_NEGATIVE_TTL
+
+    index.save(_TERM, _labels("Term"))
+
+    assert not redis_client.exists(attempts_key)
+    assert index.get_failed([_TERM]) == set()
@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import breg_harvester.parsers
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+@pytest.fixture
+def parser_pool():
+    breg_harvester.parsers.init_parser_pool({"PARSER_WORKERS": 2})
+    yield
+    breg_harvester.parsers.init_parser_pool({})
+
+
+def test_parse_labels(parser_pool):
+    data = '<http://example.org/t> <http://www.w3.org/2004/02/skos/core#prefLabel> "Term"@en .'
+
+    labels = breg_harvester.parsers.run_parser(
+        breg_harvester.parsers.parse_labels,
+        data, "nt", "http://example.org/t", "http://example.org/t")
+
+    assert labels["en|http://www.w3.org/2004/02/skos/core#prefLabel"] == "Term"
+
+
+def test_timeout_does_not_break_other_parses(parser_pool):
+    res = {}
+
+    def run(name, seconds, deadline):
+        try:
+            res[name] = breg_harvester.parsers.run_parser(_sleep, seconds, deadline=deadline)
+        except Exception as ex:
+            res[name] = ex
+
+    stuck = threading.Thread(target=run, args=("stuck", 30, 0.5))
+    other = threading.Thread(target=run, args=("other", 2, 10))
+    stuck.start()
+    time.sleep(0.2)
+    other.start()
+    stuck.join()
+
+    # New parses go to a new pool while the retired one drains
+
+    assert isinstance(res["stuck"], TimeoutError)
+    assert breg_harvester.parsers.run_parser(_sleep, 0, deadline=10) != os.getpid()
+
+    other.join()
+
+    assert isinstance(res["other"], int)
+
+
+def test_pool_disabled_without_workers():
+    breg_harvester.parsers.init_parser_pool({"PARSER_WORKERS": 0})
+
+    try:
+        assert breg_harvester.parsers.run_parser(_sleep, 0) == os.getpid()
+    finally:
+        breg_harvester.parsers.init_parser_pool({})
+
+
+def test_pool_disabled_under_green_threads(parser_pool, monkeypatch):
+    class Patcher:
+        @staticmethod
+        def is_monkey_patched(module):
+            return module == "thread"
+
+    monkeypatch.setitem(sys.modules, "eventlet.patcher", Patcher)
+
+    assert not breg_harvester.parsers.is_pool_enabled()
+    assert breg_harvester.parsers.run_parser(_sleep, 0) == os.getpid()
@@ -0,0 +1,80 @@
+import base64
+import json
+import os
+import tempfile
+
+import pytest
+import requests
+
+from breg_harvester.models import DataTypes, SourceDataset
+from breg_harvester.validator import Base64JSONBody, BRegAPIValidator
+
+
+@pytest.fixture
+def spool():
+    with tempfile.TemporaryFile() as fh:
+        fh.write(os.urandom(Base64JSONBody.CHUNK_SIZE * 2 + 7))
+        fh.seek(0)
+        yield fh
+
+
+def _read_all(body, size):
+    chunks = []
+
+    while True:
+        chunk = body.read(size)
+
+        if not chunk:
+            return b"".join(chunks)
+
+        assert len(chunk) <= size
+        chunks.append(chunk)
+
+
+@pytest.mark.parametrize("size", [1000, Base64JSONBody.CHUNK_SIZE, 10 ** 7, -1])
+def test_base64_body(spool, size):
+    contents = spool.read()
+    spool.seek(0)
+    body = Base64JSONBody({"a": 1, "b": None}, field="b", spool=spool)
+    data = _read_all(body, size) if size > 0 else body.read(size)
+
+    assert len(data) == len(body)
+    assert json.loads(data) == {"a": 1, "b": base64.b64encode(contents).decode("ascii")}
+    assert spool.tell() == 0
+
+
+def test_base64_body_empty_spool():
+    with tempfile.TemporaryFile() as fh:
+        body = Base64JSONBody({"b": None}, field="b", spool=fh)
+        data = body.read()
+
+    assert len(data) == len(body)
+    assert json.loads(data) == {"b": ""}
+
+
+def test_validation_request_streams_spool(spool, monkeypatch):
+    sent = {}
+
+    class Session:
+        def post(self, url, data=None, json=None, headers=None):
+            request = requests.Request("POST", url, data=data, json=json, headers=headers)
+            prepared = request.prepare()
+            sent["headers"] = prepared.headers
+            sent["body"] = prepared.body.read()
+
+            raise IOError("Stop")
+
+    monkeypatch.setattr(
+        "breg_harvester.sessions.get_session", lambda name: Session())
+
+    source = SourceDataset("http://example.org/source", DataTypes.TRIPLES)
+
+    with pytest.raises(Exception):
+        BRegAPIValidator().validate_summary(source, spool=spool)
+
+    body = json.loads(sent["body"])
+
+    assert sent["headers"]["Content-Length"] == str(len(sent["body"]))
+    assert "Transfer-Encoding" not in sent["headers"]
+    assert body["embeddingMethod"] == "BASE64"
+    assert base64.b64decode(body["contentToValidate"]) == spool.read()
@@ -298,7 +298,7 @@ export const BrowserSection = () => {
       .value();
 
     searchDatasets({ filters })
-      .then((datasets) => {
+      .then(({ datasets }) => {
         setDatasets(datasets);
         setDatasetFacets(_.cloneDeep(selectedFacets));
       })
@@ -1,10 +1,16 @@
 import _ from "lodash";
 import moment from "moment";
-import React, { useMemo, useState } from "react";
+import React, { useEffect, useMemo, useState } from "react";
 import Badge from "react-bootstrap/Badge";
 import Button from "react-bootstrap/Button";
 import Card from "react-bootstrap/Card";
 import Modal from "react-bootstrap/Modal";
+import { subscribeJobProgress } from "./api";
+
+// Jobs that may still report progress: the final job of a fan-out
+// harvest is deferred (and then queued) while its source jobs run
+
+const ACTIVE_STATUSES = ["started", "deferred", "queued"];
 
 function getBadgeVariant(status) {
   const variantMap = {
@@ -15,9 +21,49 @@ function getBadgeVariant(status) {
   return variantMap[_.toLower(status)] || "info";
 }
 
+const JobProgress = ({ progress }) => {
+  return (
+    <Card bg="light" className="mt-2">
+      <Card.Body>
+        <p>
+          <span className="mr-1">Current phase:</span>
+          <strong>{_.capitalize(progress.phase)}</strong>
+          {!_.isNil(progress.triples_loaded) && (
+            <span className="ml-2 text-muted">
+              ({progress.triples_loaded} triples loaded)
+            </span>
+          )}
+        </p>
+        <ul className="mb-0">
+          {_.map(progress.sources, (item, uri) => (
+            <li key={uri}>
+              <small>
+                <code>{uri}</code>: {_.capitalize(item.phase)}
+                {!_.isNil(item.bytes) && ` · ${item.bytes} bytes`}
+                {!_.isNil(item.triples_parsed) &&
+                  ` · ${item.triples_parsed} triples`}
+              </small>
+            </li>
+          ))}
+        </ul>
+      </Card.Body>
+    </Card>
+  );
+};
+
 const JobModal = ({ job, show, onClose }) => {
   const numTriples = _.get(job, "result.num_triples", undefined);
   const excInfo = _.get(job, "exc_info", undefined);
+  const [progress, setProgress] = useState(undefined);
+  const isActive = _.includes(ACTIVE_STATUSES, _.toLower(job.status));
+
+  useEffect(() => {
+    if (!show || !isActive) {
+      return;
+    }
+
+    return subscribeJobProgress(job.job_id, { onProgress: setProgress });
+  }, [show, isActive, job.job_id]);
 
   const handleClose = useMemo(() => {
     return () => {
@@ -65,6 +111,9 @@ const JobModal = ({ job, show, onClose }) => {
             <dd className="col-lg-8">{_.capitalize(job.status)}</dd>
           )}
         </dl>
+        {isActive && !_.isNil(progress) && !_.isNil(progress.phase) && (
+          <JobProgress progress={progress} />
+        )}
         {!_.isNil(numTriples) && (
           <Card bg="success" text="white" className="mt-2">
             <Card.Body>
@@ -21,6 +21,21 @@ export async function fetchJobs(
     .value();
 }
 
+export function subscribeJobProgress(jobId, { onProgress, onEnd } = {}) {
+  const source = new EventSource(`/api/harvest/${jobId}/events`);
+
+  source.addEventListener("progress", (ev) => {
+    if (onProgress) onProgress(JSON.parse(ev.data));
+  });
+
+  source.addEventListener("end", (ev) => {
+    source.close();
+    if (onEnd) onEnd(JSON.parse(ev.data));
+  });
+
+  return () => source.close();
+}
+
 export async function fetchSources() {
   const response = await axios.get("/api/harvest/source");
   return response.data;
@@ -69,10 +84,13 @@ export async function fetchFacets() {
     .value();
 }
 
-export async function searchDatasets({ limit, filters } = { limit: 50 }) {
+export async function searchDatasets(
+  { limit, filters, cursor } = { limit: 50 }
+) {
   const response = await axios.post("/api/browser/dataset/search", {
     limit,
     filters: filters || {},
+    cursor,
   });
 
   return response.data;